@@ -1,304 +1,575 @@
 import streamlit as st
-from openai import AzureOpenAI
 import os
 from dotenv import load_dotenv
-import PyPDF2
-import docx
-import io
-import base64
-from typing import List, Dict, Any
-import json
-import requests
+from typing import List, Dict, Any, Optional, Tuple
 import time
+from background import BackgroundJob, BackgroundJobs
+from client import AzureO3ProClient, ResponseError
+from compare import REASONING_EFFORTS, Comparison, Variant, VariantRun, start_comparison
+from conversation import BYTES_PER_TOKEN, ConversationChain, estimate_tokens, message_bytes
+from conversation_store import DEFAULT_PATH as DEFAULT_CONVERSATION_DB, TOKEN_PATTERN, ConversationStore, new_token
+from executor import (PRIORITY_BULK, PRIORITY_COMPARE, PRIORITY_INTERACTIVE, RequestExecutor, RequestJob, UserQueue,
+                      create_completion, executor_from_env, stream_completion)
+from extractors import MIME_TYPES_BY_SUFFIX, mime_type_for
+from ingestion import Attachment, TextStore, text_store_from_env
+from prompt_budget import ATTACHMENT_SHARE, DEFAULT_INPUT_BUDGET, PromptAssembly, TokenCounter, assemble_messages
+from pricing import pricing_from_env
+from prompt_catalog import PRESET_PROMPTS
+from rate_limit import RETRYABLE_STATUSES
+from response_cache import response_cache_from_env
+from retrieval import DEFAULT_TOKEN_BUDGET, BM25Index, DocumentIndex, format_passages, select_passages
+from summarize import SummaryEstimate, Summarizer, summarizer_from_env
+from telemetry import metrics_server_from_env
 
 # Load environment variables
 load_dotenv()
 
-# Configure page
-st.set_page_config(
-    page_title="O3-Pro Azure Chat",
-    page_icon="🤖",
-    layout="wide",
-    initial_sidebar_state="expanded"
-)
+# Minimum seconds between re-renders of a streaming message
+STREAM_RENDER_INTERVAL = 0.1
 
-class AzureO3ProClient:
-    """Client for Azure OpenAI O3-Pro model"""
-    
-    def __init__(self):
-        self.endpoint = os.getenv("AZURE_OPENAI_ENDPOINT")
-        self.api_key = os.getenv("AZURE_OPENAI_API_KEY")
-        self.api_version = os.getenv("AZURE_OPENAI_API_VERSION", "2025-04-01-preview")
-        self.model = os.getenv("AZURE_OPENAI_MODEL")
-        
-        # Build the complete URL for O3-Pro responses endpoint
-        if self.endpoint and not self.endpoint.endswith('/'):
-            self.endpoint = self.endpoint + '/'
-        
-        self.api_url = f"{self.endpoint}openai/responses?api-version={self.api_version}"
-    
-    def create_chat_completion(self, messages: List[Dict], stream: bool = False):
-        """Create chat completion using Azure OpenAI O3-Pro responses endpoint"""
-        try:
-            headers = {
-                "Content-Type": "application/json",
-                "api-key": self.api_key
-            }
-            
-            # Convert messages to O3-Pro input format
-            input_text = self._convert_messages_to_input(messages)
-            
-            # O3-Pro specific payload format
-            payload = {
-                "model": self.model,
-                "input": input_text,
-                "stream": stream
-            }
-            
-            response = requests.post(
-                self.api_url,
-                headers=headers,
-                json=payload,
-                stream=stream,
-                timeout=60
-            )
-            
-            if response.status_code == 200:
-                if stream:
-                    return self._handle_streaming_response(response)
-                else:
-                    return response.json()
-            else:
-                st.error(f"API Error {response.status_code}: {response.text}")
-                return None
-                
-        except Exception as e:
-            st.error(f"Error calling Azure OpenAI: {str(e)}")
-            return None
-    
-    def _convert_messages_to_input(self, messages: List[Dict]) -> str:
-        """Convert chat messages to O3-Pro input format"""
-        input_parts = []
-        
-        for message in messages:
-            role = message.get("role", "")
-            content = message.get("content", "")
-            
-            if role == "system":
-                input_parts.append(f"System: {content}")
-            elif role == "user":
-                input_parts.append(f"User: {content}")
-            elif role == "assistant":
-                input_parts.append(f"Assistant: {content}")
-        
-        return "\n\n".join(input_parts)
-    
-    def _handle_streaming_response(self, response):
-        """Handle streaming response from O3-Pro"""
-        try:
-            for line in response.iter_lines():
-                if line:
-                    line = line.decode('utf-8')
-                    if line.startswith('data: '):
-                        data = line[6:]  # Remove 'data: ' prefix
-                        if data != '[DONE]':
-                            try:
-                                chunk = json.loads(data)
-                                yield chunk
-                            except json.JSONDecodeError:
-                                continue
-        except Exception as e:
-            st.error(f"Error processing streaming response: {str(e)}")
-    
-    def _extract_content_from_o3_response(self, response_data):
-        """Extract content from O3-Pro response format"""
-        try:
-            if 'output' in response_data:
-                for output_item in response_data['output']:
-                    if output_item.get('type') == 'message' and 'content' in output_item:
-                        for content_item in output_item['content']:
-                            if content_item.get('type') == 'output_text':
-                                return content_item.get('text', '')
-            return None
-        except Exception as e:
-            st.error(f"Error extracting content from response: {str(e)}")
-            return None
+# Seconds between status updates while a background response is running
+BACKGROUND_STATUS_INTERVAL = 1.0
 
-def extract_text_from_pdf(file) -> str:
-    """Extract text from PDF file"""
-    try:
-        pdf_reader = PyPDF2.PdfReader(file)
-        text = ""
-        for page in pdf_reader.pages:
-            text += page.extract_text()
-        return text
-    except Exception as e:
-        st.error(f"Error reading PDF: {str(e)}")
-        return ""
-
-def extract_text_from_docx(file) -> str:
-    """Extract text from DOCX file"""
-    try:
-        doc = docx.Document(file)
-        text = ""
-        for paragraph in doc.paragraphs:
-            text += paragraph.text + "\n"
-        return text
-    except Exception as e:
-        st.error(f"Error reading DOCX: {str(e)}")
-        return ""
-
-def extract_text_from_txt(file) -> str:
-    """Extract text from TXT file"""
-    try:
-        return str(file.read(), "utf-8")
-    except Exception as e:
-        st.error(f"Error reading TXT: {str(e)}")
-        return ""
+# Seconds between progress updates while large files are summarized
+SUMMARY_STATUS_INTERVAL = 0.5
+
+# Messages rendered at a time; earlier ones are loaded on request
+HISTORY_PAGE_SIZE = 20
+CONVERSATION_LIST_SIZE = 20
+SEARCH_RESULTS = 10
+# History loaded per turn, in bytes per token of input budget; generous so the
+# budget, not the load, decides which turns are summarized
+HISTORY_BYTES_PER_BUDGET_TOKEN = 2 * BYTES_PER_TOKEN
+# Attachment text read per file, in characters per token of input budget; the
+# budget still decides what is sent, this only bounds what is read from disk
+ATTACHMENT_CHARS_PER_BUDGET_TOKEN = 2 * BYTES_PER_TOKEN
+PREVIEW_CHARS = 1000
+MAX_TURN_METRICS = 200
+# Compare-mode preset that stands for the system prompt being edited
+CURRENT_PROMPT = "Current prompt"
+# Documents whose retrieval index is kept for reuse across sessions
+MAX_SHARED_INDEXES = 32
+
+@st.cache_resource
+def get_text_store() -> TextStore:
+    """On-disk store of extracted document text shared by every session in the process"""
+    return text_store_from_env()
 
-def process_uploaded_file(uploaded_file) -> str:
-    """Process uploaded file and extract text"""
+@st.cache_resource(max_entries=MAX_SHARED_INDEXES)
+def get_document_index(key: str) -> DocumentIndex:
+    """Retrieval index of one stored document, shared by every session that attaches it
+
+    Holds only postings and byte spans; passages are read back from the
+    text store when selected.
+    """
+    store = get_text_store()
+    return DocumentIndex(store.iter_chunks(key), lambda start, end: store.read_span(key, start, end))
+
+def process_uploaded_file(uploaded_file) -> Optional[Attachment]:
+    """Extract an uploaded file into the text store and return a reference to its text"""
     if uploaded_file is None:
-        return ""
+        return None
     
-    file_type = uploaded_file.type
-    
-    if file_type == "application/pdf":
-        return extract_text_from_pdf(uploaded_file)
-    elif file_type == "application/vnd.openxmlformats-officedocument.wordprocessingml.document":
-        return extract_text_from_docx(uploaded_file)
-    elif file_type == "text/plain":
-        return extract_text_from_txt(uploaded_file)
-    else:
-        st.warning(f"Unsupported file type: {file_type}")
-        return ""
+    # Reruns reuse the session's reference without re-reading the upload
+    known = st.session_state.attachments.get(uploaded_file.name)
+    if known and known.upload_id == uploaded_file.file_id and get_text_store().has(known.key):
+        return known
+    # The upload is read in place; extraction streams to disk and same bytes are never re-parsed
+    file_type = mime_type_for(uploaded_file.name, uploaded_file.type)
+    return get_text_store().ingest(uploaded_file, uploaded_file.name, file_type, report=st,
+                                   upload_id=uploaded_file.file_id)
+
+def attachment_texts(max_chars: int) -> Dict[str, str]:
+    """Up to `max_chars` of each attached file's text, read from the text store"""
+    texts = {}
+    for name, attachment in st.session_state.attachments.items():
+        summary = st.session_state.summaries.get(attachment.key)
+        if summary:
+            texts[name] = f"[Condensed from {attachment.chars:,} characters to fit the context window]\n{summary}"
+            continue
+        text = get_text_store().read(attachment.key, max_chars)
+        if text is None:
+            continue
+        if attachment.chars > max_chars:
+            text += f"\n[Truncated: first {max_chars:,} of {attachment.chars:,} characters]"
+        texts[name] = text
+    return texts
+
+@st.cache_resource
+def get_client() -> AzureO3ProClient:
+    """Create the O3-Pro client once per process
+
+    Requests run on executor workers, where st calls do not reach the page;
+    callers there ask for failures to be raised onto the job, which shows them.
+    """
+    return AzureO3ProClient(response_cache_from_env())
+
+@st.cache_resource
+def get_token_counter() -> TokenCounter:
+    """Token counter with memoized per-message counts, shared across sessions"""
+    return TokenCounter()
+
+@st.cache_resource
+def get_conversation_store() -> ConversationStore:
+    """Conversation history and saved prompts, shared by every session"""
+    return ConversationStore(os.getenv("O3PRO_CONVERSATION_DB", DEFAULT_CONVERSATION_DB))
+
+@st.cache_resource
+def get_metrics_server():
+    """Prometheus /metrics endpoint, started once per process when O3PRO_METRICS_PORT is set"""
+    return metrics_server_from_env()
+
+@st.cache_resource
+def get_background_jobs() -> BackgroundJobs:
+    """Registry of background responses shared by every session in the process"""
+    return BackgroundJobs()
+
+@st.cache_resource
+def get_request_executor() -> RequestExecutor:
+    """Workers that send every session's O3-Pro requests; their number caps requests in flight"""
+    return executor_from_env()
+
+@st.cache_resource
+def get_summarizer() -> Summarizer:
+    """Map-reduce summarizer shared by every session; its requests go through the request executor"""
+    return summarizer_from_env(get_client(), get_token_counter())
+
+def session_queue(priority: int) -> UserQueue:
+    """Submits this session's requests to the shared executor at the given priority"""
+    return get_request_executor().queue(st.session_state.user_id, priority)
 
 def init_session_state():
     """Initialize session state variables"""
-    if "messages" not in st.session_state:
-        st.session_state.messages = []
+    if "user_id" not in st.session_state:
+        # Per-browser token kept in the URL: it owns this browser's conversations and
+        # identifies the session to the request executor's fair queuing
+        user = st.experimental_get_query_params().get("user", [None])[0]
+        st.session_state.user_id = user if user and TOKEN_PATTERN.fullmatch(user) else new_token()
+    if "conversation_id" not in st.session_state:
+        # Survives a browser refresh through the URL query string; only the owner's conversations open
+        conversation = st.experimental_get_query_params().get("conversation", [None])[0]
+        if conversation and not get_conversation_store().conversation(conversation, st.session_state.user_id):
+            conversation = None
+        st.session_state.conversation_id = conversation
+    if "pending_job_id" not in st.session_state:
+        # Turn still running in the request executor when a rerun interrupted it
+        st.session_state.pending_job_id = None
+    if "history_window" not in st.session_state:
+        st.session_state.history_window = HISTORY_PAGE_SIZE
     if "system_prompt" not in st.session_state:
         st.session_state.system_prompt = "You are a helpful AI assistant powered by O3-Pro."
-    if "uploaded_files_content" not in st.session_state:
-        st.session_state.uploaded_files_content = {}
+    if "attachments" not in st.session_state:
+        # File name -> Attachment; the text itself stays in the text store
+        st.session_state.attachments = {}
+    if "summaries" not in st.session_state:
+        # Attachment key -> map-reduce summary of a file too large for the budget
+        st.session_state.summaries = {}
+    if "approved_summaries" not in st.session_state:
+        # Attachment keys whose summary cost the user accepted
+        st.session_state.approved_summaries = set()
+    if "summarize_large_files" not in st.session_state:
+        st.session_state.summarize_large_files = True
+    if "stream_responses" not in st.session_state:
+        st.session_state.stream_responses = True
+    if "turn_metrics" not in st.session_state:
+        st.session_state.turn_metrics = []
+    if "retrieval_mode" not in st.session_state:
+        st.session_state.retrieval_mode = True
+    if "retrieval_token_budget" not in st.session_state:
+        st.session_state.retrieval_token_budget = DEFAULT_TOKEN_BUDGET
+    if "retrieval_index" not in st.session_state:
+        st.session_state.retrieval_index = BM25Index()
+    if "input_token_budget" not in st.session_state:
+        st.session_state.input_token_budget = DEFAULT_INPUT_BUDGET
+    if "incremental_mode" not in st.session_state:
+        st.session_state.incremental_mode = True
+    if "conversation_chain" not in st.session_state:
+        st.session_state.conversation_chain = ConversationChain()
+    if "use_response_cache" not in st.session_state:
+        st.session_state.use_response_cache = True
+    if "background_mode" not in st.session_state:
+        st.session_state.background_mode = False
+    if "compare_mode" not in st.session_state:
+        st.session_state.compare_mode = False
+    if "compare_presets" not in st.session_state:
+        st.session_state.compare_presets = [CURRENT_PROMPT]
+    if "compare_efforts" not in st.session_state:
+        st.session_state.compare_efforts = list(REASONING_EFFORTS)
+    if "pending_response_id" not in st.session_state:
+        # Survives a browser refresh through the URL query string
+        st.session_state.pending_response_id = st.experimental_get_query_params().get("response_id", [None])[0]
+        update_query_params()
 
 def save_system_prompt(name: str, prompt: str):
-    """Save system prompt to session state"""
-    if "saved_prompts" not in st.session_state:
-        st.session_state.saved_prompts = {}
-    st.session_state.saved_prompts[name] = prompt
+    """Save system prompt to the shared store"""
+    get_conversation_store().save_prompt(name, prompt)
 
 def load_system_prompt(name: str) -> str:
-    """Load system prompt from session state"""
-    if "saved_prompts" not in st.session_state:
-        return ""
-    return st.session_state.saved_prompts.get(name, "")
+    """Load system prompt from the shared store"""
+    return get_conversation_store().saved_prompts().get(name, "")
+
+def update_query_params():
+    """Keep the owner token, conversation and any running background response in the URL so a refresh finds them"""
+    params = {"user": st.session_state.user_id}
+    if st.session_state.conversation_id is not None:
+        params["conversation"] = st.session_state.conversation_id
+    if st.session_state.pending_response_id:
+        params["response_id"] = st.session_state.pending_response_id
+    st.experimental_set_query_params(**params)
+
+def open_conversation(conversation_id: Optional[str], position: Optional[int] = None):
+    """Switch the session to another conversation, or to a new one when conversation_id is None
+
+    With a position the history window reaches back far enough to show that message.
+    """
+    st.session_state.conversation_id = conversation_id
+    st.session_state.history_window = HISTORY_PAGE_SIZE
+    if conversation_id is not None and position is not None:
+        count = get_conversation_store().message_count(conversation_id)
+        st.session_state.history_window = max(HISTORY_PAGE_SIZE, count - position)
+    st.session_state.turn_metrics = []
+    st.session_state.conversation_chain.reset()
+    # A turn still running belongs to the conversation being left
+    job = st.session_state.pending_job_id and get_request_executor().get(st.session_state.pending_job_id)
+    if job:
+        job.cancel()
+    st.session_state.pending_job_id = None
+    update_query_params()
+
+def append_message(role: str, content: str):
+    """Store a message in the current conversation, starting one if needed"""
+    store = get_conversation_store()
+    if st.session_state.conversation_id is None:
+        st.session_state.conversation_id = store.create_conversation(st.session_state.user_id)
+        update_query_params()
+    store.append_message(st.session_state.conversation_id, role, content)
+
+def load_history() -> Tuple[List[Dict], bool]:
+    """Newest messages that could fit the input budget, and whether older ones were left unloaded"""
+    if st.session_state.conversation_id is None:
+        return [], False
+    messages, first = get_conversation_store().recent_messages(
+        st.session_state.conversation_id, st.session_state.input_token_budget * HISTORY_BYTES_PER_BUDGET_TOKEN
+    )
+    return messages, first > 0
+
+def submit_turn(fn, *args, **kwargs) -> RequestJob:
+    """Queue this session's turn on the shared executor and remember it until it has been shown"""
+    job = get_request_executor().submit(st.session_state.user_id, fn, *args, label="turn", **kwargs)
+    st.session_state.pending_job_id = job.id
+    return job
+
+def follow_job(job: RequestJob, placeholder):
+    """Render a job's text as its worker publishes it, until the job finishes
+
+    A rerun stops this loop but not the job, which the next run picks up again.
+    """
+    if st.button("⏹️ Stop", key=f"stop_{job.id}"):
+        job.cancel()
+    # Re-renders are throttled so Streamlit does not become the bottleneck
+    while not job.wait(STREAM_RENDER_INTERVAL):
+        if job.text:
+            placeholder.markdown(job.text + "▌")
+        elif job.status == "queued":
+            placeholder.markdown(f"_Waiting for a free request slot... {job.queued_for:.0f}s_")
+    if st.session_state.pending_job_id == job.id:
+        st.session_state.pending_job_id = None
+
+def stream_response(client: AzureO3ProClient, messages: List[Dict], placeholder, start: float,
+                    previous_response_id: Optional[str] = None, use_cache: bool = True,
+                    input_tokens: Optional[int] = None):
+    """Render output text into the placeholder as it streams
+
+    Returns (text, time to first token, completed response, job).
+    """
+    job = submit_turn(stream_completion, client, messages, previous_response_id=previous_response_id,
+                      use_cache=use_cache, input_tokens=input_tokens)
+    follow_job(job, placeholder)
+    if job.status == "failed":
+        st.error(job.error)
+    ttft = job.first_token_at - start if job.first_token_at else None
+    return job.text, ttft, job.result() if job.status == "completed" else None, job
+
+def complete_turn(client: AzureO3ProClient, messages: List[Dict], previous_response_id: Optional[str],
+                  placeholder, input_tokens: Optional[int] = None) -> RequestJob:
+    """Send a turn as a single non-streaming request and wait for it"""
+    with st.spinner("Thinking..."):
+        job = submit_turn(create_completion, client, messages, previous_response_id=previous_response_id,
+                          use_cache=st.session_state.use_response_cache, input_tokens=input_tokens)
+        follow_job(job, placeholder)
+    return job
+
+def worth_retrying(job: RequestJob, chained: bool) -> bool:
+    """Whether a failed turn may succeed as a fresh request with the full history"""
+    if chained:
+        # The previous response may have expired, or its endpoint be down
+        return True
+    # The service refusing the input itself would only refuse it again
+    status = getattr(job.exception(), "status", None)
+    return status is None or status in RETRYABLE_STATUSES
+
+def build_prompt(history: List[Dict], count_only: bool = False, system_prompt: Optional[str] = None) -> PromptAssembly:
+    """Assemble the system prompt, attachments and history within the input token budget"""
+    system_prompt = st.session_state.system_prompt if system_prompt is None else system_prompt
+    attachments = {}
+    if st.session_state.attachments and st.session_state.retrieval_mode:
+        # Files are represented by retrieved passages; just name them here
+        system_prompt += "\n\nAttached files: " + ", ".join(st.session_state.attachments)
+    elif st.session_state.attachments:
+        attachments = attachment_texts(st.session_state.input_token_budget * ATTACHMENT_CHARS_PER_BUDGET_TOKEN)
+    return assemble_messages(
+        system_prompt, attachments, history, st.session_state.input_token_budget, get_token_counter(), count_only
+    )
+
+def oversized_attachments() -> Dict[str, Attachment]:
+    """Attached files whose estimated size exceeds their share of the input budget"""
+    attachments = st.session_state.attachments
+    share = st.session_state.input_token_budget * ATTACHMENT_SHARE / max(1, len(attachments))
+    return {name: attachment for name, attachment in attachments.items() if estimate_tokens(attachment.chars) > share}
+
+def pending_summaries() -> Dict[str, Attachment]:
+    """Oversized attachments not summarized yet"""
+    return {name: attachment for name, attachment in oversized_attachments().items()
+            if attachment.key not in st.session_state.summaries}
+
+def summary_estimate(attachments: Dict[str, Attachment]) -> SummaryEstimate:
+    """Requests and tokens summarizing the attachments would take"""
+    summarizer = get_summarizer()
+    return sum((summarizer.estimate(estimate_tokens(attachment.chars)) for attachment in attachments.values()),
+               SummaryEstimate())
+
+def summary_needs_approval(attachments: Dict[str, Attachment], estimate: SummaryEstimate) -> bool:
+    """Whether summarizing costs more than the threshold and the user has not accepted it"""
+    approved = st.session_state.approved_summaries
+    return (estimate.cost(pricing_from_env()) > get_summarizer().confirm_cost
+            and any(attachment.key not in approved for attachment in attachments.values()))
+
+def describe_summary_estimate(estimate: SummaryEstimate) -> str:
+    return (f"{estimate.chunks:,} parts, up to {estimate.requests:,} requests, "
+            f"~${estimate.cost(pricing_from_env()):.2f} before cached steps")
+
+def summarize_attachments():
+    """Map-reduce files too large for the budget, showing progress until every summary is ready"""
+    pending = pending_summaries()
+    if not pending:
+        return
+    estimate = summary_estimate(pending)
+    if summary_needs_approval(pending, estimate):
+        st.warning(f"Summarizing {', '.join(pending)} would take {describe_summary_estimate(estimate)}; "
+                   "sending truncated text instead. Approve the summary in the sidebar to condense it.")
+        return
+    st.caption(f"Summarizing {', '.join(pending)}: {describe_summary_estimate(estimate)}")
+    summarizer = get_summarizer()
+    store = get_text_store()
+    jobs = {}
+    for name, attachment in pending.items():
+        # A job started before a rerun is still running and is picked up again rather than repeated
+        jobs[attachment.key] = summarizer.start(name, lambda key=attachment.key: store.iter_chunks(key),
+                                                pool=session_queue(PRIORITY_BULK), key=attachment.key)
+    
+    for key, job in jobs.items():
+        progress = st.progress(0.0)
+        while not job.wait(SUMMARY_STATUS_INTERVAL):
+            if job.status == "mapping":
+                progress.progress(0.9 * job.mapped / max(1, job.chunks),
+                                  text=f"Summarizing {job.name}: {job.mapped} of {job.chunks} parts")
+            else:
+                progress.progress(0.9, text=f"Merging the summaries of {job.name} (round {job.reduce_round})")
+        progress.empty()
+        if job.status == "completed":
+            st.session_state.summaries[key] = job.summary
+            st.caption(f"Summarized {job.name} from {job.chunks} parts in {job.elapsed:.0f}s"
+                       f" ({job.requests} requests, {job.cached} from cache)")
+        else:
+            st.warning(f"Could not summarize {job.name} ({job.error}); sending it truncated instead")
+
+def compare_variants() -> List[Variant]:
+    """Every chosen preset at every chosen reasoning effort"""
+    presets = st.session_state.compare_presets or [CURRENT_PROMPT]
+    efforts = st.session_state.compare_efforts or [None]
+    variants = []
+    for preset in presets:
+        system_prompt = st.session_state.system_prompt if preset == CURRENT_PROMPT else PRESET_PROMPTS[preset]
+        for effort in efforts:
+            label = preset if effort is None else f"{preset} · {effort}"
+            variants.append(Variant(label, system_prompt, effort))
+    return variants
+
+def render_comparison(comparison: Comparison):
+    """Stream each variant into its own column until all have finished"""
+    columns = st.columns(len(comparison.runs))
+    placeholders = []
+    for column, run in zip(columns, comparison.runs):
+        column.markdown(f"**{run.variant.label}**")
+        placeholders.append(column.empty())
+    
+    # Workers fill in the runs; only this thread may render
+    while True:
+        finished = comparison.done
+        for placeholder, run in zip(placeholders, comparison.runs):
+            if run.status == "failed":
+                placeholder.error(run.error)
+            elif run.text:
+                placeholder.markdown(run.text + ("" if run.done.is_set() else "▌"))
+            else:
+                placeholder.markdown("_Waiting for a free slot..._" if run.status == "queued" else "_Thinking..._")
+        if finished:
+            break
+        comparison.wait(STREAM_RENDER_INTERVAL)
+
+def compare_turn(client: AzureO3ProClient, history: List[Dict]):
+    """Ask the latest question once per variant, concurrently, and show the answers side by side"""
+    variants = compare_variants()
+    runs = [VariantRun(variant, build_prompt(history, system_prompt=variant.system_prompt).messages)
+            for variant in variants]
+    with st.chat_message("assistant"):
+        comparison = start_comparison(client, runs, session_queue(PRIORITY_COMPARE),
+                                      stream=st.session_state.stream_responses,
+                                      use_cache=st.session_state.use_response_cache)
+        render_comparison(comparison)
+        
+        pricing = pricing_from_env()
+        rows = [run.metrics(pricing) for run in runs]
+        st.dataframe(rows, hide_index=True, use_container_width=True, column_config={
+            "latency_s": st.column_config.NumberColumn("latency (s)", format="%.1f"),
+            "ttft_s": st.column_config.NumberColumn("first token (s)", format="%.1f"),
+            "queued_s": st.column_config.NumberColumn("queued (s)", format="%.1f"),
+            "cost_usd": st.column_config.NumberColumn("cost (USD)", format="$%.4f"),
+        })
+        st.caption(
+            f"{len(runs)} variants in {comparison.wall_time:.1f}s wall time vs {comparison.sequential_time:.1f}s"
+            f" one after another · {get_request_executor().max_concurrency} request slots shared with other sessions"
+            f" · ~${sum(row['cost_usd'] for row in rows):.4f} in total"
+        )
+    
+    answers = [f"**{run.variant.label}**\n\n{run.text}" for run in runs if run.status == "completed"]
+    if answers:
+        append_message("assistant", "\n\n---\n\n".join(answers))
+    # The stored conversation now holds several answers, none of which the service has seen as one
+    st.session_state.conversation_chain.reset()
+
+def track_background_job(job: BackgroundJob):
+    """Remember a running background response in the session and the URL"""
+    st.session_state.pending_response_id = job.response_id
+    update_query_params()
+
+def wait_for_background_job(client: AzureO3ProClient, job: BackgroundJob, placeholder) -> Optional[str]:
+    """Show progress until a background response finishes; returns its text"""
+    if st.button("⏹️ Cancel", key=f"cancel_{job.response_id}"):
+        job.cancel()
+    
+    while not job.wait(BACKGROUND_STATUS_INTERVAL):
+        status = job.status.replace("_", " ").capitalize()
+        placeholder.markdown(f"_{status} in background... {job.elapsed:.0f}s_")
+    
+    st.session_state.pending_response_id = None
+    update_query_params()
+    get_background_jobs().forget(job.response_id)
+    
+    if job.status == "completed":
+        return client.extract_text(job.result)
+    if job.status == "cancelled":
+        placeholder.markdown("_Request cancelled._")
+    else:
+        st.error(f"Background request {job.status}: {job.error or 'no details'}")
+    return None
+
+def run_background_turn(client: AzureO3ProClient, messages: List[Dict], previous_response_id: Optional[str],
+                        placeholder, input_tokens: Optional[int] = None) -> Tuple[Optional[BackgroundJob], Optional[str]]:
+    """Submit a turn as a background response and wait for it; returns the job, if submitted, and its text"""
+    try:
+        job = get_background_jobs().submit(
+            client, messages, previous_response_id=previous_response_id,
+            pool=session_queue(PRIORITY_INTERACTIVE), raise_errors=True, input_tokens=input_tokens
+        )
+    except ResponseError as e:
+        st.error(f"Background request could not be submitted: {str(e)}")
+        return None, None
+    if job is None:
+        st.error("Background request could not be submitted: the service returned no response id")
+        return None, None
+    track_background_job(job)
+    return job, wait_for_background_job(client, job, placeholder)
+
+def start_turn(prompt: str) -> Tuple[List[Dict], bool]:
+    """Store and show the user's message; returns the history to send and whether it was windowed"""
+    # Add user message to chat history
+    append_message("user", prompt)
+    
+    # Display user message
+    with st.chat_message("user"):
+        st.markdown(prompt)
+    
+    # Add relevant file passages to the outgoing question if enabled
+    history, windowed = load_history()
+    if st.session_state.attachments and not st.session_state.retrieval_mode and st.session_state.summarize_large_files:
+        summarize_attachments()
+    if st.session_state.attachments and st.session_state.retrieval_mode:
+        index = st.session_state.retrieval_index
+        index.sync_keys({name: attachment.key for name, attachment in st.session_state.attachments.items()},
+                        get_document_index)
+        passages = select_passages(index, prompt, st.session_state.retrieval_token_budget)
+        if passages:
+            # Passages travel with the question so the system message stays stable between turns
+            history[-1] = {"role": "user", "content": f"{prompt}\n\n{format_passages(passages)}"}
+            source = ("the opening of each attached file, as no passage matched" if passages[0].score == 0
+                      else "attached files")
+            st.caption(f"Including {len(passages)} passages (~{sum(p.tokens for p in passages):,} tokens) from {source}")
+    return history, windowed
 
 def main():
+    # Configure page; kept out of module scope so the app can be imported without running it
+    st.set_page_config(
+        page_title="O3-Pro Azure Chat",
+        page_icon="🤖",
+        layout="wide",
+        initial_sidebar_state="expanded"
+    )
     init_session_state()
-    client = AzureO3ProClient()
+    client = get_client()
+    metrics_server = get_metrics_server()
     
     # Sidebar for configuration
     with st.sidebar:
         st.title("⚙️ Configuration")
+        store = get_conversation_store()
+        
+        # Conversations
+        st.subheader("💬 Conversations")
+        if st.button("➕ New Conversation"):
+            open_conversation(None)
+            st.rerun()
+        recent = {c["id"]: c for c in store.list_conversations(st.session_state.user_id, CONVERSATION_LIST_SIZE)}
+        current = st.session_state.conversation_id
+        options = list(recent) if current in recent else [current] + list(recent)
+        def conversation_label(conversation_id: Optional[str]) -> str:
+            if conversation_id is None:
+                return "New conversation"
+            if conversation_id not in recent:
+                conversation = store.conversation(conversation_id, st.session_state.user_id) or {}
+                return conversation.get("title") or "Untitled"
+            conversation = recent[conversation_id]
+            return f"{conversation['title'] or 'Untitled'} ({conversation['message_count']})"
+        
+        if options != [None]:
+            selected = st.selectbox("Recent:", options, index=options.index(current), format_func=conversation_label)
+            if selected != current:
+                open_conversation(selected)
+                st.rerun()
+        query = st.text_input("Search past conversations:")
+        for hit in store.search(st.session_state.user_id, query, SEARCH_RESULTS):
+            label = f"{hit['title'] or 'Untitled'} · {hit['role']}: {hit['snippet']}"
+            if st.button(label, key=f"hit_{hit['conversation_id']}_{hit['position']}"):
+                open_conversation(hit["conversation_id"], hit["position"])
+                st.rerun()
         
         # System Prompt Section
         st.subheader("System Prompt")
         
-        # Predefined system prompts
-        predefined_prompts = {
-            "Default": """You are a helpful AI assistant powered by O3-Pro, OpenAI's most advanced reasoning model. You excel at complex problem-solving, detailed analysis, and providing thoughtful, well-reasoned responses. You think step-by-step through problems and provide clear, accurate, and helpful information.""",
-            
-            "Code Assistant": """You are an expert programming assistant powered by O3-Pro. You have deep knowledge of:
-- Multiple programming languages (Python, JavaScript, Java, C++, etc.)
-- Software architecture and design patterns
-- Debugging techniques and error resolution
-- Code optimization and best practices
-- Testing strategies and methodologies
-- Version control and development workflows
-
-When helping with code:
-1. Analyze the problem thoroughly
-2. Provide clean, well-commented solutions
-3. Explain your reasoning and approach
-4. Suggest improvements and alternatives
-5. Consider edge cases and potential issues
-6. Follow industry best practices and conventions""",
-            
-            "Research Assistant": """You are a research assistant powered by O3-Pro, specialized in:
-- Document analysis and synthesis
-- Information extraction and summarization
-- Critical evaluation of sources and data
-- Identifying patterns and insights
-- Creating comprehensive reports
-- Fact-checking and verification
-
-Your approach:
-1. Thoroughly analyze all provided materials
-2. Extract key information and themes
-3. Cross-reference and validate findings
-4. Present information in a structured, clear manner
-5. Provide citations and references when applicable
-6. Highlight important insights and recommendations
-7. Maintain objectivity and acknowledge limitations""",
-            
-            "Creative Writer": """You are a creative writing assistant powered by O3-Pro. You excel at:
-- Storytelling across all genres (fiction, non-fiction, poetry, scripts)
-- Character development and world-building
-- Plot structure and narrative techniques
-- Style adaptation and voice matching
-- Creative brainstorming and ideation
-- Content editing and improvement
-- Writing for different audiences and purposes
-
-Your creative process:
-1. Understand the writer's vision and goals
-2. Offer original, engaging ideas and concepts
-3. Maintain consistency in tone, style, and voice
-4. Provide constructive feedback and suggestions
-5. Help overcome writer's block with fresh perspectives
-6. Ensure proper pacing, structure, and flow
-7. Adapt to various formats and requirements""",
-            
-            "Data Analyst": """You are a data analysis expert powered by O3-Pro. You specialize in:
-- Statistical analysis and interpretation
-- Data visualization and presentation
-- Pattern recognition and trend analysis
-- Hypothesis testing and validation
-- Predictive modeling concepts
-- Data cleaning and preparation guidance
-- Business intelligence insights
-
-Your analytical approach:
-1. Examine data thoroughly for quality and completeness
-2. Apply appropriate statistical methods
-3. Identify meaningful patterns and correlations
-4. Provide clear, actionable insights
-5. Explain findings in business-friendly terms
-6. Suggest data collection improvements
-7. Recommend next steps and follow-up analyses""",
-            
-            "Technical Writer": """You are a technical writing specialist powered by O3-Pro. You excel at:
-- Creating clear, comprehensive documentation
-- Translating complex technical concepts into accessible language
-- User manuals, API documentation, and guides
-- Process documentation and procedures
-- Technical specifications and requirements
-- Training materials and tutorials
-
-Your documentation principles:
-1. Prioritize clarity and user experience
-2. Structure information logically and hierarchically
-3. Use appropriate technical terminology consistently
-4. Include relevant examples and use cases
-5. Consider different skill levels and audiences
-6. Ensure accuracy and completeness
-7. Follow documentation best practices and standards"""
-        }
         
-        selected_preset = st.selectbox("Choose a preset:", list(predefined_prompts.keys()))
+        selected_preset = st.selectbox("Choose a preset:", list(PRESET_PROMPTS))
         if st.button("Load Preset"):
-            st.session_state.system_prompt = predefined_prompts[selected_preset]
+            st.session_state.system_prompt = PRESET_PROMPTS[selected_preset]
             st.rerun()
         
         # Custom system prompt
@@ -319,8 +590,9 @@ Your documentation principles:
                 st.success(f"Saved '{prompt_name}'")
         
         with col2:
-            if "saved_prompts" in st.session_state and st.session_state.saved_prompts:
-                saved_prompt_names = list(st.session_state.saved_prompts.keys())
+            saved_prompts = store.saved_prompts()
+            if saved_prompts:
+                saved_prompt_names = list(saved_prompts.keys())
                 selected_saved = st.selectbox("Load Saved:", saved_prompt_names)
                 if st.button("Load") and selected_saved:
                     st.session_state.system_prompt = load_system_prompt(selected_saved)
@@ -330,9 +602,9 @@ Your documentation principles:
         st.subheader("📎 File Attachments")
         uploaded_files = st.file_uploader(
             "Upload files to include in context:",
-            type=['pdf', 'txt', 'docx'],
+            type=[suffix.lstrip(".") for suffix in MIME_TYPES_BY_SUFFIX],
             accept_multiple_files=True,
-            help="Supported formats: PDF, TXT, DOCX"
+            help="Supported formats: PDF, DOCX, TXT, Markdown, HTML, CSV, XLSX and source code"
         )
         
         if uploaded_files:
@@ -340,22 +612,177 @@ Your documentation principles:
             for file in uploaded_files:
                 st.write(f"• {file.name}")
                 # Process and store file content
-                file_content = process_uploaded_file(file)
-                if file_content:
-                    st.session_state.uploaded_files_content[file.name] = file_content
+                attachment = process_uploaded_file(file)
+                if attachment:
+                    st.session_state.attachments[file.name] = attachment
+        
+        st.checkbox(
+            "Send relevant passages only",
+            key="retrieval_mode",
+            help="Search attached files locally and include only the passages that match each question"
+        )
+        if st.session_state.retrieval_mode:
+            st.number_input(
+                "Passage token budget:",
+                min_value=500,
+                max_value=200000,
+                step=500,
+                key="retrieval_token_budget"
+            )
+        else:
+            st.checkbox(
+                "Summarize files too large for the budget",
+                key="summarize_large_files",
+                help="Condense oversized files chunk by chunk in parallel instead of truncating them; "
+                     "summaries are cached, so asking about the same file again is free"
+            )
+            pending = pending_summaries() if st.session_state.summarize_large_files else {}
+            if pending:
+                estimate = summary_estimate(pending)
+                if summary_needs_approval(pending, estimate):
+                    st.warning(f"Summarizing {', '.join(pending)}: {describe_summary_estimate(estimate)}")
+                    if st.button("Approve summary"):
+                        st.session_state.approved_summaries.update(attachment.key for attachment in pending.values())
+                        st.rerun()
+                else:
+                    st.caption(f"Summary on next message: {describe_summary_estimate(estimate)}")
+        
+        store_stats = get_text_store().snapshot()
+        with st.expander("🗄️ Document Store", expanded=False):
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Hits", store_stats["hits"])
+            col2.metric("Misses", store_stats["misses"])
+            col3.metric("Evictions", store_stats["evictions"])
+            st.caption(
+                f"{store_stats['disk_bytes'] / 1_000_000:.1f} MB of extracted text on disk"
+                + (f" · {store_stats['rejected']} uploads over the size limit" if store_stats["rejected"] else "")
+            )
+        
+        # Response options
+        st.subheader("💬 Responses")
+        st.checkbox(
+            "Stream responses",
+            key="stream_responses",
+            help="Show the answer as it is generated instead of waiting for the full response"
+        )
+        st.checkbox(
+            "Background mode",
+            key="background_mode",
+            help="Submit long reasoning runs in the background and poll for the result; survives timeouts and page refreshes"
+        )
+        st.checkbox(
+            "Compare mode",
+            key="compare_mode",
+            help="Ask each question under several presets and reasoning efforts at once and show the answers side by side"
+        )
+        if st.session_state.compare_mode:
+            st.multiselect("Compare presets:", [CURRENT_PROMPT] + list(PRESET_PROMPTS), key="compare_presets")
+            st.multiselect("Compare reasoning efforts:", list(REASONING_EFFORTS), key="compare_efforts",
+                           help="Leave empty to use the deployment's default effort")
+            st.caption(f"{len(compare_variants())} variants per question, sharing "
+                       f"{get_request_executor().max_concurrency} request slots with other sessions")
+        st.checkbox(
+            "Incremental conversation",
+            key="incremental_mode",
+            help="Send only new messages and continue from the stored previous response instead of resending the full history"
+        )
+        st.number_input(
+            "Input token budget:",
+            min_value=1000,
+            max_value=1_000_000,
+            step=1000,
+            key="input_token_budget",
+            help="Older turns are summarized and attachments truncated to stay under this many input tokens"
+        )
+        estimate = build_prompt(load_history()[0], count_only=True)
+        counting = "" if get_token_counter().exact else " (estimated)"
+        st.caption(f"Current context: ~{estimate.input_tokens:,} of {st.session_state.input_token_budget:,} tokens{counting}")
+        if st.session_state.turn_metrics:
+            last_turn = st.session_state.turn_metrics[-1]
+            st.caption(f"Last turn: first token {last_turn['ttft']:.1f}s, total {last_turn['total']:.1f}s")
+            input_tokens = sum(turn["input_tokens"] for turn in st.session_state.turn_metrics)
+            if input_tokens:
+                cached = sum(turn["cached_tokens"] for turn in st.session_state.turn_metrics)
+                st.caption(f"Prompt cache: {cached:,} of {input_tokens:,} input tokens cached this chat ({cached / input_tokens:.0%})")
+            saved = sum(turn["bytes_saved"] for turn in st.session_state.turn_metrics)
+            if saved:
+                st.caption(f"Not resent this chat: {saved / 1024:.1f} KB (~{estimate_tokens(saved):,} tokens)")
+        
+        if client.response_cache:
+            st.checkbox(
+                "Use cached responses",
+                key="use_response_cache",
+                help="Answer identical prompts from the shared response cache; untick to always ask the model"
+            )
+            stats = client.response_cache.snapshot()
+            st.caption(
+                f"Response cache: {stats['hit_rate']:.0%} hit rate ({stats['hits']} hits, {stats['misses']} misses)"
+                f" · {stats['entries']} entries, {stats['bytes'] / 1024 / 1024:.1f} MB"
+            )
+        
+        throughput = client.controller.snapshot()
+        with st.expander("🚦 Throughput", expanded=False):
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Queued", throughput["queue_depth"])
+            col2.metric("Retries", throughput["retries"])
+            col3.metric("429s", throughput["throttled"])
+            limits = " · ".join(f"{value:,.0f} {name.upper()}" for name, value in
+                                (("rpm", throughput["rpm"]), ("tpm", throughput["tpm"])) if value)
+            st.caption(
+                f"Wait: {throughput['avg_wait']:.2f}s avg, {throughput['max_wait']:.1f}s max"
+                f" · {throughput['gave_up']} gave up · {limits or 'no client-side quota'}"
+            )
+            for name, seconds in throughput["paused"].items():
+                st.caption(f"Backing off {name} for {seconds:.1f}s after a rate limit")
+            executor = get_request_executor().snapshot()
+            st.caption(
+                f"Executor: {executor['running']} of {executor['max_concurrency']} slots busy"
+                f" · {executor['queued']} queued from {executor['waiting_users']} sessions"
+                f" · queue wait {executor['avg_queue_seconds']:.2f}s avg, {executor['max_queue_seconds']:.1f}s max"
+            )
+        
+        with st.expander("📈 Diagnostics", expanded=False):
+            rows = client.telemetry.summary()
+            if rows:
+                st.dataframe(
+                    [{**row, **{q: None if row[q] is None else round(row[q], 3) for q in ("p50", "p95", "p99")}}
+                     for row in rows],
+                    hide_index=True,
+                    use_container_width=True
+                )
+            else:
+                st.caption("No requests yet")
+            tokens = client.telemetry.totals("o3pro_tokens_total")
+            if tokens:
+                st.caption("Tokens: " + " · ".join(f"{count:,.0f} {kind}" for kind, count in sorted(tokens.items())))
+            if metrics_server:
+                st.caption(f"Prometheus metrics on port {metrics_server.server_address[1]} at /metrics")
         
         # Model Information
         st.subheader("🔧 Model Info")
+        endpoints = client.pool.snapshot()
         st.info(f"""
         **Model:** {client.model}
         **Endpoint:** {client.endpoint.split('//')[1].split('.')[0]}
         **API Version:** {client.api_version}
         """)
+        if len(endpoints) > 1:
+            with st.expander(f"🌐 Endpoints ({client.pool.strategy.replace('_', ' ')})", expanded=False):
+                for endpoint in endpoints:
+                    latency = f"{endpoint['latency']:.1f}s" if endpoint["latency"] is not None else "–"
+                    st.caption(
+                        f"**{endpoint['name']}** · {endpoint['state']} · {endpoint['outstanding']} in flight"
+                        f" · {endpoint['requests']} requests, {endpoint['failures']} failed · {latency}"
+                    )
         
         # Clear conversation
         if st.button("🗑️ Clear Conversation", type="secondary"):
-            st.session_state.messages = []
-            st.session_state.uploaded_files_content = {}
+            if st.session_state.conversation_id is not None:
+                store.delete_conversation(st.session_state.conversation_id, st.session_state.user_id)
+            st.session_state.attachments = {}
+            st.session_state.summaries = {}
+            st.session_state.approved_summaries = set()
+            open_conversation(None)
             st.rerun()
     
     # Main chat interface
@@ -367,13 +794,16 @@ Your documentation principles:
         st.markdown(f"```\n{st.session_state.system_prompt}\n```")
     
     # Display uploaded files content
-    if st.session_state.uploaded_files_content:
-        with st.expander(f"Attached Files ({len(st.session_state.uploaded_files_content)})", expanded=False):
-            for filename, content in st.session_state.uploaded_files_content.items():
+    if st.session_state.attachments:
+        with st.expander(f"Attached Files ({len(st.session_state.attachments)})", expanded=False):
+            for filename, attachment in st.session_state.attachments.items():
                 st.subheader(filename)
+                st.caption(f"{attachment.size / 1_000_000:.1f} MB {attachment.kind}, {attachment.chars:,} characters"
+                           + (" (truncated)" if attachment.truncated else ""))
+                content = get_text_store().read(attachment.key, PREVIEW_CHARS) or ""
                 st.text_area(
                     f"Content of {filename}:",
-                    value=content[:1000] + "..." if len(content) > 1000 else content,
+                    value=content + "..." if attachment.chars > PREVIEW_CHARS else content,
                     height=200,
                     disabled=True
                 )
@@ -381,31 +811,77 @@ Your documentation principles:
     # Chat history
     chat_container = st.container()
     with chat_container:
-        for message in st.session_state.messages:
-            with st.chat_message(message["role"]):
-                st.markdown(message["content"])
+        # Only the newest window of messages is loaded and rendered
+        conversation_id = st.session_state.conversation_id
+        if conversation_id is not None:
+            store = get_conversation_store()
+            offset = max(0, store.message_count(conversation_id) - st.session_state.history_window)
+            if offset and st.button(f"⬆️ Load earlier messages ({offset} more)"):
+                st.session_state.history_window += HISTORY_PAGE_SIZE
+                st.rerun()
+            for message in store.messages(conversation_id, offset, st.session_state.history_window):
+                with st.chat_message(message["role"]):
+                    st.markdown(message["content"])
+    
+    # Reattach to a background response that is still running, e.g. after a refresh
+    if st.session_state.pending_response_id:
+        job = get_background_jobs().attach(client, st.session_state.pending_response_id)
+        with st.chat_message("assistant"):
+            placeholder = st.empty()
+            content = wait_for_background_job(client, job, placeholder)
+            if content:
+                placeholder.markdown(content)
+                append_message("assistant", content)
+    
+    # Pick up a turn still running in the request executor after a rerun interrupted it
+    if st.session_state.pending_job_id:
+        job = get_request_executor().get(st.session_state.pending_job_id)
+        if job is None:
+            st.session_state.pending_job_id = None
+        else:
+            with st.chat_message("assistant"):
+                placeholder = st.empty()
+                follow_job(job, placeholder)
+                content = job.text
+                if content:
+                    placeholder.markdown(content + ("" if job.status == "completed" else "\n\n_Stopped._"))
+                    append_message("assistant", content)
+                elif job.status == "cancelled":
+                    placeholder.markdown("_Request cancelled._")
+                else:
+                    st.error(job.error or "Failed to get response from O3-Pro model")
+        # Turn metrics and the response chain were lost with the interrupted run
+        st.session_state.conversation_chain.reset()
     
     # Chat input
-    if prompt := st.chat_input("Type your message here..."):
-        # Add user message to chat history
-        st.session_state.messages.append({"role": "user", "content": prompt})
-        
-        # Display user message
-        with st.chat_message("user"):
-            st.markdown(prompt)
-        
-        # Prepare messages for API call
-        messages = [{"role": "system", "content": st.session_state.system_prompt}]
+    prompt = st.chat_input("Type your message here...")
+    if prompt and st.session_state.compare_mode:
+        history, _ = start_turn(prompt)
+        try:
+            compare_turn(client, history)
+        except Exception as e:
+            st.error(f"An error occurred: {str(e)}")
+    elif prompt:
+        history, windowed = start_turn(prompt)
         
-        # Add file contents to system message if any
-        if st.session_state.uploaded_files_content:
-            file_context = "\n\nAttached files content:\n"
-            for filename, content in st.session_state.uploaded_files_content.items():
-                file_context += f"\n--- {filename} ---\n{content}\n"
-            messages[0]["content"] += file_context
+        # Prepare messages for API call within the input token budget
+        assembly = build_prompt(history)
+        messages = assembly.messages
+        if assembly.trimmed:
+            st.caption(
+                f"Trimmed to ~{assembly.input_tokens:,} input tokens: {assembly.dropped_messages} older messages summarized"
+                + (f", {len(assembly.truncated_files)} files truncated" if assembly.truncated_files else "")
+            )
         
-        # Add conversation history
-        messages.extend(st.session_state.messages)
+        # Only send what the stored conversation has not seen yet
+        chain = st.session_state.conversation_chain
+        if st.session_state.incremental_mode and not assembly.trimmed and not windowed:
+            request_messages, previous_response_id = chain.prepare(messages)
+        else:
+            chain.reset()
+            request_messages, previous_response_id = messages, None
+        # The service bills a chained turn for the whole conversation, not just what is sent
+        input_tokens = assembly.input_tokens
         
         # Generate response
         with st.chat_message("assistant"):
@@ -413,23 +889,107 @@ Your documentation principles:
             full_response = ""
             
             try:
-                with st.spinner("Thinking..."):
-                    # First try non-streaming for O3-Pro
-                    response = client.create_chat_completion(messages, stream=False)
+                start = time.perf_counter()
+                ttft = None
+                content = None
+                response = None
+                response_id = None
+                usage_source = None
+                streamed = False
+                stream_job = None
+                
+                if st.session_state.background_mode:
+                    # Long reasoning runs are polled instead of holding a request open
+                    job, content = run_background_turn(client, request_messages, previous_response_id,
+                                                       message_placeholder, input_tokens)
+                    if content is None and previous_response_id is not None and (job is None or job.status == "failed"):
+                        # The previous response may have expired, or its endpoint be down
+                        request_messages, previous_response_id = messages, None
+                        job, content = run_background_turn(client, request_messages, None, message_placeholder,
+                                                           input_tokens)
+                    if job:
+                        ttft = time.perf_counter() - start
+                        response_id = job.response_id
+                        usage_source = job.result
+                else:
+                    if st.session_state.stream_responses:
+                        streamed = True
+                        message_placeholder.markdown("_Thinking..._")
+                        content, ttft, response, stream_job = stream_response(
+                            client, request_messages, message_placeholder, start, previous_response_id,
+                            use_cache=st.session_state.use_response_cache, input_tokens=input_tokens
+                        )
+                        usage_source = response
+                        response_id = (response or {}).get("id")
+                        if stream_job.status == "cancelled" and not content:
+                            message_placeholder.markdown("_Request cancelled._")
                     
-                    if response and 'output' in response:
-                        # Parse O3-Pro response format
-                        content = client._extract_content_from_o3_response(response)
-                        if content:
-                            message_placeholder.markdown(content)
-                            full_response = content
-                            
-                            # Add assistant response to chat history
-                            st.session_state.messages.append({"role": "assistant", "content": full_response})
+                    # Only a stream that failed before showing anything is retried; text already
+                    # shown is kept rather than replaced by a second, separately billed answer
+                    if not streamed or (stream_job.status == "failed" and not content
+                                        and worth_retrying(stream_job, previous_response_id is not None)):
+                        if streamed:
+                            # Retry with the full history, which also recovers from an expired previous response
+                            request_messages, previous_response_id = messages, None
+                        # Fall back to a single non-streaming request
+                        streamed = False
+                        job = complete_turn(client, request_messages, previous_response_id, message_placeholder,
+                                            input_tokens)
+                        if job.status == "failed" and previous_response_id is not None:
+                            st.error(job.error)
+                            # The previous response may have expired, or its endpoint be down
+                            request_messages, previous_response_id = messages, None
+                            job = complete_turn(client, request_messages, None, message_placeholder, input_tokens)
+                        response = job.result() if job.status == "completed" else None
+                        
+                        if response and 'output' in response:
+                            # Parse O3-Pro response format
+                            content = client.extract_text(response)
+                            ttft = time.perf_counter() - start
+                            response_id = response.get("id")
+                            usage_source = response
                         else:
-                            st.error("No content found in O3-Pro response")
+                            st.error(job.error or "Failed to get response from O3-Pro model")
+                
+                if content:
+                    message_placeholder.markdown(content)
+                    full_response = content
+                    total = time.perf_counter() - start
+                    full_bytes = message_bytes(messages)
+                    sent_bytes = message_bytes(request_messages)
+                    usage = client.usage_summary(usage_source)
+                    st.session_state.turn_metrics.append({
+                        "streamed": streamed,
+                        "ttft": ttft,
+                        "total": total,
+                        "chained": previous_response_id is not None,
+                        "bytes_sent": sent_bytes,
+                        "bytes_saved": full_bytes - sent_bytes,
+                        "tokens_saved": estimate_tokens(full_bytes - sent_bytes),
+                        "input_tokens": usage["input_tokens"],
+                        "cached_tokens": usage["cached_tokens"],
+                    })
+                    caption = f"First token {ttft:.1f}s · total {total:.1f}s"
+                    if previous_response_id:
+                        caption += (f" · sent {sent_bytes / 1024:.1f} KB, saved {(full_bytes - sent_bytes) / 1024:.1f} KB"
+                                    f" (~{estimate_tokens(full_bytes - sent_bytes):,} tokens)")
+                    if usage["cached_tokens"]:
+                        caption += f" · {usage['cached_tokens']:,} of {usage['input_tokens']:,} input tokens cached"
+                    st.caption(caption)
+                    
+                    # Add assistant response to chat history
+                    append_message("assistant", full_response)
+                    del st.session_state.turn_metrics[:-MAX_TURN_METRICS]
+                    if assembly.trimmed or windowed or (usage_source or {}).get("cache_hit"):
+                        # A trimmed prompt differs every turn, so it cannot be chained; nor can a
+                        # cached answer, whose stored response may be gone or belong to another session
+                        chain.reset()
                     else:
-                        st.error("Failed to get response from O3-Pro model")
+                        chain.record(response_id, messages + [{"role": "assistant", "content": full_response}])
+                else:
+                    chain.reset()
+                    if response:
+                        st.error("No content found in O3-Pro response")
                         
             except Exception as e:
                 st.error(f"An error occurred: {str(e)}")
@@ -0,0 +1,157 @@
+"""Background-mode O3-Pro requests polled on worker threads"""
+import threading
+import time
+from typing import Dict, Optional
+
+import requests
+
+from telemetry import RequestTrace, get_telemetry
+
+# Statuses after which a background response will not change again
+TERMINAL_STATUSES = {"completed", "failed", "cancelled", "incomplete"}
+
+DEFAULT_POLL_INTERVAL = 1.0
+DEFAULT_MAX_POLL_INTERVAL = 15.0
+DEFAULT_MAX_POLL_ERRORS = 5
+
+
+class BackgroundJob:
+    """One background response being polled until it reaches a terminal status"""
+
+    def __init__(self, client, response_id: str, status: str = "queued",
+                 poll_interval: float = DEFAULT_POLL_INTERVAL,
+                 max_poll_interval: float = DEFAULT_MAX_POLL_INTERVAL,
+                 max_poll_errors: int = DEFAULT_MAX_POLL_ERRORS, resumed: bool = False):
+        self.client = client
+        self.response_id = response_id
+        self.status = status
+        self.result: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.started = time.time()
+        # Measures the whole run, from submission (or resumption) to a terminal status
+        self.trace = RequestTrace("background_job")
+        self.polls = 0
+        self.poll_interval = poll_interval
+        self.max_poll_interval = max_poll_interval
+        self.max_poll_errors = max_poll_errors
+        # A resumed job may already be finished, so check it straight away
+        self._first_delay = 0.0 if resumed else poll_interval
+        self.done = threading.Event()
+        self._cancel_requested = threading.Event()
+        self._thread = threading.Thread(target=self._poll, name=f"o3pro-poll-{response_id}", daemon=True)
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes or the timeout expires; returns True when finished"""
+        return self.done.wait(timeout)
+
+    def cancel(self):
+        """Ask the service to cancel the response and stop polling"""
+        self._cancel_requested.set()
+        try:
+            self._finish(self.client.cancel_response(self.response_id))
+        except requests.RequestException as e:
+            self.error = f"Cancel failed: {str(e)}"
+            self.status = "cancelled"
+            self.done.set()
+
+    def _finish(self, data: Dict):
+        self.result = data
+        self.status = data.get("status", self.status)
+        if self.status == "failed":
+            error = data.get("error") or {}
+            self.error = error.get("message", "Response failed")
+        get_telemetry().finish(self.trace, "ok" if self.status == "completed" else self.status, data.get("usage"))
+        self.done.set()
+
+    def _poll(self):
+        """Poll with exponential backoff until the response reaches a terminal status"""
+        delay = self._first_delay
+        errors = 0
+        while not self._cancel_requested.wait(delay):
+            try:
+                data = self.client.retrieve_response(self.response_id)
+                errors = 0
+            except requests.RequestException as e:
+                errors += 1
+                if errors >= self.max_poll_errors:
+                    self.error = f"Polling failed: {str(e)}"
+                    self.status = "failed"
+                    self.done.set()
+                    return
+                data = None
+            finally:
+                self.polls += 1
+                # A failed poll backs off too, so a struggling service is not hit in a tight loop
+                delay = min(max(delay * 2, self.poll_interval), self.max_poll_interval)
+
+            if data is None:
+                continue
+            self.status = data.get("status", self.status)
+            if self.status in TERMINAL_STATUSES:
+                if not self._cancel_requested.is_set():
+                    self._finish(data)
+                return
+
+
+class BackgroundJobs:
+    """Process-wide registry of background jobs, keyed by response id"""
+
+    def __init__(self):
+        self._jobs: Dict[str, BackgroundJob] = {}
+        self._lock = threading.Lock()
+
+    def submit(self, client, messages, poll_interval: float = DEFAULT_POLL_INTERVAL,
+               previous_response_id: Optional[str] = None, pool=None,
+               raise_errors: bool = False, input_tokens: Optional[int] = None) -> Optional[BackgroundJob]:
+        """Submit messages in background mode and start polling for the result
+
+        The create request goes to `pool` when given, e.g. a shared
+        RequestExecutor queue; status polls stay on the job's own thread.
+        Returns None if the submission fails, or with raise_errors raises
+        the client's ResponseError.
+        """
+        options = {"background": True, "previous_response_id": previous_response_id,
+                   "raise_errors": raise_errors, "input_tokens": input_tokens}
+        if pool is None:
+            response = client.create_chat_completion(messages, **options)
+        else:
+            response = pool.submit(client.create_chat_completion, messages, **options).result()
+        if not response or "id" not in response:
+            return None
+        job = BackgroundJob(client, response["id"], response.get("status", "queued"), poll_interval=poll_interval)
+        if job.status in TERMINAL_STATUSES:
+            job._finish(response)
+        with self._lock:
+            self._jobs[job.response_id] = job
+        return job.start() if not job.done.is_set() else job
+
+    def attach(self, client, response_id: str, poll_interval: float = DEFAULT_POLL_INTERVAL) -> BackgroundJob:
+        """Return the job for a response id, resuming polling if this process has not seen it"""
+        with self._lock:
+            job = self._jobs.get(response_id)
+            if job is None:
+                job = BackgroundJob(client, response_id, "in_progress", poll_interval=poll_interval, resumed=True)
+                self._jobs[response_id] = job
+                job.start()
+        return job
+
+    def get(self, response_id: str) -> Optional[BackgroundJob]:
+        with self._lock:
+            return self._jobs.get(response_id)
+
+    def forget(self, response_id: str):
+        """Drop a finished job from the registry"""
+        with self._lock:
+            self._jobs.pop(response_id, None)
+
+    def in_flight(self) -> int:
+        with self._lock:
+            return sum(1 for job in self._jobs.values() if not job.done.is_set())
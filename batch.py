@@ -0,0 +1,299 @@
+"""Headless batch runner for prompt sets against O3-Pro
+
+Usage:
+    python batch.py run prompts.jsonl --output results.jsonl [--workers 4] [--rpm 30] [--tpm 100000]
+    python batch.py export prompts.jsonl batch_input.jsonl
+    python batch.py import-results batch_output.jsonl results.jsonl
+
+Each prompt line is a JSON object such as
+    {"id": "q1", "prompt": "...", "system_prompt": "...", "files": ["spec.pdf"]}
+Only "prompt" is required; "id" defaults to the line number.
+
+`run` appends one result per line to the output as requests finish and
+skips ids that already completed there, so an interrupted run resumes
+where it stopped. `export` writes an Azure OpenAI Batch API input file
+and `import-results` converts a Batch API output file to result lines.
+"""
+import argparse
+import json
+import logging
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set
+
+from dotenv import load_dotenv
+
+from client import AzureO3ProClient
+from extractors import MIME_TYPES_BY_SUFFIX, ExtractionError
+from ingestion import TextStore, text_store_from_env
+from prompt_budget import DEFAULT_INPUT_BUDGET, TokenCounter, assemble_messages
+from rate_limit import ThroughputController, controller_from_env, set_controller
+from response_cache import response_cache_from_env
+from telemetry import get_telemetry, metrics_server_from_env
+
+logger = logging.getLogger("batch")
+
+DEFAULT_SYSTEM_PROMPT = "You are a helpful AI assistant powered by O3-Pro."
+DEFAULT_WORKERS = 4
+DEFAULT_BATCH_URL = "/v1/responses"
+
+
+def iter_prompts(path: str) -> Iterator[Dict]:
+    """Yield prompt items one line at a time"""
+    with open(path, encoding="utf-8") as prompts:
+        for number, line in enumerate(prompts, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            item = json.loads(line)
+            item.setdefault("id", str(number))
+            yield item
+
+
+def load_completed_ids(path: str) -> Set[str]:
+    """Ids that already completed in an earlier run of the same output file"""
+    completed = set()
+    if not Path(path).exists():
+        return completed
+    with open(path, encoding="utf-8") as results:
+        for line in results:
+            try:
+                result = json.loads(line)
+            except json.JSONDecodeError:
+                # A run killed mid-write can leave a partial last line
+                continue
+            if result.get("status") == "completed":
+                completed.add(str(result.get("id")))
+    return completed
+
+
+class ResultWriter:
+    """Appends results to a JSONL file as they finish, flushed line by line"""
+
+    def __init__(self, path: str):
+        # Start on a fresh line if an interrupted run left a partial one
+        needs_newline = False
+        if Path(path).exists() and Path(path).stat().st_size:
+            with open(path, "rb") as existing:
+                existing.seek(-1, 2)
+                needs_newline = existing.read(1) != b"\n"
+        self._file = open(path, "a", encoding="utf-8")
+        if needs_newline:
+            self._file.write("\n")
+        # Reentrant so callers can hold it around a write and their own tallies
+        self.lock = threading.RLock()
+        self.written = 0
+
+    def write(self, result: Dict):
+        line = json.dumps(result, ensure_ascii=False)
+        with self.lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+            self.written += 1
+
+    def close(self):
+        self._file.close()
+
+
+class PromptBuilder:
+    """Turns prompt items into request messages, extracting each attached file once
+
+    Extracted text goes to the app's on-disk text store, so files already
+    attached in the app, or in an earlier run, are not parsed again.
+    """
+
+    def __init__(self, system_prompt: str, input_budget: int, store: Optional[TextStore] = None):
+        self.system_prompt = system_prompt
+        self.input_budget = input_budget
+        self.store = store or text_store_from_env()
+        self.counter = TokenCounter()
+
+    def file_text(self, path: str) -> str:
+        file_type = MIME_TYPES_BY_SUFFIX.get(Path(path).suffix.lower(), "text/plain")
+        with open(path, "rb") as file:
+            attachment = self.store.ingest(file, Path(path).name, file_type, logger)
+        text = self.store.read(attachment.key) if attachment else None
+        if text is None:
+            # The reason has been logged by the store
+            raise ExtractionError(f"No text extracted from {path}")
+        return text
+
+    def messages(self, item: Dict) -> List[Dict]:
+        attachments = {Path(path).name: self.file_text(path) for path in item.get("files", [])}
+        history = item.get("messages") or [{"role": "user", "content": item["prompt"]}]
+        assembly = assemble_messages(
+            item.get("system_prompt", self.system_prompt), attachments, history, self.input_budget, self.counter
+        )
+        return assembly.messages
+
+
+def run_item(client: AzureO3ProClient, builder: PromptBuilder, item: Dict) -> Dict:
+    """Send one prompt and describe the outcome as a result line"""
+    result = {"id": item["id"]}
+    try:
+        messages = builder.messages(item)
+    except (OSError, KeyError, ExtractionError) as e:
+        return {**result, "status": "failed", "error": f"Could not build prompt: {str(e)}"}
+
+    start = time.perf_counter()
+    response = client.create_chat_completion(messages, stream=False)
+    result["latency"] = round(time.perf_counter() - start, 3)
+    if not response or "output" not in response:
+        return {**result, "status": "failed", "error": "No response from O3-Pro model"}
+    return {
+        **result,
+        "status": "completed",
+        "response_id": response.get("id"),
+        "output_text": client.extract_text(response),
+        "usage": response.get("usage"),
+    }
+
+
+def run_batch(args) -> int:
+    completed = load_completed_ids(args.output)
+    defaults = controller_from_env()
+    controller = ThroughputController(rpm=args.rpm or defaults.rpm, tpm=args.tpm or defaults.tpm,
+                                      max_retries=defaults.max_retries)
+    set_controller(controller)
+    client = AzureO3ProClient(response_cache_from_env())
+    builder = PromptBuilder(args.system_prompt, args.input_budget)
+    writer = ResultWriter(args.output)
+    # Bound queued work so huge prompt files are never loaded at once
+    slots = threading.BoundedSemaphore(args.workers * 2)
+    counts = {"completed": 0, "failed": 0, "skipped": 0}
+    tokens = {"input_tokens": 0, "cached_tokens": 0}
+
+    def finish(future):
+        slots.release()
+        if future.cancelled():
+            # Never sent; a resumed run picks it up
+            return
+        try:
+            result = future.result()
+        except Exception as e:
+            logger.exception("Request failed")
+            result = {"id": future.item_id, "status": "failed", "error": str(e)}
+        usage = client.usage_summary(result)
+        # Callbacks run on the worker threads
+        with writer.lock:
+            writer.write(result)
+            counts[result["status"]] += 1
+            tokens["input_tokens"] += usage["input_tokens"]
+            tokens["cached_tokens"] += usage["cached_tokens"]
+        logger.info("%s %s", result["id"], result["status"])
+
+    executor = ThreadPoolExecutor(max_workers=args.workers)
+    try:
+        for item in iter_prompts(args.prompts):
+            if str(item["id"]) in completed:
+                counts["skipped"] += 1
+                continue
+            slots.acquire()
+            future = executor.submit(run_item, client, builder, item)
+            future.item_id = item["id"]
+            future.add_done_callback(finish)
+        executor.shutdown(wait=True)
+    except KeyboardInterrupt:
+        logger.warning("Interrupted; waiting for requests in flight, then the run can be resumed")
+        # Running requests finish and are written before the writer closes; queued ones are dropped
+        executor.shutdown(wait=True, cancel_futures=True)
+        return 130
+    finally:
+        writer.close()
+
+    stats = controller.snapshot()
+    print(f"completed={counts['completed']} failed={counts['failed']} skipped={counts['skipped']} "
+          f"retries={stats['retries']} throttled={stats['throttled']} avg_wait={stats['avg_wait']:.2f}s "
+          f"input_tokens={tokens['input_tokens']} cached_tokens={tokens['cached_tokens']}")
+    for row in get_telemetry().summary():
+        if row["metric"].startswith(("request_duration", "request_ttfb")):
+            print(f"{row['metric']}: p50={row['p50']:.2f}s p95={row['p95']:.2f}s p99={row['p99']:.2f}s")
+    return 0 if counts["failed"] == 0 else 1
+
+
+def export_batch_file(args) -> int:
+    """Write prompts as an Azure OpenAI Batch API input file"""
+    client = AzureO3ProClient()
+    builder = PromptBuilder(args.system_prompt, args.input_budget)
+    with open(args.batch_file, "w", encoding="utf-8") as out:
+        for item in iter_prompts(args.prompts):
+            request = {
+                "custom_id": str(item["id"]),
+                "method": "POST",
+                "url": args.url,
+                "body": {"model": client.model, **client._build_input(builder.messages(item))},
+            }
+            out.write(json.dumps(request, ensure_ascii=False) + "\n")
+    return 0
+
+
+def import_batch_results(args) -> int:
+    """Convert an Azure OpenAI Batch API output file into result lines"""
+    client = AzureO3ProClient()
+    writer = ResultWriter(args.output)
+    try:
+        with open(args.batch_output, encoding="utf-8") as batch_output:
+            for line in batch_output:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                response = record.get("response") or {}
+                body = response.get("body") or {}
+                result = {"id": record.get("custom_id")}
+                if response.get("status_code") == 200 and "output" in body:
+                    result.update(status="completed", response_id=body.get("id"),
+                                  output_text=client.extract_text(body),
+                                  usage=body.get("usage"))
+                else:
+                    result.update(status="failed", error=record.get("error") or body.get("error"))
+                writer.write(result)
+    finally:
+        writer.close()
+    return 0
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Run prompt sets against O3-Pro without the UI")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_prompt_options(command):
+        command.add_argument("prompts", help="JSONL file of prompt items")
+        command.add_argument("--system-prompt", default=DEFAULT_SYSTEM_PROMPT,
+                             help="System prompt for items that do not set their own")
+        command.add_argument("--input-budget", type=int, default=DEFAULT_INPUT_BUDGET,
+                             help="Input token budget per request")
+
+    run = commands.add_parser("run", help="Send prompts concurrently and checkpoint results")
+    add_prompt_options(run)
+    run.add_argument("--output", required=True, help="Results JSONL, appended to and used to resume")
+    run.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent requests")
+    run.add_argument("--rpm", type=float, default=None, help="Requests per minute quota (default AZURE_OPENAI_RPM)")
+    run.add_argument("--tpm", type=float, default=None, help="Tokens per minute quota (default AZURE_OPENAI_TPM)")
+    run.set_defaults(handler=run_batch)
+
+    export = commands.add_parser("export", help="Write an Azure OpenAI Batch API input file")
+    add_prompt_options(export)
+    export.add_argument("batch_file", help="Batch input JSONL to write")
+    export.add_argument("--url", default=DEFAULT_BATCH_URL, help="Endpoint path recorded in each request line")
+    export.set_defaults(handler=export_batch_file)
+
+    imported = commands.add_parser("import-results", help="Convert a Batch API output file to result lines")
+    imported.add_argument("batch_output", help="Batch API output JSONL")
+    imported.add_argument("output", help="Results JSONL to append to")
+    imported.set_defaults(handler=import_batch_results)
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    args = build_parser().parse_args(argv)
+    metrics_server_from_env()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,128 @@
+"""Concurrent-user benchmark: requests sent from session threads vs the shared request executor
+
+Two measurements against the mock Responses API:
+
+- Many sessions at once. Each session sends streamed turns one after
+  another, either on its own thread as the app used to, or through a
+  RequestExecutor. Shows turn latency and how many requests reach the
+  service at the same time.
+- One heavy user and several light ones. The heavy user queues a burst of
+  requests, as a large-file summary does, while light users chat. Shows
+  light-user latency under a first-come-first-served pool vs the
+  executor's round robin, with and without a lower priority for the burst.
+
+Usage: python benchmarks/bench_executor.py [sessions]
+"""
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from client import AzureO3ProClient
+from executor import PRIORITY_BULK, PRIORITY_INTERACTIVE, RequestExecutor, create_completion, stream_completion
+from loadtest import mock_environment, percentile, reply_text
+from mock_server import MockResponsesServer
+
+LATENCY = "lognormal:0.3,0.3"
+TURNS = 3
+MAX_CONCURRENCY = 8
+FAIRNESS_CONCURRENCY = 4
+HEAVY_REQUESTS = 48
+LIGHT_USERS = 8
+
+
+def messages(user, turn):
+    return [{"role": "user", "content": f"Session {user}, question {turn}"}]
+
+
+def run_sessions(sessions, submit):
+    """Each session sends TURNS turns back to back; returns (turn latencies, wall time)"""
+    latencies = []
+    lock = threading.Lock()
+    ready = threading.Barrier(sessions + 1)
+
+    def session(user):
+        ready.wait()
+        for turn in range(TURNS):
+            start = time.perf_counter()
+            submit(user, turn)
+            with lock:
+                latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(user,)) for user in range(sessions)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return latencies, time.perf_counter() - start
+
+
+def sessions_at_once(sessions):
+    print(f"{sessions} sessions x {TURNS} streamed turns, {LATENCY} s latency")
+    print(f"{'model':<28} {'wall s':>7} {'p50 s':>7} {'p95 s':>7} {'upstream peak':>14}")
+    # No slot count means each session sends from its own thread
+    for slots in (None, sessions, MAX_CONCURRENCY):
+        label = f"executor, {slots} slots" if slots else "session threads"
+        with MockResponsesServer(latency=LATENCY, reply_text=reply_text(40), token_delay=0.005, seed=1) as server, \
+                mock_environment(server.url):
+            client = AzureO3ProClient()
+            if slots is None:
+                def submit(user, turn):
+                    for _ in client.create_chat_completion(messages(user, turn), stream=True, use_cache=False):
+                        pass
+            else:
+                executor = RequestExecutor(slots)
+
+                def submit(user, turn):
+                    executor.submit(str(user), stream_completion, client, messages(user, turn), use_cache=False).result()
+            latencies, wall = run_sessions(sessions, submit)
+            if slots:
+                executor.shutdown()
+            print(f"{label:<28} {wall:>7.2f} {percentile(latencies, 50):>7.2f} {percentile(latencies, 95):>7.2f} "
+                  f"{server.stats['max_in_flight']:>14}")
+
+
+def heavy_and_light():
+    print(f"\n1 user queuing {HEAVY_REQUESTS} requests + {LIGHT_USERS} users chatting, "
+          f"{FAIRNESS_CONCURRENCY} slots")
+    print(f"{'scheduling':<28} {'light p50 s':>12} {'light p95 s':>12} {'heavy done s':>13}")
+    for label in ("first come first served", "round robin", "round robin, heavy as bulk"):
+        with MockResponsesServer(latency=LATENCY, seed=1) as server, mock_environment(server.url):
+            client = AzureO3ProClient()
+            if label == "first come first served":
+                pool = ThreadPoolExecutor(FAIRNESS_CONCURRENCY)
+
+                def submit(user, fn, *args, priority=PRIORITY_INTERACTIVE, **kwargs):
+                    return pool.submit(fn, *args, **kwargs)
+            else:
+                pool = RequestExecutor(FAIRNESS_CONCURRENCY)
+                bulk = label.endswith("bulk")
+
+                def submit(user, fn, *args, priority=PRIORITY_INTERACTIVE, **kwargs):
+                    return pool.submit(user, fn, *args, priority=priority if bulk else PRIORITY_INTERACTIVE, **kwargs)
+            start = time.perf_counter()
+            heavy = [submit("heavy", create_completion, client, messages("heavy", index), priority=PRIORITY_BULK,
+                            use_cache=False) for index in range(HEAVY_REQUESTS)]
+            latencies, _ = run_sessions(LIGHT_USERS, lambda user, turn: submit(
+                str(user), create_completion, client, messages(user, turn), use_cache=False).result())
+            for future in heavy:
+                future.result()
+            heavy_done = time.perf_counter() - start
+            pool.shutdown()
+            print(f"{label:<28} {percentile(latencies, 50):>12.2f} {percentile(latencies, 95):>12.2f} "
+                  f"{heavy_done:>13.2f}")
+
+
+def main():
+    sessions = int(sys.argv[1]) if len(sys.argv) > 1 else 32
+    sessions_at_once(sessions)
+    heavy_and_light()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""Upload ingestion benchmark: whole-file extraction into session memory vs. the streaming text store
+
+Generates TXT, CSV, HTML and PDF files and ingests each in a fresh
+subprocess. The upload itself is held in memory first, as Streamlit
+does, and parsers are imported before measuring; the RSS column is how
+far peak RSS rose above that point while the file was ingested. The
+peak is reset through /proc/self/clear_refs, so this needs Linux.
+
+Usage: python benchmarks/bench_ingestion.py [size in MB] [pdf pages]
+"""
+import json
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+FORMATS = {
+    "txt": "text/plain",
+    "csv": "text/csv",
+    "html": "text/html",
+    "pdf": "application/pdf",
+}
+WORDS = ("latency throughput reasoning context document extraction parallel "
+         "budget stream process token response azure model").split()
+
+
+def make_file(kind: str, megabytes: float, pages: int) -> bytes:
+    if kind == "pdf":
+        from bench_pdf import make_pdf
+        return make_pdf(pages)
+    target = int(megabytes * 1024 * 1024)
+    lines = []
+    size = 0
+    number = 0
+    while size < target:
+        words = [WORDS[(number + i) % len(WORDS)] for i in range(10)]
+        if kind == "csv":
+            line = f"{number},{words[0]},{number * 3 % 1000},\"{' '.join(words[1:])}\"\n"
+        elif kind == "html":
+            line = f"<tr><td>{number}</td><td>{' '.join(words)}</td></tr>\n"
+        else:
+            line = " ".join(words) + "\n"
+        lines.append(line)
+        size += len(line)
+        number += 1
+    text = "".join(lines)
+    if kind == "csv":
+        text = "id,word,count,text\n" + text
+    elif kind == "html":
+        text = f"<html><body><table>{text}</table><script>ignored()</script></body></html>"
+    return text.encode("utf-8")
+
+
+def rss_kb(field: str) -> int:
+    with open("/proc/self/status") as status:
+        for line in status:
+            if line.startswith(field + ":"):
+                return int(line.split()[1])
+    raise RuntimeError(f"{field} not in /proc/self/status")
+
+
+def run_one(mode: str, kind: str, path: str):
+    """Child process: ingest one upload and report wall time and added peak RSS as JSON"""
+    import io
+
+    import docx  # noqa: F401
+    import pandas  # noqa: F401
+    import PyPDF2  # noqa: F401
+
+    from extractors import extract_text
+    from ingestion import TextStore
+
+    upload = io.BytesIO(Path(path).read_bytes())
+    # Reset the peak so reading the upload in does not mask the ingestion itself
+    with open("/proc/self/clear_refs", "w") as clear_refs:
+        clear_refs.write("5")
+    baseline = rss_kb("VmRSS")
+    start = time.perf_counter()
+    if mode == "legacy":
+        # The previous app path: copy the upload, extract it whole and keep the text in the session
+        session = {path: extract_text(upload.getvalue(), FORMATS[kind])}
+        chars = len(session[path])
+    else:
+        with tempfile.TemporaryDirectory() as store_dir:
+            # No character cap, so both modes extract the whole file
+            chars = TextStore(store_dir, max_chars=sys.maxsize).ingest(upload, path, FORMATS[kind]).chars
+    wall = time.perf_counter() - start
+    print(json.dumps({"wall": wall, "added_kb": rss_kb("VmHWM") - baseline, "chars": chars}))
+
+
+def main():
+    megabytes = float(sys.argv[1]) if len(sys.argv) > 1 else 50
+    pages = int(sys.argv[2]) if len(sys.argv) > 2 else 500
+    print(f"{'format':<6} {'upload MB':>10} {'mode':<9} {'wall s':>8} {'added peak RSS MB':>18} {'chars':>12}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for kind in FORMATS:
+            path = Path(tmp) / f"upload.{kind}"
+            path.write_bytes(make_file(kind, megabytes, pages))
+            size = path.stat().st_size / 1024 / 1024
+            for mode in ("legacy", "streamed"):
+                output = subprocess.run([sys.executable, __file__, "--run", mode, kind, str(path)],
+                                        check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{kind:<6} {size:>10.1f} {mode:<9} {result['wall']:>8.2f} "
+                      f"{result['added_kb'] / 1024:>18.1f} {result['chars']:>12}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 5 and sys.argv[1] == "--run":
+        run_one(sys.argv[2], sys.argv[3], sys.argv[4])
+    else:
+        main()
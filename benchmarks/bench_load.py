@@ -0,0 +1,49 @@
+"""Load-test suite: throughput, latency, errors and session memory against the mock Responses API
+
+Runs a fixed set of seeded scenarios, each in a fresh process so the
+shared session, quota controller and telemetry start empty, and prints
+one row per scenario. Pass a directory to keep each scenario's JSON
+summary for comparison between runs.
+
+Usage: python benchmarks/bench_load.py [output directory]
+"""
+import json
+import subprocess
+import sys
+import tempfile
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+SCENARIOS = {
+    "create, 16 users": ["client", "--users", "16", "--requests", "10"],
+    "stream, 16 users": ["client", "--users", "16", "--requests", "10", "--mode", "stream", "--token-delay", "0.01"],
+    "create, 5% 429 + 2% 503": ["client", "--users", "16", "--requests", "10",
+                                "--error-rate", "429=0.05", "--error-rate", "503=0.02"],
+    "stream, 5% failed streams": ["client", "--users", "16", "--requests", "10", "--mode", "stream",
+                                  "--stream-failure-rate", "0.05"],
+    "background, 8 users": ["client", "--users", "8", "--requests", "5", "--mode", "background"],
+    "app, 4 sessions x 3 turns": ["app", "--users", "4", "--turns", "3"],
+}
+
+
+def main():
+    output = Path(sys.argv[1]) if len(sys.argv) > 1 else Path(tempfile.mkdtemp(prefix="bench-load-"))
+    output.mkdir(parents=True, exist_ok=True)
+    print(f"{'scenario':<28} {'req/s':>7} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'ttft p50':>9} "
+          f"{'errors':>7} {'retries':>8} {'KB/session':>11}")
+    for name, args in SCENARIOS.items():
+        path = output / (name.split(",")[0].replace(" ", "_") + f"_{list(SCENARIOS).index(name)}.json")
+        subprocess.run([sys.executable, str(ROOT / "loadtest.py"), *args, "--json", str(path)],
+                       cwd=ROOT, check=True, capture_output=True, text=True)
+        result = json.loads(path.read_text(encoding="utf-8"))
+        memory = result.get("memory_per_session_kb")
+        print(f"{name:<28} {result['throughput_rps']:>7.1f} {result['latency_p50_s']:>7.2f} "
+              f"{result['latency_p95_s']:>7.2f} {result['latency_p99_s']:>7.2f} {result['ttft_p50_s']:>9.2f} "
+              f"{result['error_rate']:>7.1%} {result['retries']:>8} "
+              f"{memory['python_heap'] if memory else 0:>11,.0f}")
+    print(f"\nJSON summaries in {output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+"""PDF extraction benchmark: legacy single-threaded loop vs. PdfPageStream
+
+Generates 10/100/1000-page PDFs and runs each extractor in a fresh
+subprocess so peak RSS is measured per run. The worker column is the
+largest reaped child; pool workers forked from a forkserver are not the
+benchmark's own children and show up there only when spawn is used.
+Parallel extraction only engages on machines with more than one CPU.
+
+Usage: python benchmarks/bench_pdf.py [page counts...]
+"""
+import io
+import json
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+LINES_PER_PAGE = 45
+WORDS = ("latency throughput reasoning context document extraction parallel "
+         "budget stream process token response azure model").split()
+
+
+def make_pdf(pages: int) -> bytes:
+    """Build a plain text PDF with the given number of pages"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page in range(pages):
+        lines = []
+        for line in range(LINES_PER_PAGE):
+            words = " ".join(WORDS[(page + line + i) % len(WORDS)] for i in range(12))
+            lines.append(f"({words}) Tj T*")
+        stream = f"BT /F1 10 Tf 12 TL 50 780 Td {' '.join(lines)} ET".encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        content_ref = len(objects)
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % content_ref)
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+def legacy_extract(data: bytes) -> str:
+    """The original extract_text_from_pdf loop"""
+    import PyPDF2
+    pdf_reader = PyPDF2.PdfReader(io.BytesIO(data))
+    text = ""
+    for page in pdf_reader.pages:
+        text += page.extract_text()
+    return text
+
+
+def engine_extract(data: bytes) -> str:
+    from pdf_engine import PdfPageStream
+    return "\n".join(text for _, text in PdfPageStream(data, max_pages=None, time_budget=None))
+
+
+def run_one(mode: str, path: str):
+    """Child process: extract once and report wall time and peak RSS as JSON"""
+    data = Path(path).read_bytes()
+    extract = legacy_extract if mode == "legacy" else engine_extract
+    start = time.perf_counter()
+    text = extract(data)
+    wall = time.perf_counter() - start
+    self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    print(json.dumps({"wall": wall, "rss_kb": self_rss, "worker_rss_kb": child_rss, "chars": len(text)}))
+
+
+def main():
+    page_counts = [int(arg) for arg in sys.argv[1:]] or [10, 100, 1000]
+    print(f"{'pages':>6} {'mode':<8} {'wall s':>8} {'peak RSS MB':>12} {'worker RSS MB':>14} {'chars':>10}")
+    with tempfile.TemporaryDirectory() as tmp:
+        for pages in page_counts:
+            path = Path(tmp) / f"{pages}.pdf"
+            path.write_bytes(make_pdf(pages))
+            for mode in ("legacy", "engine"):
+                output = subprocess.run([sys.executable, __file__, "--run", mode, str(path)],
+                                        check=True, capture_output=True, text=True).stdout
+                result = json.loads(output.strip().splitlines()[-1])
+                print(f"{pages:>6} {mode:<8} {result['wall']:>8.2f} {result['rss_kb'] / 1024:>12.1f} "
+                      f"{result['worker_rss_kb'] / 1024:>14.1f} {result['chars']:>10}")
+
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == "--run":
+        run_one(sys.argv[2], sys.argv[3])
+    else:
+        main()
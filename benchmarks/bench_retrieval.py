@@ -0,0 +1,65 @@
+"""Retrieval benchmark: BM25 index build and query latency vs. corpus size
+
+Builds a synthetic corpus with a Zipf-distributed vocabulary, split into
+files of FILE_MB each, and indexes them incrementally as the app does.
+
+Usage: python benchmarks/bench_retrieval.py [corpus sizes in MB...]
+"""
+import resource
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from retrieval import BM25Index, select_passages
+
+VOCABULARY_SIZE = 50_000
+FILE_MB = 5
+QUERIES = 50
+
+
+def make_corpus(megabytes: int, rng: np.random.Generator):
+    """Yield (filename, text) pairs totalling roughly the requested size"""
+    vocabulary = np.array([f"term{i}" for i in range(VOCABULARY_SIZE)])
+    remaining = megabytes * 1_000_000
+    number = 0
+    while remaining > 0:
+        size = min(FILE_MB * 1_000_000, remaining)
+        # ~8 bytes per word including the separator
+        ids = np.minimum(rng.zipf(1.2, size // 8), VOCABULARY_SIZE) - 1
+        yield f"file{number}.txt", " ".join(vocabulary[ids])
+        remaining -= size
+        number += 1
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 10, 100]
+    rng = np.random.default_rng(0)
+    print(f"{'MB':>5} {'chunks':>9} {'build s':>9} {'MB/s':>7} {'query p50 ms':>13} {'query p95 ms':>13} {'peak RSS MB':>12}")
+    for megabytes in sizes:
+        index = BM25Index()
+        build = 0.0
+        for name, text in make_corpus(megabytes, rng):
+            start = time.perf_counter()
+            index.add_document(name, text)
+            build += time.perf_counter() - start
+            del text
+
+        latencies = []
+        for _ in range(QUERIES):
+            query = " ".join(f"term{i}" for i in rng.integers(10, 5000, size=6))
+            start = time.perf_counter()
+            select_passages(index, query)
+            latencies.append((time.perf_counter() - start) * 1000)
+        latencies.sort()
+        rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+        print(f"{megabytes:>5} {len(index):>9} {build:>9.2f} {megabytes / build:>7.2f} "
+              f"{statistics.median(latencies):>13.2f} {latencies[int(QUERIES * 0.95) - 1]:>13.2f} {rss:>12.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+"""Startup benchmark: app import time and Streamlit rerun time
+
+Import time is measured with `python -X importtime` in fresh
+subprocesses, with streamlit imported first so only the app's own
+imports count. Heavy dependencies are listed when the app imports
+them at start-up. Rerun time uses Streamlit's AppTest harness: the
+first run pays for imports and cached resources, and later runs are
+the script re-execution that follows every widget interaction, timed
+around Streamlit's script runner rather than the polling test harness.
+
+Usage: python benchmarks/bench_startup.py [processes] [reruns]
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+HEAVY_MODULES = ("openai", "PyPDF2", "docx", "tiktoken", "pandas")
+
+
+def import_times(processes: int):
+    """Median cumulative import time of the app and of heavy modules it pulls in, in ms"""
+    app_times = []
+    heavy = {}
+    for _ in range(processes):
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import streamlit; import app"],
+            cwd=ROOT, capture_output=True, text=True, check=True,
+        )
+        # importtime lists a module's imports before the module itself
+        children = []
+        for line in result.stderr.splitlines():
+            if not line.startswith("import time:") or "|" not in line:
+                continue
+            _, cumulative, name = line.split("|")
+            if not cumulative.strip().isdigit():
+                continue
+            module, ms = name.strip(), int(cumulative) / 1000
+            if name.startswith("  "):
+                children.append((module, ms))
+                continue
+            if module == "app":
+                app_times.append(ms)
+                for child, child_ms in children:
+                    if child in HEAVY_MODULES:
+                        heavy.setdefault(child, []).append(child_ms)
+            children = []
+    return statistics.median(app_times), {name: statistics.median(times) for name, times in heavy.items()}
+
+
+def rerun_times(reruns: int):
+    """Seconds for the first script run and the median of later reruns"""
+    from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+    from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+    from streamlit.testing.v1 import AppTest, local_script_runner
+
+    # AppTest polls for the script to finish, so time the script runner itself
+    durations = []
+    run_script = ScriptRunner._run_script
+
+    def timed_run_script(self, rerun_data):
+        start = time.perf_counter()
+        try:
+            run_script(self, rerun_data)
+        finally:
+            durations.append(time.perf_counter() - start)
+
+    # A server compiles the script once and reuses the bytecode; AppTest recompiles every run
+    script_cache = ScriptCache()
+    local_script_runner.ScriptCache = lambda: script_cache
+    ScriptRunner._run_script = timed_run_script
+    try:
+        app = AppTest.from_file(str(ROOT / "app.py"), default_timeout=60)
+        for _ in range(reruns + 1):
+            app.run()
+    finally:
+        ScriptRunner._run_script = run_script
+        local_script_runner.ScriptCache = ScriptCache
+    return durations[0], statistics.median(durations[1:])
+
+
+def main():
+    processes = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    reruns = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    # The app only renders here; no request is sent
+    os.environ.setdefault("AZURE_OPENAI_ENDPOINT", "https://bench.openai.azure.com/")
+    os.environ.setdefault("AZURE_OPENAI_API_KEY", "bench")
+    os.environ.setdefault("AZURE_OPENAI_MODEL", "o3-pro")
+    os.environ.setdefault("O3PRO_CONVERSATION_DB", str(Path(tempfile.mkdtemp()) / "bench.sqlite3"))
+
+    app_ms, heavy = import_times(processes)
+    print(f"import app (after streamlit)  {app_ms:8.1f} ms")
+    for name, ms in sorted(heavy.items(), key=lambda item: -item[1]):
+        print(f"  of which {name:<19} {ms:8.1f} ms")
+    if not heavy:
+        print("  no heavy parsers or SDKs imported at start-up")
+
+    first, rerun = rerun_times(reruns)
+    print(f"first script run              {first * 1000:8.1f} ms")
+    print(f"rerun (median of {reruns:<3})        {rerun * 1000:8.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Latency benchmark: one connection per request vs. the shared pooled session
+
+Usage: python benchmarks/bench_transport.py [requests]
+"""
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import requests
+
+from mock_server import MockResponsesServer
+from transport import close_session, get_session, get_timeouts
+
+PAYLOAD = {"model": "o3-pro", "input": "User: Hello!", "stream": False}
+
+
+def run(label, post, url, count):
+    """Send `count` requests with `post` and print latency percentiles"""
+    latencies = []
+    for _ in range(count):
+        start = time.perf_counter()
+        response = post(url, json=PAYLOAD, timeout=get_timeouts())
+        response.json()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    p95 = latencies[int(len(latencies) * 0.95) - 1]
+    print(f"{label:<24} mean {statistics.mean(latencies):7.2f} ms   "
+          f"p50 {statistics.median(latencies):7.2f} ms   p95 {p95:7.2f} ms")
+    return statistics.mean(latencies)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    with MockResponsesServer() as server:
+        url = f"{server.url}openai/responses?api-version=2025-04-01-preview"
+
+        before = server.stats["connections"]
+        fresh = run("requests.post (fresh)", requests.post, url, count)
+        fresh_connections = server.stats["connections"] - before
+
+        before = server.stats["connections"]
+        pooled = run("shared session (pooled)", get_session().post, url, count)
+        pooled_connections = server.stats["connections"] - before
+        close_session()
+
+    print()
+    print(f"Connections opened: fresh={fresh_connections} pooled={pooled_connections}")
+    print(f"Per-request saving: {fresh - pooled:.2f} ms "
+          "(loopback TCP only; TLS and DNS add more against Azure)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,377 @@
+"""Client for the Azure OpenAI O3-Pro responses endpoint"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+import requests
+
+from conversation import estimate_tokens, message_bytes
+from endpoints import Endpoint, EndpointPool, pool_from_env
+from rate_limit import RETRYABLE_STATUSES, ThroughputController, get_controller
+from response_cache import ResponseCache
+from telemetry import RequestTrace, active, get_telemetry, usage_tokens
+from transport import get_session, get_timeouts
+
+logger = logging.getLogger(__name__)
+
+# Response ids remembered for routing follow-up requests to the right endpoint
+MAX_PINNED_RESPONSES = 10_000
+
+
+class ResponseError(RuntimeError):
+    """A request the service refused or that could not be completed; status is None without an HTTP answer"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class AzureO3ProClient:
+    """Client for Azure OpenAI O3-Pro model"""
+    
+    def __init__(self, response_cache: Optional[ResponseCache] = None, report=logger,
+                 controller: Optional[ThroughputController] = None, pool: Optional[EndpointPool] = None):
+        # Requests are routed across the configured endpoints; the first one is the primary
+        self.pool = pool or pool_from_env()
+        primary = self.pool.primary
+        self.endpoint = primary.url
+        self.api_version = primary.api_version
+        self.model = primary.model
+        # Stored responses only exist on the endpoint that created them
+        self._pinned: "OrderedDict[str, Endpoint]" = OrderedDict()
+        self._pinned_lock = threading.Lock()
+        
+        # Reuse pooled keep-alive connections across turns and sessions
+        self.session = get_session()
+        self.timeout = get_timeouts()
+        
+        # Admission control and retries shared with every other client in the process
+        self.controller = controller or get_controller()
+        
+        # Optional cache of completed responses for identical inputs
+        self.response_cache = response_cache
+        
+        # Anything with error()/warning(): a logger by default, the st module in the app
+        self.report = report
+        
+        # Latency and token metrics shared with every other client in the process
+        self.telemetry = get_telemetry()
+    
+    def create_chat_completion(self, messages: List[Dict], stream: bool = False, background: bool = False,
+                               previous_response_id: Optional[str] = None, use_cache: bool = True,
+                               reasoning_effort: Optional[str] = None, raise_errors: bool = False,
+                               input_tokens: Optional[int] = None):
+        """Create chat completion using Azure OpenAI O3-Pro responses endpoint
+        
+        With background=True the request returns immediately with a queued
+        response whose id can be polled with retrieve_response. With
+        previous_response_id only the new messages need to be passed; the
+        service continues from the stored conversation. Foreground requests
+        are answered from the response cache when one is configured and
+        use_cache is set; those responses carry "cache_hit": True, as their
+        ids may have expired on the service. reasoning_effort ("low", "medium" or "high")
+        overrides the deployment's default reasoning effort.
+        
+        input_tokens is the estimated size of the whole prompt the service
+        bills, which for a chained turn includes the stored conversation,
+        and is charged against the TPM quota; by default the messages sent
+        are estimated.
+        
+        Failures are reported and return None, or with raise_errors raise
+        ResponseError, for callers on worker threads where the reporter
+        cannot reach the user.
+        """
+        trace = RequestTrace("background" if background else "stream" if stream else "create")
+        try:
+            # Native instructions plus typed input items
+            request_input = self._build_input(messages)
+            
+            # Chained turns depend on server-side state, so only self-contained inputs are cached
+            cache_key = None
+            if self.response_cache and use_cache and not background and not previous_response_id:
+                options = {"reasoning_effort": reasoning_effort} if reasoning_effort else {}
+                cache_key = self.response_cache.key(self.model, self.api_version, request_input, **options)
+                cached = self.response_cache.get(cache_key)
+                if cached is not None:
+                    cached["cache_hit"] = True
+                    self.telemetry.finish(trace, "cache_hit")
+                    return self._replay_cached_response(cached) if stream else cached
+            
+            # O3-Pro specific payload format
+            payload = {
+                "model": self.model,
+                **request_input,
+                "stream": stream
+            }
+            if reasoning_effort:
+                payload["reasoning"] = {"effort": reasoning_effort}
+            if background:
+                payload["background"] = True
+                payload["store"] = True
+            if previous_response_id:
+                payload["previous_response_id"] = previous_response_id
+                payload["store"] = True
+            
+            pinned = self._endpoint_for(previous_response_id) if previous_response_id else None
+            if input_tokens is None:
+                input_tokens = estimate_tokens(message_bytes(messages))
+            response, endpoint = self._post_with_retries(payload, stream, input_tokens, trace, pinned)
+            
+            if response.status_code == 200:
+                if stream:
+                    events = self._handle_streaming_response(response, endpoint, trace, raise_errors)
+                    return self._cache_streamed_response(events, cache_key) if cache_key else events
+                else:
+                    body = response.json()
+                    self._pin(body.get("id"), endpoint)
+                    if cache_key and body.get("status", "completed") == "completed":
+                        self.response_cache.put(cache_key, body)
+                    self.telemetry.finish(trace, "ok", body.get("usage"))
+                    return body
+            else:
+                self.telemetry.finish(trace, "error")
+                return self._fail(f"API Error {response.status_code}: {response.text}", raise_errors,
+                                  response.status_code)
+                
+        except ResponseError:
+            raise
+        except Exception as e:
+            self.telemetry.finish(trace, "error")
+            return self._fail(f"Error calling Azure OpenAI: {str(e)}", raise_errors)
+    
+    def _fail(self, message: str, raise_errors: bool, status: Optional[int] = None) -> None:
+        if raise_errors:
+            raise ResponseError(message, status)
+        self.report.error(message)
+        return None
+    
+    def _post_with_retries(self, payload: Dict, stream: bool, tokens: int, trace: RequestTrace,
+                           pinned: Optional[Endpoint] = None) -> Tuple[requests.Response, Endpoint]:
+        """POST under admission control, failing over and retrying throttled and transient failures
+        
+        A failed request moves straight on to another available endpoint;
+        once none is left it backs off and starts over. Only connection
+        failures are retried, not read timeouts: the service may still be
+        working on a request whose answer we stopped waiting for. A 200
+        stream keeps its endpoint counted as outstanding until it is read.
+        """
+        attempt = 0
+        tried = set()
+        while True:
+            endpoint = self.pool.acquire(exclude=tried, pinned=pinned)
+            try:
+                # Quotas are per deployment, so only this endpoint's buckets and pauses apply
+                self.controller.admit(tokens, endpoint.name)
+            except BaseException:
+                self.pool.release(endpoint)
+                raise
+            start = time.monotonic()
+            try:
+                with active(trace):
+                    response = self.session.post(
+                        endpoint.responses_url,
+                        headers=endpoint.headers,
+                        json={**payload, "model": endpoint.model},
+                        stream=stream,
+                        timeout=self.timeout
+                    )
+            except requests.ConnectionError:
+                self.telemetry.record_attempt(trace, endpoint.name, None, None)
+                self.pool.record(endpoint, ok=False)
+                self.pool.release(endpoint)
+                status = None
+            except Exception:
+                self.pool.record(endpoint, ok=False)
+                self.pool.release(endpoint)
+                raise
+            else:
+                status = response.status_code
+                # requests measures elapsed up to the parsed response headers
+                self.telemetry.record_attempt(trace, endpoint.name, status, response.elapsed.total_seconds())
+                exhausted = self.controller.observe(response.headers, endpoint.name)
+                if exhausted:
+                    # Route around the endpoint until its quota resets
+                    self.pool.hold(endpoint, exhausted)
+                if status != 429:
+                    # Throttling says nothing about the endpoint's health; it is only held back below
+                    self.pool.record(endpoint, ok=status not in RETRYABLE_STATUSES, latency=time.monotonic() - start)
+                if status not in RETRYABLE_STATUSES:
+                    if not (stream and status == 200):
+                        self.pool.release(endpoint)
+                    return response, endpoint
+                self.pool.release(endpoint)
+            
+            tried.add(endpoint)
+            hinted = self.controller.retry_delay(attempt, response.headers if status else None)
+            if status == 429:
+                self.controller.record("throttled")
+                self.pool.hold(endpoint, hinted)
+                self.controller.pause(hinted, endpoint.name)
+            reason = f"HTTP {status}" if status else "connection error"
+            if pinned is None and self.pool.has_available(exclude=tried):
+                # Fail over right away instead of waiting on this endpoint
+                delay = 0.0
+                logger.info("Failing over from %s after %s", endpoint.name, reason)
+            else:
+                if attempt >= self.controller.max_retries:
+                    self.controller.record("gave_up")
+                    if status is None:
+                        raise requests.ConnectionError(f"Could not connect to {endpoint.name}")
+                    return response, endpoint
+                delay = hinted
+                tried.clear()
+                attempt += 1
+                logger.info("Retrying after %s in %.2fs (attempt %d)", reason, delay, attempt)
+            if status:
+                response.close()
+            self.controller.record("retries")
+            time.sleep(delay)
+    
+    def _pin(self, response_id: Optional[str], endpoint: Endpoint):
+        if not response_id:
+            return
+        with self._pinned_lock:
+            self._pinned[response_id] = endpoint
+            self._pinned.move_to_end(response_id)
+            while len(self._pinned) > MAX_PINNED_RESPONSES:
+                self._pinned.popitem(last=False)
+    
+    def _endpoint_for(self, response_id: str) -> Endpoint:
+        """Endpoint that created a response; unknown ids (e.g. from before a restart) use the primary"""
+        with self._pinned_lock:
+            return self._pinned.get(response_id, self.pool.primary)
+    
+    def _replay_cached_response(self, body: Dict):
+        """Yield a cached response as the events a live stream would produce"""
+        text = self.extract_text(body) or ""
+        yield {"type": "response.output_text.delta", "delta": text}
+        yield {"type": "response.completed", "response": body}
+    
+    def _cache_streamed_response(self, events, cache_key: str):
+        """Pass stream events through, storing the completed response"""
+        for event in events:
+            if event.get("type") == "response.completed" and event.get("response"):
+                self.response_cache.put(cache_key, event["response"])
+            yield event
+    
+    def retrieve_response(self, response_id: str) -> Dict:
+        """Fetch the current state of a background response; raises on HTTP errors"""
+        endpoint = self._endpoint_for(response_id)
+        response = self.session.get(endpoint.response_url(response_id), headers=endpoint.headers, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def cancel_response(self, response_id: str) -> Dict:
+        """Cancel a background response that is still queued or in progress; raises on HTTP errors"""
+        endpoint = self._endpoint_for(response_id)
+        response = self.session.post(endpoint.response_url(response_id, "cancel"), headers=endpoint.headers,
+                                     timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+    
+    def _build_input(self, messages: List[Dict]) -> Dict:
+        """Convert chat messages to Responses API instructions and typed message items
+        
+        The leading system message (system prompt and attachments) becomes
+        `instructions`, a byte-stable prefix that the service's prompt cache
+        can match on every turn. Message contents are passed through as-is
+        rather than concatenated into one string.
+        """
+        request_input = {}
+        if messages and messages[0].get("role") == "system":
+            request_input["instructions"] = messages[0].get("content", "")
+            messages = messages[1:]
+        
+        items = []
+        for message in messages:
+            role = message.get("role", "")
+            if role not in ("system", "user", "assistant"):
+                continue
+            content_type = "output_text" if role == "assistant" else "input_text"
+            items.append({
+                "type": "message",
+                "role": role,
+                "content": [{"type": content_type, "text": message.get("content", "")}]
+            })
+        request_input["input"] = items
+        return request_input
+    
+    def _handle_streaming_response(self, response, endpoint: Optional[Endpoint] = None,
+                                   trace: Optional[RequestTrace] = None, raise_errors: bool = False):
+        """Parse server-sent events from O3-Pro into event dicts"""
+        completed = None
+        try:
+            event_type = None
+            data_lines = []
+            # chunk_size=None hands each network chunk over as soon as it arrives
+            for line in response.iter_lines(chunk_size=None):
+                line = line.decode('utf-8') if isinstance(line, bytes) else line
+                if line:
+                    if line.startswith('event:'):
+                        event_type = line[6:].strip()
+                    elif line.startswith('data:'):
+                        data_lines.append(line[5:].lstrip())
+                    continue
+                # A blank line terminates the current event
+                event = self._parse_sse_event(event_type, data_lines)
+                event_type, data_lines = None, []
+                if event is not None:
+                    completed = self._track_event(event, endpoint, trace) or completed
+                    yield event
+            event = self._parse_sse_event(event_type, data_lines)
+            if event is not None:
+                completed = self._track_event(event, endpoint, trace) or completed
+                yield event
+        except Exception as e:
+            self._fail(f"Error processing streaming response: {str(e)}", raise_errors)
+        finally:
+            response.close()
+            if endpoint is not None:
+                self.pool.release(endpoint)
+            if trace is not None:
+                self.telemetry.finish(trace, "ok" if completed else "error", (completed or {}).get("usage"))
+    
+    def _track_event(self, event: Dict, endpoint: Optional[Endpoint], trace: Optional[RequestTrace]) -> Optional[Dict]:
+        """Pin the endpoint holding the streamed response and time the first token; returns a completed response"""
+        if endpoint is not None and isinstance(event.get("response"), dict):
+            self._pin(event["response"].get("id"), endpoint)
+        if event.get("type") == "response.output_text.delta" and trace is not None:
+            trace.first_token()
+        elif event.get("type") == "response.completed":
+            return event.get("response")
+        return None
+    
+    def _parse_sse_event(self, event_type, data_lines):
+        """Decode one server-sent event, returning None for keep-alives and [DONE]"""
+        data = "\n".join(data_lines)
+        if not data or data == '[DONE]':
+            return None
+        try:
+            event = json.loads(data)
+        except json.JSONDecodeError:
+            return None
+        if event_type and 'type' not in event:
+            event['type'] = event_type
+        return event
+    
+    @staticmethod
+    def usage_summary(response_data: Optional[Dict]) -> Dict:
+        """Input, cached, output and reasoning token counts from a response's usage block"""
+        return {f"{kind}_tokens": count for kind, count in usage_tokens((response_data or {}).get("usage")).items()}
+    
+    def extract_text(self, response_data):
+        """Text of a response's first output message, or None when it has none"""
+        try:
+            if 'output' in response_data:
+                for output_item in response_data['output']:
+                    if output_item.get('type') == 'message' and 'content' in output_item:
+                        for content_item in output_item['content']:
+                            if content_item.get('type') == 'output_text':
+                                return content_item.get('text', '')
+            return None
+        except Exception as e:
+            self.report.error(f"Error extracting content from response: {str(e)}")
+            return None
@@ -0,0 +1,157 @@
+"""Fan-out of one question across system prompts and reasoning efforts, run concurrently"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, NamedTuple, Optional
+
+from pricing import Pricing
+from telemetry import usage_tokens
+
+REASONING_EFFORTS = ("low", "medium", "high")
+# Variant requests in flight at once for a CompareRunner
+DEFAULT_MAX_CONCURRENCY = 4
+
+
+class Variant(NamedTuple):
+    """One way of asking the question; no reasoning effort means the deployment default"""
+    label: str
+    system_prompt: str
+    reasoning_effort: Optional[str] = None
+
+
+class VariantRun:
+    """One variant's answer, filled in by a worker thread as it streams and read by the UI"""
+
+    def __init__(self, variant: Variant, messages: List[Dict]):
+        self.variant = variant
+        self.messages = messages
+        self.status = "queued"
+        self.parts: List[str] = []
+        self.response: Optional[Dict] = None
+        self.error: Optional[str] = None
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.latency: Optional[float] = None
+        self.done = threading.Event()
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def queued_for(self) -> float:
+        """Seconds spent waiting for a free slot under the concurrency cap"""
+        return (self.started or time.perf_counter()) - self.submitted
+
+    def metrics(self, pricing: Pricing) -> Dict:
+        """Latency, token and cost figures for side-by-side display"""
+        usage = (self.response or {}).get("usage")
+        tokens = usage_tokens(usage)
+        return {
+            "variant": self.variant.label,
+            "status": self.status,
+            "latency_s": self.latency,
+            "ttft_s": self.ttft,
+            "queued_s": self.queued_for,
+            "input_tokens": tokens["input"],
+            "cached_tokens": tokens["cached"],
+            "output_tokens": tokens["output"],
+            "reasoning_tokens": tokens["reasoning"],
+            "cost_usd": pricing.cost(usage),
+        }
+
+
+def run_variant(client, run: VariantRun, stream: bool = True, use_cache: bool = True) -> VariantRun:
+    """Send one variant and record its answer; errors are kept on the run rather than raised"""
+    run.status = "running"
+    run.started = time.perf_counter()
+    effort = run.variant.reasoning_effort
+    try:
+        if stream:
+            events = client.create_chat_completion(run.messages, stream=True, use_cache=use_cache,
+                                                   reasoning_effort=effort, raise_errors=True)
+            for event in events or ():
+                event_type = event.get("type")
+                if event_type == "response.output_text.delta":
+                    if run.ttft is None:
+                        run.ttft = time.perf_counter() - run.started
+                    run.parts.append(event.get("delta", ""))
+                elif event_type == "response.completed":
+                    run.response = event.get("response")
+                elif event_type in ("response.failed", "error"):
+                    error = event.get("error") or (event.get("response") or {}).get("error") or {}
+                    run.error = error.get("message", "unknown error")
+        else:
+            run.response = client.create_chat_completion(run.messages, stream=False, use_cache=use_cache,
+                                                         reasoning_effort=effort, raise_errors=True)
+        if not run.parts and run.response and "output" in run.response:
+            # Non-streamed and cached answers arrive whole
+            run.parts.append(client.extract_text(run.response) or "")
+            run.ttft = time.perf_counter() - run.started
+    except Exception as e:
+        run.error = str(e)
+    finally:
+        run.latency = time.perf_counter() - run.started
+        if not run.text and not run.error:
+            run.error = "No response from O3-Pro model"
+        run.status = "failed" if run.error else "completed"
+        run.done.set()
+    return run
+
+
+class Comparison:
+    """A set of variant runs started together"""
+
+    def __init__(self, runs: List[VariantRun]):
+        self.runs = runs
+        self.started = time.perf_counter()
+
+    @property
+    def done(self) -> bool:
+        return all(run.done.is_set() for run in self.runs)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until every run finishes or the timeout expires; returns True when all finished"""
+        deadline = None if timeout is None else time.perf_counter() + timeout
+        for run in self.runs:
+            remaining = None if deadline is None else max(0.0, deadline - time.perf_counter())
+            if not run.done.wait(remaining):
+                return False
+        return True
+
+    @property
+    def wall_time(self) -> float:
+        """Seconds from the start until the slowest run finished, or until now"""
+        if not self.done:
+            return time.perf_counter() - self.started
+        return max(run.started + run.latency for run in self.runs) - self.started
+
+    @property
+    def sequential_time(self) -> float:
+        """What the same runs would have taken one after another"""
+        return sum(run.latency or 0.0 for run in self.runs)
+
+
+def start_comparison(client, runs: List[VariantRun], pool, stream: bool = True,
+                     use_cache: bool = True) -> Comparison:
+    """Submit every run to `pool` and return at once; runs beyond its capacity queue for a free slot"""
+    comparison = Comparison(runs)
+    for run in runs:
+        pool.submit(run_variant, client, run, stream, use_cache)
+    return comparison
+
+
+class CompareRunner:
+    """Pool of its own that caps how many variant requests run at once, for use outside the app"""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="o3pro-compare")
+
+    def start(self, client, runs: List[VariantRun], stream: bool = True, use_cache: bool = True) -> Comparison:
+        """Submit every run and return at once; runs beyond the cap queue for a free slot"""
+        return start_comparison(client, runs, self._executor, stream, use_cache)
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
@@ -0,0 +1,26 @@
+from contextlib import ExitStack
+from typing import Dict, Optional
+
+import pytest
+
+from mock_server import MockResponsesServer
+
+
+@pytest.fixture
+def mock_server(monkeypatch):
+    """Factory for mock Responses API servers that the client finds through the environment
+
+    `env` sets further variables; other options go to MockResponsesServer.
+    Servers are stopped at teardown.
+    """
+    with ExitStack() as stack:
+        def start(env: Optional[Dict[str, str]] = None, **options) -> MockResponsesServer:
+            server = stack.enter_context(MockResponsesServer(**options))
+            monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", server.url)
+            monkeypatch.setenv("AZURE_OPENAI_API_KEY", "test-key")
+            monkeypatch.setenv("AZURE_OPENAI_MODEL", "o3-pro")
+            for name, value in (env or {}).items():
+                monkeypatch.setenv(name, value)
+            return server
+
+        yield start
@@ -0,0 +1,60 @@
+"""Server-side conversation chaining with previous_response_id"""
+import hashlib
+from typing import Dict, List, Optional, Tuple
+
+# Rough bytes-per-token ratio for English text, used for savings estimates
+BYTES_PER_TOKEN = 4
+
+
+def estimate_tokens(num_bytes: int) -> int:
+    """Approximate token count for a payload of the given size"""
+    return num_bytes // BYTES_PER_TOKEN
+
+
+def message_bytes(messages: List[Dict]) -> int:
+    """UTF-8 size of the message contents, without building the request"""
+    return sum(len(message.get("content", "").encode("utf-8")) for message in messages)
+
+
+def fingerprint(message: Dict) -> str:
+    """Stable hash of a message, used to detect edits to the system prompt or files"""
+    data = f"{message.get('role', '')}\0{message.get('content', '')}".encode("utf-8")
+    return hashlib.sha256(data).hexdigest()
+
+
+class ConversationChain:
+    """Tracks the last stored response so later turns only send new messages
+
+    The first message is the system prompt with the attached files. It is
+    sent as `instructions`, which the service does not carry over from the
+    previous response, so it is included in every turn. Editing it,
+    clearing the chat, or any failed turn invalidates the chain and the
+    next turn resends the full history.
+    """
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.response_id: Optional[str] = None
+        self.prefix_fingerprint: Optional[str] = None
+        self.covered = 0
+
+    def prepare(self, messages: List[Dict]) -> Tuple[List[Dict], Optional[str]]:
+        """Return (messages to send, previous_response_id) for the next request"""
+        if (self.response_id and messages
+                and fingerprint(messages[0]) == self.prefix_fingerprint
+                and len(messages) > self.covered):
+            prefix = messages[:1] if messages[0].get("role") == "system" else []
+            return prefix + messages[self.covered:], self.response_id
+        self.reset()
+        return messages, None
+
+    def record(self, response_id: Optional[str], messages: List[Dict]):
+        """Remember the response that now holds every message in `messages`"""
+        if not response_id or not messages:
+            self.reset()
+            return
+        self.response_id = response_id
+        self.prefix_fingerprint = fingerprint(messages[0])
+        self.covered = len(messages)
@@ -0,0 +1,229 @@
+"""Persistent SQLite store of conversations, messages and saved system prompts"""
+import re
+import sqlite3
+import threading
+import time
+import uuid
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+DEFAULT_PATH = "~/.local/share/o3-pro/conversations.sqlite3"
+TITLE_CHARS = 60
+# Conversation ids and owner tokens: random, so they cannot be guessed from one another
+TOKEN_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    title TEXT,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    updated REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS conversations_owner_updated ON conversations (owner, updated);
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY,
+    conversation_id TEXT NOT NULL REFERENCES conversations (id),
+    position INTEGER NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    created REAL NOT NULL,
+    UNIQUE (conversation_id, position)
+);
+CREATE TABLE IF NOT EXISTS saved_prompts (
+    name TEXT PRIMARY KEY,
+    prompt TEXT NOT NULL,
+    updated REAL NOT NULL
+);
+"""
+
+_FTS_SCHEMA = """
+CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5(content, content='messages', content_rowid='id');
+CREATE TRIGGER IF NOT EXISTS messages_fts_insert AFTER INSERT ON messages BEGIN
+    INSERT INTO messages_fts (rowid, content) VALUES (new.id, new.content);
+END;
+CREATE TRIGGER IF NOT EXISTS messages_fts_delete AFTER DELETE ON messages BEGIN
+    INSERT INTO messages_fts (messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+END;
+"""
+
+
+def new_token() -> str:
+    """A random id for a conversation or an owner"""
+    return uuid.uuid4().hex
+
+
+def _fts_query(text: str) -> str:
+    """Match every word of free text, quoted so FTS operators in it are taken literally"""
+    return " ".join('"' + word.replace('"', '""') + '"' for word in text.split())
+
+
+class ConversationStore:
+    """SQLite-backed conversation history shared by every session and process
+
+    Every conversation belongs to an owner token, and listing, search,
+    opening and deletion only ever see the caller's own conversations;
+    saved prompts are shared. Messages are loaded a window at a time, so a
+    session never has to hold a whole conversation in memory. WAL mode
+    lets sessions read while one writes; each thread uses its own
+    connection. Full-text search uses FTS5 when the SQLite build has it and
+    falls back to LIKE otherwise.
+    """
+
+    def __init__(self, path: str = DEFAULT_PATH):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        conn = self._connection()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(_SCHEMA)
+        try:
+            conn.executescript(_FTS_SCHEMA)
+            self.full_text = True
+        except sqlite3.OperationalError:
+            self.full_text = False
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def create_conversation(self, owner: str, title: Optional[str] = None) -> str:
+        now = time.time()
+        conversation_id = new_token()
+        self._connection().execute(
+            "INSERT INTO conversations (id, owner, title, created, updated) VALUES (?, ?, ?, ?, ?)",
+            (conversation_id, owner, title, now, now)
+        )
+        return conversation_id
+
+    def conversation(self, conversation_id: str, owner: str) -> Optional[Dict]:
+        """The conversation, or None when it does not exist or belongs to someone else"""
+        row = self._connection().execute(
+            "SELECT id, title, message_count, created, updated FROM conversations WHERE id = ? AND owner = ?",
+            (conversation_id, owner)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_conversations(self, owner: str, limit: int = 20, offset: int = 0) -> List[Dict]:
+        """The owner's most recently active conversations first"""
+        rows = self._connection().execute(
+            "SELECT id, title, message_count, created, updated FROM conversations WHERE owner = ?"
+            " ORDER BY updated DESC LIMIT ? OFFSET ?", (owner, limit, offset)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def delete_conversation(self, conversation_id: str, owner: str):
+        """Delete one of the owner's conversations; other owners' conversations are left alone"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            if conn.execute("DELETE FROM conversations WHERE id = ? AND owner = ?", (conversation_id, owner)).rowcount:
+                conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def append_message(self, conversation_id: str, role: str, content: str) -> int:
+        """Add a message to the end of a conversation; returns its position"""
+        now = time.time()
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT message_count, title FROM conversations WHERE id = ?", (conversation_id,)
+            ).fetchone()
+            if row is None:
+                raise KeyError(f"No conversation {conversation_id}")
+            position = row["message_count"]
+            conn.execute(
+                "INSERT INTO messages (conversation_id, position, role, content, created) VALUES (?, ?, ?, ?, ?)",
+                (conversation_id, position, role, content, now)
+            )
+            # The first question names the conversation
+            title = row["title"] or (" ".join(content.split())[:TITLE_CHARS] if role == "user" else None)
+            conn.execute(
+                "UPDATE conversations SET message_count = ?, title = ?, updated = ? WHERE id = ?",
+                (position + 1, title, now, conversation_id)
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return position
+
+    def message_count(self, conversation_id: str) -> int:
+        row = self._connection().execute(
+            "SELECT message_count FROM conversations WHERE id = ?", (conversation_id,)
+        ).fetchone()
+        return row["message_count"] if row else 0
+
+    def messages(self, conversation_id: str, offset: int = 0, limit: int = -1) -> List[Dict]:
+        """A page of messages in conversation order"""
+        rows = self._connection().execute(
+            "SELECT role, content FROM messages WHERE conversation_id = ? AND position >= ?"
+            " ORDER BY position LIMIT ?", (conversation_id, offset, limit)
+        ).fetchall()
+        return [{"role": row["role"], "content": row["content"]} for row in rows]
+
+    def recent_messages(self, conversation_id: str, max_bytes: int) -> Tuple[List[Dict], int]:
+        """The newest messages totalling at most `max_bytes`, and the position of the first one
+
+        The newest message is always included. Rows are read newest first
+        and reading stops at the budget, so older history is never loaded.
+        """
+        rows = self._connection().execute(
+            "SELECT position, role, content, length(CAST(content AS BLOB)) AS size FROM messages"
+            " WHERE conversation_id = ? ORDER BY position DESC", (conversation_id,)
+        )
+        window = []
+        used = 0
+        first = self.message_count(conversation_id)
+        for row in rows:
+            if window and used + row["size"] > max_bytes:
+                break
+            window.append({"role": row["role"], "content": row["content"]})
+            used += row["size"]
+            first = row["position"]
+        rows.close()
+        window.reverse()
+        return window, first
+
+    def search(self, owner: str, query: str, limit: int = 20) -> List[Dict]:
+        """The owner's messages matching every word of the query, best matches first"""
+        if not query.strip():
+            return []
+        conn = self._connection()
+        if self.full_text:
+            rows = conn.execute(
+                "SELECT m.conversation_id, c.title, m.position, m.role,"
+                " snippet(messages_fts, 0, '**', '**', '…', 12) AS snippet"
+                " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+                " JOIN conversations c ON c.id = m.conversation_id"
+                " WHERE messages_fts MATCH ? AND c.owner = ? ORDER BY rank LIMIT ?", (_fts_query(query), owner, limit)
+            ).fetchall()
+        else:
+            words = query.split()
+            rows = conn.execute(
+                "SELECT m.conversation_id, c.title, m.position, m.role, substr(m.content, 1, 120) AS snippet"
+                " FROM messages m JOIN conversations c ON c.id = m.conversation_id WHERE c.owner = ? AND "
+                + " AND ".join("m.content LIKE ?" for _ in words) + " ORDER BY m.created DESC LIMIT ?",
+                [owner] + [f"%{word}%" for word in words] + [limit]
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def save_prompt(self, name: str, prompt: str):
+        self._connection().execute(
+            "INSERT OR REPLACE INTO saved_prompts (name, prompt, updated) VALUES (?, ?, ?)", (name, prompt, time.time())
+        )
+
+    def saved_prompts(self) -> Dict[str, str]:
+        rows = self._connection().execute("SELECT name, prompt FROM saved_prompts ORDER BY name").fetchall()
+        return {row["name"]: row["prompt"] for row in rows}
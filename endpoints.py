@@ -0,0 +1,213 @@
+"""Pool of Azure OpenAI endpoints with health tracking, routing and circuit breaking"""
+import json
+import os
+import random
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from urllib.parse import urlsplit
+
+DEFAULT_API_VERSION = "2025-04-01-preview"
+LEAST_OUTSTANDING = "least_outstanding"
+WEIGHTED = "weighted"
+ROUTING_STRATEGIES = (LEAST_OUTSTANDING, WEIGHTED)
+# Consecutive failures that open an endpoint's circuit, and how long it stays open
+DEFAULT_FAILURE_THRESHOLD = 3
+DEFAULT_COOLDOWN = 30.0
+# Weight of the newest sample in the latency moving average
+LATENCY_SMOOTHING = 0.2
+
+
+class Endpoint:
+    """One Azure OpenAI resource and deployment, plus its observed health"""
+
+    def __init__(self, url: str, api_key: str, model: str, api_version: str = DEFAULT_API_VERSION,
+                 weight: float = 1.0, name: Optional[str] = None):
+        if url and not url.endswith('/'):
+            url = url + '/'
+        self.url = url
+        self.model = model
+        self.api_version = api_version
+        self.weight = max(float(weight), 0.001)
+        self.name = name or urlsplit(url or "").hostname or "default"
+        self.headers = {"Content-Type": "application/json", "api-key": api_key}
+        self.responses_url = f"{url}openai/responses?api-version={api_version}"
+
+        self.outstanding = 0
+        self.consecutive_failures = 0
+        self.open_until = 0.0
+        self.held_until = 0.0
+        self.trial_in_flight = False
+        self.latency: Optional[float] = None
+        self.requests = 0
+        self.failures = 0
+
+    def response_url(self, response_id: str, action: str = "") -> str:
+        """URL of a stored response, optionally followed by an action such as 'cancel'"""
+        suffix = f"/{action}" if action else ""
+        return f"{self.url}openai/responses/{response_id}{suffix}?api-version={self.api_version}"
+
+    def state(self, now: float) -> str:
+        if not self.open_until:
+            return "closed"
+        return "open" if now < self.open_until else "half-open"
+
+
+class EndpointPool:
+    """Routes requests across endpoints and keeps failing ones out of rotation
+
+    An endpoint's circuit opens after `failure_threshold` consecutive
+    failures. Once `cooldown` has passed it is half-open: a single trial
+    request is let through, and its outcome closes or re-opens the circuit.
+    A 429 or a used-up quota holds an endpoint back until the server says
+    it resets, without counting against its health; acquire() routes
+    around it meanwhile.
+    """
+
+    def __init__(self, endpoints: List[Endpoint], strategy: str = LEAST_OUTSTANDING,
+                 failure_threshold: int = DEFAULT_FAILURE_THRESHOLD, cooldown: float = DEFAULT_COOLDOWN):
+        if not endpoints:
+            raise ValueError("An endpoint pool needs at least one endpoint")
+        if strategy not in ROUTING_STRATEGIES:
+            raise ValueError(f"Unknown routing strategy {strategy!r}; use one of {', '.join(ROUTING_STRATEGIES)}")
+        self.endpoints = endpoints
+        self.strategy = strategy
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._lock = threading.Lock()
+
+    @property
+    def primary(self) -> Endpoint:
+        return self.endpoints[0]
+
+    def _available(self, endpoint: Endpoint, now: float) -> bool:
+        if now < endpoint.held_until:
+            return False
+        state = endpoint.state(now)
+        return state == "closed" or (state == "half-open" and not endpoint.trial_in_flight)
+
+    def has_available(self, exclude: Iterable[Endpoint] = ()) -> bool:
+        """Whether an endpoint outside `exclude` can take a request right now"""
+        now = time.monotonic()
+        with self._lock:
+            return any(self._available(e, now) for e in self.endpoints if e not in exclude)
+
+    def _choose(self, candidates: List[Endpoint]) -> Endpoint:
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == WEIGHTED:
+            return random.choices(candidates, weights=[e.weight for e in candidates])[0]
+        # Fewest requests in flight per unit of weight, then the lowest latency
+        return min(candidates, key=lambda e: (e.outstanding / e.weight, self._expected_latency(e)))
+
+    @staticmethod
+    def _expected_latency(endpoint: Endpoint) -> float:
+        """Measured latency; an untried endpoint is worth a try, one that has only failed ranks last"""
+        if endpoint.latency is not None:
+            return endpoint.latency
+        return float("inf") if endpoint.failures else 0.0
+
+    def acquire(self, exclude: Iterable[Endpoint] = (), pinned: Optional[Endpoint] = None) -> Endpoint:
+        """Pick an endpoint for the next request and count it as outstanding
+
+        A pinned endpoint is always used, since stored responses only exist
+        where they were created. When every candidate is unavailable the one
+        that recovers soonest is used rather than failing outright.
+        """
+        now = time.monotonic()
+        exclude = set(exclude)
+        with self._lock:
+            if pinned is not None:
+                endpoint = pinned
+            else:
+                candidates = [e for e in self.endpoints if e not in exclude] or list(self.endpoints)
+                available = [e for e in candidates if self._available(e, now)]
+                if available:
+                    endpoint = self._choose(available)
+                else:
+                    endpoint = min(candidates, key=lambda e: max(e.open_until, e.held_until))
+            if endpoint.state(now) == "half-open":
+                endpoint.trial_in_flight = True
+            endpoint.outstanding += 1
+            endpoint.requests += 1
+        return endpoint
+
+    def record(self, endpoint: Endpoint, ok: bool, latency: Optional[float] = None):
+        """Update an endpoint's health with the outcome of a request"""
+        with self._lock:
+            endpoint.trial_in_flight = False
+            if ok:
+                endpoint.consecutive_failures = 0
+                endpoint.open_until = 0.0
+                if latency is not None:
+                    endpoint.latency = latency if endpoint.latency is None else (
+                        LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * endpoint.latency)
+                return
+            endpoint.failures += 1
+            endpoint.consecutive_failures += 1
+            if endpoint.open_until or endpoint.consecutive_failures >= self.failure_threshold:
+                # A failed half-open trial re-opens the circuit straight away
+                endpoint.open_until = time.monotonic() + self.cooldown
+
+    def hold(self, endpoint: Endpoint, seconds: float):
+        """Keep a throttled endpoint out of rotation for `seconds`"""
+        with self._lock:
+            endpoint.trial_in_flight = False
+            endpoint.held_until = max(endpoint.held_until, time.monotonic() + seconds)
+
+    def release(self, endpoint: Endpoint):
+        """The request (including any stream) is finished"""
+        with self._lock:
+            endpoint.outstanding -= 1
+
+    def snapshot(self) -> List[Dict]:
+        now = time.monotonic()
+        with self._lock:
+            return [{
+                "name": e.name,
+                "model": e.model,
+                "state": "held" if now < e.held_until and e.state(now) == "closed" else e.state(now),
+                "outstanding": e.outstanding,
+                "requests": e.requests,
+                "failures": e.failures,
+                "latency": e.latency,
+                "weight": e.weight,
+            } for e in self.endpoints]
+
+
+def _endpoint_configs() -> Optional[List[Dict]]:
+    """AZURE_OPENAI_ENDPOINTS as a JSON list, or the path of a file holding one"""
+    value = os.getenv("AZURE_OPENAI_ENDPOINTS", "").strip()
+    if not value:
+        return None
+    if not value.startswith("["):
+        value = Path(value).expanduser().read_text(encoding="utf-8")
+    return json.loads(value)
+
+
+def pool_from_env() -> EndpointPool:
+    """The pool from AZURE_OPENAI_ENDPOINTS, or a single endpoint from AZURE_OPENAI_ENDPOINT/MODEL"""
+    default_version = os.getenv("AZURE_OPENAI_API_VERSION", DEFAULT_API_VERSION)
+    configs = _endpoint_configs()
+    if configs:
+        endpoints = [
+            Endpoint(
+                config["endpoint"],
+                config.get("api_key") or os.getenv("AZURE_OPENAI_API_KEY"),
+                config.get("model") or os.getenv("AZURE_OPENAI_MODEL"),
+                config.get("api_version", default_version),
+                config.get("weight", 1.0),
+                config.get("name"),
+            )
+            for config in configs
+        ]
+    else:
+        endpoints = [Endpoint(os.getenv("AZURE_OPENAI_ENDPOINT"), os.getenv("AZURE_OPENAI_API_KEY"),
+                              os.getenv("AZURE_OPENAI_MODEL"), default_version)]
+    return EndpointPool(
+        endpoints,
+        strategy=os.getenv("AZURE_OPENAI_ROUTING", LEAST_OUTSTANDING),
+        failure_threshold=int(os.getenv("AZURE_OPENAI_FAILURE_THRESHOLD", DEFAULT_FAILURE_THRESHOLD)),
+        cooldown=float(os.getenv("AZURE_OPENAI_CIRCUIT_COOLDOWN", DEFAULT_COOLDOWN)),
+    )
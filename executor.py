@@ -0,0 +1,280 @@
+"""Process-wide executor for O3-Pro requests, shared by every session
+
+Sessions submit work and follow its published progress instead of making
+requests on their own threads. A fixed set of worker threads caps the
+requests in flight across the process. Queued work is taken by priority,
+then round robin across users, so one busy session cannot starve the
+others. Jobs outlive the script run that submitted them, so a session
+can pick a job up again after a rerun.
+"""
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import Any, Callable, Deque, Dict, List, Optional
+
+# Lower numbers run first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_COMPARE = 1
+PRIORITY_BULK = 2
+DEFAULT_MAX_CONCURRENCY = 8
+# Finished jobs kept so sessions can collect them after a rerun
+MAX_FINISHED_JOBS = 1000
+
+_local = threading.local()
+
+
+class RequestJob(Future):
+    """Queued work for one user: a Future plus the progress its worker publishes"""
+
+    def __init__(self, user: str, priority: int, label: str, fn: Callable, args: tuple, kwargs: Dict):
+        super().__init__()
+        self.id = uuid.uuid4().hex
+        self.user = user
+        self.priority = priority
+        self.label = label
+        self.parts: List[str] = []
+        self.error: Optional[str] = None
+        self.submitted = time.perf_counter()
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+        self.first_token_at: Optional[float] = None
+        self._fn = fn
+        self._args = args
+        self._kwargs = kwargs
+        self._status = "queued"
+        self._cancel_requested = threading.Event()
+
+    @property
+    def status(self) -> str:
+        return "cancelled" if self.cancelled() else self._status
+
+    @property
+    def text(self) -> str:
+        return "".join(self.parts)
+
+    @property
+    def queued_for(self) -> float:
+        return (self.started or time.perf_counter()) - self.submitted
+
+    @property
+    def cancel_requested(self) -> bool:
+        return self._cancel_requested.is_set()
+
+    def publish(self, text: str):
+        """Append streamed output for followers to read"""
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+        self.parts.append(text)
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes or the timeout expires; returns True when finished"""
+        try:
+            self.exception(timeout)
+        except FutureTimeoutError:
+            # Not the builtin TimeoutError before Python 3.11
+            return False
+        except Exception:
+            pass
+        return True
+
+    def cancel(self) -> bool:
+        """Drop the job if it is still queued, or ask its work to stop at the next event"""
+        self._cancel_requested.set()
+        return super().cancel()
+
+    def _run(self):
+        if not self.set_running_or_notify_cancel():
+            return
+        self.started = time.perf_counter()
+        self._status = "running"
+        _local.job = self
+        try:
+            result = self._fn(*self._args, **self._kwargs)
+        except BaseException as e:
+            self.error = str(e) or type(e).__name__
+            self._status = "failed"
+            self.finished = time.perf_counter()
+            self.set_exception(e)
+        else:
+            self._status = "cancelled" if self.cancel_requested else "completed"
+            self.finished = time.perf_counter()
+            self.set_result(result)
+        finally:
+            _local.job = None
+
+
+def current_job() -> Optional[RequestJob]:
+    """The job running on this worker thread, for work that publishes progress"""
+    return getattr(_local, "job", None)
+
+
+class RequestExecutor:
+    """Fixed worker threads taking queued jobs by priority, then round robin across users"""
+
+    def __init__(self, max_concurrency: int = DEFAULT_MAX_CONCURRENCY):
+        self.max_concurrency = max(1, max_concurrency)
+        # priority -> user -> that user's queued jobs, users in turn order
+        self._queues: Dict[int, "OrderedDict[str, Deque[RequestJob]]"] = {}
+        self._jobs: "OrderedDict[str, RequestJob]" = OrderedDict()
+        self._lock = threading.Condition()
+        self._running = 0
+        self._shutdown = False
+        self.stats = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0,
+                      "queue_seconds": 0.0, "max_queue_seconds": 0.0, "max_queued": 0}
+        self._workers = [threading.Thread(target=self._work, name=f"o3pro-request-{index}", daemon=True)
+                         for index in range(self.max_concurrency)]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, user: str, fn: Callable, *args: Any, priority: int = PRIORITY_INTERACTIVE,
+               label: str = "", **kwargs: Any) -> RequestJob:
+        """Queue `fn(*args, **kwargs)` on behalf of `user`; returns at once"""
+        job = RequestJob(user, priority, label or getattr(fn, "__name__", "request"), fn, args, kwargs)
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("Request executor is shut down")
+            self._queues.setdefault(priority, OrderedDict()).setdefault(user, deque()).append(job)
+            self._jobs[job.id] = job
+            self._prune()
+            self.stats["submitted"] += 1
+            self.stats["max_queued"] = max(self.stats["max_queued"], self._queued())
+            self._lock.notify()
+        return job
+
+    def queue(self, user: str, priority: int = PRIORITY_INTERACTIVE) -> "UserQueue":
+        """A submit-only view for code written against concurrent.futures executors"""
+        return UserQueue(self, user, priority)
+
+    def get(self, job_id: str) -> Optional[RequestJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _queued(self) -> int:
+        return sum(len(jobs) for users in self._queues.values() for jobs in users.values())
+
+    def _prune(self):
+        """Forget the oldest finished jobs beyond MAX_FINISHED_JOBS"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.done()]
+        for job_id in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+            del self._jobs[job_id]
+
+    def _next(self) -> Optional[RequestJob]:
+        """Take the next job to run; called with the lock held"""
+        for priority in sorted(self._queues):
+            users = self._queues[priority]
+            while users:
+                user, jobs = next(iter(users.items()))
+                job = jobs.popleft()
+                # The user moves to the back of the line, or leaves it with nothing queued
+                del users[user]
+                if jobs:
+                    users[user] = jobs
+                if not job.cancelled():
+                    return job
+                self.stats["cancelled"] += 1
+        return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                job = self._next()
+                while job is None:
+                    if self._shutdown:
+                        return
+                    self._lock.wait()
+                    job = self._next()
+                self._running += 1
+                waited = time.perf_counter() - job.submitted
+                self.stats["queue_seconds"] += waited
+                self.stats["max_queue_seconds"] = max(self.stats["max_queue_seconds"], waited)
+            try:
+                job._run()
+            finally:
+                with self._lock:
+                    self._running -= 1
+                    self.stats[job.status] = self.stats.get(job.status, 0) + 1
+
+    def snapshot(self) -> Dict:
+        """Counters plus current load, for display"""
+        with self._lock:
+            stats = dict(self.stats)
+            queued = self._queued()
+            waiting_users = len({user for users in self._queues.values() for user in users})
+            running = self._running
+        started = stats["submitted"] - queued
+        return {**stats, "running": running, "queued": queued, "waiting_users": waiting_users,
+                "max_concurrency": self.max_concurrency,
+                "avg_queue_seconds": stats["queue_seconds"] / started if started else 0.0}
+
+    def shutdown(self, cancel_queued: bool = True):
+        """Stop the workers once running jobs finish"""
+        with self._lock:
+            self._shutdown = True
+            if cancel_queued:
+                for users in self._queues.values():
+                    for jobs in users.values():
+                        for job in jobs:
+                            job.cancel()
+                self._queues.clear()
+            self._lock.notify_all()
+
+
+class UserQueue:
+    """Submits as one user at one priority, in place of a concurrent.futures executor"""
+
+    def __init__(self, executor: RequestExecutor, user: str, priority: int = PRIORITY_INTERACTIVE):
+        self.executor = executor
+        self.user = user
+        self.priority = priority
+
+    def submit(self, fn: Callable, *args: Any, **kwargs: Any) -> RequestJob:
+        return self.executor.submit(self.user, fn, *args, priority=self.priority, **kwargs)
+
+
+def stream_completion(client, messages: List[Dict], **options) -> Optional[Dict]:
+    """Stream a response into the current job's text; returns the completed response"""
+    job = current_job()
+    events = client.create_chat_completion(messages, stream=True, raise_errors=True, **options)
+    if events is None:
+        raise RuntimeError("No response from O3-Pro model")
+    completed = None
+    try:
+        for event in events:
+            if job is not None and job.cancel_requested:
+                break
+            event_type = event.get("type")
+            if event_type == "response.output_text.delta":
+                if job is not None:
+                    job.publish(event.get("delta", ""))
+            elif event_type == "response.completed":
+                completed = event.get("response")
+            elif event_type in ("response.failed", "error"):
+                error = event.get("error") or (event.get("response") or {}).get("error") or {}
+                raise RuntimeError(f"Streaming error: {error.get('message', 'unknown error')}")
+    finally:
+        # Closing the generator closes the response and frees the connection
+        events.close()
+    if completed is None and not (job is not None and job.cancel_requested):
+        raise RuntimeError("Stream ended before the response completed")
+    if job is not None and not job.parts and completed:
+        job.publish(client.extract_text(completed) or "")
+    return completed
+
+
+def create_completion(client, messages: List[Dict], **options) -> Dict:
+    """Send a non-streaming request, publishing its text to the current job when it arrives"""
+    response = client.create_chat_completion(messages, stream=False, raise_errors=True, **options)
+    if not response or "output" not in response:
+        raise RuntimeError("Failed to get response from O3-Pro model")
+    job = current_job()
+    if job is not None:
+        job.publish(client.extract_text(response) or "")
+    return response
+
+
+def executor_from_env() -> RequestExecutor:
+    """An executor capped by O3PRO_MAX_CONCURRENT_REQUESTS"""
+    return RequestExecutor(int(os.getenv("O3PRO_MAX_CONCURRENT_REQUESTS", DEFAULT_MAX_CONCURRENCY)))
@@ -0,0 +1,316 @@
+"""Text extraction for supported attachment formats
+
+Each extractor takes a seekable binary file and yields the document's text
+in pieces, so callers can write it out or stop early without holding the
+whole text in memory.
+"""
+import codecs
+import csv
+import io
+import logging
+import mmap
+import os
+import time
+import zipfile
+from html.parser import HTMLParser
+from typing import BinaryIO, Iterator, List, Optional
+from xml.etree.ElementTree import iterparse
+
+from telemetry import get_telemetry
+
+logger = logging.getLogger(__name__)
+
+# Bump when extraction output changes so stale stored text is not reused
+EXTRACTOR_VERSION = "3"
+# Bytes read per step by the streaming text extractors
+READ_CHUNK_BYTES = 1024 * 1024
+# Rows rendered per piece of CSV and spreadsheet text
+ROWS_PER_CHUNK = 1000
+
+class ExtractionError(Exception):
+    """An extractor failed partway; the text it yielded so far is incomplete"""
+
+def _mapped(file):
+    """A read-only memory map of a file on disk, or the file itself when it has none"""
+    try:
+        return mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+    except (AttributeError, OSError, ValueError, io.UnsupportedOperation):
+        return file
+
+def iter_pdf_text(file, report=logger) -> Iterator[str]:
+    """Extract text from PDF file, a page at a time"""
+    try:
+        # Imported on the first PDF so start-up does not load PyPDF2
+        from pdf_engine import DEFAULT_MAX_PAGES, DEFAULT_TIME_BUDGET, PdfPageStream
+        # PDFs need random access; a file on disk is paged in by the OS rather than read into memory
+        pages = PdfPageStream(
+            _mapped(file),
+            max_pages=int(os.getenv("O3PRO_PDF_MAX_PAGES", DEFAULT_MAX_PAGES)),
+            time_budget=float(os.getenv("O3PRO_PDF_TIME_BUDGET", DEFAULT_TIME_BUDGET))
+        )
+        for index, (_, page_text) in enumerate(pages):
+            yield page_text if index == 0 else "\n" + page_text
+        if pages.truncated:
+            report.warning(f"PDF truncated: extracted {pages.pages_read} of {pages.total_pages} pages")
+            yield f"\n[Truncated: extracted {pages.pages_read} of {pages.total_pages} pages]"
+    except Exception as e:
+        report.error(f"Error reading PDF: {str(e)}")
+        raise ExtractionError(f"Error reading PDF: {str(e)}") from e
+
+def iter_docx_text(file, report=logger) -> Iterator[str]:
+    """Extract text from DOCX file, a paragraph at a time"""
+    try:
+        # Imported on the first DOCX, like PyPDF2 above
+        import docx
+        doc = docx.Document(file)
+        for paragraph in doc.paragraphs:
+            yield paragraph.text + "\n"
+    except Exception as e:
+        report.error(f"Error reading DOCX: {str(e)}")
+        raise ExtractionError(f"Error reading DOCX: {str(e)}") from e
+
+def iter_decoded(file, errors: str = "replace") -> Iterator[str]:
+    """Decode a UTF-8 file in fixed-size reads, never splitting a character"""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors)
+    while True:
+        data = file.read(READ_CHUNK_BYTES)
+        text = decoder.decode(data, final=not data)
+        if text:
+            yield text
+        if not data:
+            return
+
+def iter_plain_text(file, report=logger) -> Iterator[str]:
+    """Extract text from TXT, Markdown and source files as it is read"""
+    try:
+        yield from iter_decoded(file)
+    except Exception as e:
+        report.error(f"Error reading TXT: {str(e)}")
+        raise ExtractionError(f"Error reading TXT: {str(e)}") from e
+
+def iter_csv_text(file, report=logger) -> Iterator[str]:
+    """Extract CSV rows in chunks, normalised to comma-separated text"""
+    try:
+        # pandas takes a while to import; only pay for it when a CSV arrives
+        import pandas as pd
+        sample = file.read(64 * 1024).decode("utf-8", errors="replace")
+        file.seek(0)
+        try:
+            delimiter = csv.Sniffer().sniff(sample, delimiters=",;\t|").delimiter
+        except csv.Error:
+            delimiter = ","
+        chunks = pd.read_csv(file, chunksize=ROWS_PER_CHUNK, dtype=str, keep_default_na=False,
+                             sep=delimiter, encoding_errors="replace")
+        for index, chunk in enumerate(chunks):
+            yield chunk.to_csv(index=False, header=index == 0)
+    except Exception as e:
+        report.error(f"Error reading CSV: {str(e)}")
+        raise ExtractionError(f"Error reading CSV: {str(e)}") from e
+
+class _HTMLText(HTMLParser):
+    """Collects visible text, with line breaks at block elements"""
+
+    SKIP = {"script", "style", "noscript", "template", "svg"}
+    BLOCKS = {"p", "div", "br", "li", "tr", "h1", "h2", "h3", "h4", "h5", "h6",
+              "section", "article", "header", "footer", "pre", "blockquote", "table", "ul", "ol"}
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skipping = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in self.SKIP:
+            self._skipping += 1
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_endtag(self, tag):
+        if tag in self.SKIP:
+            self._skipping = max(0, self._skipping - 1)
+        elif tag in self.BLOCKS:
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skipping:
+            self.parts.append(data)
+
+    def take(self) -> str:
+        text = "".join(self.parts)
+        self.parts = []
+        return text
+
+def iter_html_text(file, report=logger) -> Iterator[str]:
+    """Extract visible text from HTML as it is parsed"""
+    try:
+        parser = _HTMLText()
+        for text in iter_decoded(file):
+            parser.feed(text)
+            piece = parser.take()
+            if piece:
+                yield piece
+        parser.close()
+        piece = parser.take()
+        if piece:
+            yield piece
+    except Exception as e:
+        report.error(f"Error reading HTML: {str(e)}")
+        raise ExtractionError(f"Error reading HTML: {str(e)}") from e
+
+_SHEET_NS = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL_NS = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+
+def _xlsx_shared_strings(archive: zipfile.ZipFile) -> List[str]:
+    if "xl/sharedStrings.xml" not in archive.namelist():
+        return []
+    strings = []
+    with archive.open("xl/sharedStrings.xml") as part:
+        root = None
+        for event, element in iterparse(part, events=("start", "end")):
+            if root is None:
+                root = element
+            elif event == "end" and element.tag == _SHEET_NS + "si":
+                strings.append("".join(t.text or "" for t in element.iter(_SHEET_NS + "t")))
+                root.clear()
+    return strings
+
+def _xlsx_sheets(archive: zipfile.ZipFile) -> List[tuple]:
+    """(sheet name, part path) in workbook order"""
+    with archive.open("xl/_rels/workbook.xml.rels") as part:
+        targets = {rel.get("Id"): rel.get("Target") for _, rel in iterparse(part) if rel.get("Id")}
+    sheets = []
+    with archive.open("xl/workbook.xml") as part:
+        for _, element in iterparse(part):
+            if element.tag == _SHEET_NS + "sheet":
+                target = targets[element.get(_REL_NS + "id")].lstrip("/")
+                sheets.append((element.get("name"), target if target.startswith("xl/") else "xl/" + target))
+    return sheets
+
+def _xlsx_cell(cell, shared_strings: List[str]) -> str:
+    kind = cell.get("t")
+    if kind == "inlineStr":
+        return "".join(t.text or "" for t in cell.iter(_SHEET_NS + "t"))
+    value = cell.find(_SHEET_NS + "v")
+    if value is None or value.text is None:
+        return ""
+    if kind == "s":
+        return shared_strings[int(value.text)]
+    return value.text
+
+def _xlsx_column(reference: str) -> int:
+    number = 0
+    for char in reference:
+        if not char.isalpha():
+            break
+        number = number * 26 + ord(char.upper()) - 64
+    return number - 1
+
+def iter_xlsx_text(file, report=logger) -> Iterator[str]:
+    """Extract XLSX sheets as comma-separated rows, streaming each worksheet's XML
+
+    Rows are parsed and discarded one at a time, so memory stays flat
+    however large a sheet is. Formulas contribute their cached values.
+    """
+    try:
+        with zipfile.ZipFile(file) as archive:
+            shared_strings = _xlsx_shared_strings(archive)
+            for name, path in _xlsx_sheets(archive):
+                buffer = io.StringIO()
+                buffer.write(f"## Sheet: {name}\n")
+                writer = csv.writer(buffer, lineterminator="\n")
+                rows = 0
+                with archive.open(path) as part:
+                    sheet_data = None
+                    for event, element in iterparse(part, events=("start", "end")):
+                        if event == "start":
+                            if element.tag == _SHEET_NS + "sheetData":
+                                sheet_data = element
+                            continue
+                        if element.tag != _SHEET_NS + "row":
+                            continue
+                        values: List[str] = []
+                        for cell in element.iter(_SHEET_NS + "c"):
+                            column = _xlsx_column(cell.get("r")) if cell.get("r") else len(values)
+                            values.extend([""] * (column - len(values)))
+                            values.append(_xlsx_cell(cell, shared_strings))
+                        # Drop parsed rows so the tree never grows with the sheet
+                        sheet_data.clear()
+                        if any(values):
+                            writer.writerow(values)
+                            rows += 1
+                        if rows and rows % ROWS_PER_CHUNK == 0:
+                            yield buffer.getvalue()
+                            buffer = io.StringIO()
+                            writer = csv.writer(buffer, lineterminator="\n")
+                yield buffer.getvalue()
+    except Exception as e:
+        report.error(f"Error reading XLSX: {str(e)}")
+        raise ExtractionError(f"Error reading XLSX: {str(e)}") from e
+
+CODE_MIME_TYPE = "text/x-source"
+CODE_SUFFIXES = (
+    ".py", ".ipynb", ".js", ".jsx", ".ts", ".tsx", ".java", ".kt", ".scala", ".go", ".rs", ".c", ".h",
+    ".cpp", ".hpp", ".cs", ".rb", ".php", ".swift", ".sh", ".sql", ".r", ".css", ".json", ".yaml", ".yml",
+    ".toml", ".xml",
+)
+
+# Extractors by MIME type
+FILE_EXTRACTORS = {
+    "application/pdf": iter_pdf_text,
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document": iter_docx_text,
+    "text/plain": iter_plain_text,
+    "text/markdown": iter_plain_text,
+    "text/html": iter_html_text,
+    "text/csv": iter_csv_text,
+    "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet": iter_xlsx_text,
+    CODE_MIME_TYPE: iter_plain_text,
+}
+
+# MIME types by file suffix; used for files read from disk, and ahead of
+# the browser-reported type for uploads since browsers disagree on these
+MIME_TYPES_BY_SUFFIX = {
+    ".pdf": "application/pdf",
+    ".docx": "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    ".txt": "text/plain",
+    ".markdown": "text/markdown",
+    ".md": "text/markdown",
+    ".htm": "text/html",
+    ".html": "text/html",
+    ".csv": "text/csv",
+    ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    **{suffix: CODE_MIME_TYPE for suffix in CODE_SUFFIXES},
+}
+# Short names used to label extraction metrics
+KIND_BY_MIME_TYPE = {
+    **{mime_type: suffix.lstrip(".") for suffix, mime_type in MIME_TYPES_BY_SUFFIX.items()},
+    CODE_MIME_TYPE: "code",
+}
+
+def mime_type_for(filename: str, reported: Optional[str] = None) -> str:
+    """MIME type of a file from its suffix, falling back to the reported type"""
+    suffix = os.path.splitext(filename)[1].lower()
+    return MIME_TYPES_BY_SUFFIX.get(suffix) or reported or "text/plain"
+
+def iter_text(file: BinaryIO, file_type: str, report=logger) -> Iterator[str]:
+    """Stream text from a seekable binary file of the given MIME type
+
+    A failure is reported, then raised as ExtractionError after the pieces
+    already yielded, so callers can discard the partial text.
+    """
+    extractor = FILE_EXTRACTORS.get(file_type)
+    if extractor is None:
+        report.warning(f"Unsupported file type: {file_type}")
+        return
+    file.seek(0, io.SEEK_END)
+    num_bytes = file.tell()
+    file.seek(0)
+    start = time.perf_counter()
+    try:
+        yield from extractor(file, report)
+    finally:
+        get_telemetry().record_extraction(KIND_BY_MIME_TYPE.get(file_type, file_type), num_bytes,
+                                          time.perf_counter() - start)
+
+def extract_text(data: bytes, file_type: str, report=logger) -> str:
+    """Extract text from raw file bytes of the given MIME type; raises ExtractionError on failure"""
+    return "".join(iter_text(io.BytesIO(data), file_type, report))
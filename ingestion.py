@@ -0,0 +1,237 @@
+"""Bounded-memory ingestion of uploads: streamed extraction into an on-disk text store"""
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from pathlib import Path
+from typing import BinaryIO, Dict, Iterable, Iterator, NamedTuple, Optional, Tuple
+
+from extractors import EXTRACTOR_VERSION, KIND_BY_MIME_TYPE, READ_CHUNK_BYTES, ExtractionError, iter_text
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_DIR = "~/.cache/o3-pro/texts"
+DEFAULT_MAX_DISK_BYTES = 2 * 1024 * 1024 * 1024
+# Streamlit's own default upload limit
+DEFAULT_MAX_UPLOAD_BYTES = 200 * 1024 * 1024
+# Far beyond any input budget, but keeps one document's index and store entry bounded
+DEFAULT_MAX_CHARS = 20_000_000
+# Non-seekable inputs are copied to a temp file that stays in memory up to this size
+SPOOL_BYTES = 8 * 1024 * 1024
+
+
+class Attachment(NamedTuple):
+    """A session's reference to a document whose text lives in the store"""
+    name: str
+    key: str
+    kind: str
+    size: int
+    chars: int
+    truncated: bool
+    upload_id: Optional[str] = None
+
+
+def hash_stream(file: BinaryIO) -> Tuple[str, int]:
+    """SHA-256 and size of a file read in fixed-size chunks, leaving it rewound"""
+    digest = hashlib.sha256()
+    size = 0
+    file.seek(0)
+    while True:
+        data = file.read(READ_CHUNK_BYTES)
+        if not data:
+            break
+        digest.update(data)
+        size += len(data)
+    file.seek(0)
+    return digest.hexdigest(), size
+
+
+class TextStore:
+    """Extracted document text on disk, keyed by a hash of the source bytes
+
+    Sessions hold small `Attachment` references instead of the text, and
+    read back only as much as a prompt needs. Text is written as the
+    extractor produces it, so no copy of a whole document is held in
+    memory, and extraction stops at `max_chars`. The store is shared by
+    every session and process and pruned least recently used first.
+    """
+
+    def __init__(self, directory: str = DEFAULT_DIR, max_disk_bytes: int = DEFAULT_MAX_DISK_BYTES,
+                 max_upload_bytes: int = DEFAULT_MAX_UPLOAD_BYTES, max_chars: int = DEFAULT_MAX_CHARS):
+        self.directory = Path(directory).expanduser()
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self.max_disk_bytes = max_disk_bytes
+        self.max_upload_bytes = max_upload_bytes
+        self.max_chars = max_chars
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "rejected": 0, "evictions": 0}
+        self._disk_bytes = sum(path.stat().st_size for path in self.directory.glob("*.txt"))
+
+    def _text_path(self, key: str) -> Path:
+        return self.directory / f"{key}.txt"
+
+    def _meta_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def has(self, key: str) -> bool:
+        return self._meta_path(key).exists() and self._text_path(key).exists()
+
+    def _lookup(self, key: str) -> Optional[Dict]:
+        try:
+            meta = json.loads(self._meta_path(key).read_text(encoding="utf-8"))
+            # Refresh the mtime so pruning is least-recently-used
+            os.utime(self._text_path(key))
+        except (OSError, ValueError):
+            return None
+        return meta
+
+    def ingest(self, file: BinaryIO, name: str, file_type: str, report=logger,
+               upload_id: Optional[str] = None) -> Optional[Attachment]:
+        """Extract a file into the store, or reuse text extracted from the same bytes earlier"""
+        if not file.seekable():
+            with tempfile.SpooledTemporaryFile(max_size=SPOOL_BYTES) as spool:
+                shutil.copyfileobj(file, spool, READ_CHUNK_BYTES)
+                return self.ingest(spool, name, file_type, report, upload_id)
+
+        digest, size = hash_stream(file)
+        if size > self.max_upload_bytes:
+            with self._lock:
+                self.stats["rejected"] += 1
+            report.error(f"{name} is {size / 1_000_000:.0f} MB; the limit is {self.max_upload_bytes / 1_000_000:.0f} MB")
+            return None
+        kind = KIND_BY_MIME_TYPE.get(file_type, file_type)
+        key = f"{digest}-{kind.replace('/', '_')}-v{EXTRACTOR_VERSION}"
+
+        meta = self._lookup(key)
+        with self._lock:
+            self.stats["hits" if meta else "misses"] += 1
+        if meta is None:
+            try:
+                chars, truncated = self._write(key, iter_text(file, file_type, report))
+            except ExtractionError:
+                # Already reported; partial text is never stored as if it were the whole document
+                return None
+            if not chars:
+                # Failed or empty extractions are not stored and are retried next time
+                return None
+            meta = {"chars": chars, "truncated": truncated}
+            self._write_meta(key, meta)
+            if truncated:
+                report.warning(f"{name} truncated to its first {self.max_chars:,} characters")
+        return Attachment(name, key, kind, size, meta["chars"], meta["truncated"], upload_id)
+
+    def _write(self, key: str, pieces: Iterable[str]) -> Tuple[int, bool]:
+        """Write streamed text to the store, stopping at max_chars; returns (chars, truncated)"""
+        chars = 0
+        truncated = False
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            # newline="" everywhere keeps the file's bytes equal to the text, so spans stay valid
+            with os.fdopen(fd, "w", encoding="utf-8", newline="") as tmp:
+                for piece in pieces:
+                    if chars + len(piece) > self.max_chars:
+                        piece = piece[:self.max_chars - chars]
+                        truncated = True
+                    tmp.write(piece)
+                    chars += len(piece)
+                    if truncated:
+                        break
+                if truncated:
+                    tmp.write(f"\n[Truncated: extraction stopped after {self.max_chars:,} characters]")
+            if hasattr(pieces, "close"):
+                # Stop the extractor, and any PDF worker processes, as soon as the cap is hit
+                pieces.close()
+            if not chars:
+                os.unlink(tmp_path)
+                return 0, False
+            size = os.path.getsize(tmp_path)
+            os.replace(tmp_path, self._text_path(key))
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        with self._lock:
+            self._disk_bytes += size
+        self._prune()
+        return chars, truncated
+
+    def _write_meta(self, key: str, meta: Dict):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(fd, "w", encoding="utf-8") as tmp:
+            json.dump(meta, tmp)
+        os.replace(tmp_path, self._meta_path(key))
+
+    def read(self, key: str, max_chars: Optional[int] = None) -> Optional[str]:
+        """Up to `max_chars` characters of a document's text; None once it has been pruned"""
+        try:
+            with open(self._text_path(key), encoding="utf-8", newline="") as text:
+                return text.read(-1 if max_chars is None else max_chars)
+        except OSError:
+            return None
+
+    def iter_chunks(self, key: str, chunk_chars: int = READ_CHUNK_BYTES) -> Iterator[str]:
+        """A document's text in pieces of at most `chunk_chars`"""
+        with open(self._text_path(key), encoding="utf-8", newline="") as text:
+            while True:
+                piece = text.read(chunk_chars)
+                if not piece:
+                    return
+                yield piece
+
+    def read_span(self, key: str, start: int, end: int) -> Optional[str]:
+        """The text between two UTF-8 byte offsets of a document; None once it has been pruned"""
+        try:
+            with open(self._text_path(key), "rb") as text:
+                text.seek(start)
+                return text.read(end - start).decode("utf-8", errors="replace")
+        except OSError:
+            return None
+
+    def snapshot(self) -> Dict:
+        """Counters plus disk usage, for display"""
+        with self._lock:
+            return {**self.stats, "disk_bytes": self._disk_bytes}
+
+    def _prune(self):
+        """Delete the least recently used texts once the store exceeds its disk budget"""
+        with self._lock:
+            if self._disk_bytes <= self.max_disk_bytes:
+                return
+        files = []
+        for path in self.directory.glob("*.txt"):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_disk_bytes:
+                break
+            try:
+                path.unlink()
+                path.with_suffix(".json").unlink(missing_ok=True)
+                total -= size
+                with self._lock:
+                    self.stats["evictions"] += 1
+            except OSError:
+                pass
+        with self._lock:
+            self._disk_bytes = total
+
+
+def _megabytes(name: str, default: int) -> int:
+    return int(float(os.getenv(name, default / 1024 / 1024)) * 1024 * 1024)
+
+
+def text_store_from_env() -> TextStore:
+    """The store configured by O3PRO_TEXT_STORE_* and the upload and document size caps"""
+    return TextStore(
+        os.getenv("O3PRO_TEXT_STORE_DIR", DEFAULT_DIR),
+        max_disk_bytes=_megabytes("O3PRO_TEXT_STORE_MAX_MB", DEFAULT_MAX_DISK_BYTES),
+        max_upload_bytes=_megabytes("O3PRO_MAX_UPLOAD_MB", DEFAULT_MAX_UPLOAD_BYTES),
+        max_chars=int(os.getenv("O3PRO_MAX_DOCUMENT_CHARS", DEFAULT_MAX_CHARS)),
+    )
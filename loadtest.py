@@ -0,0 +1,352 @@
+"""Load generator for the client and the Streamlit app against the mock Responses API
+
+Simulated users send requests through AzureO3ProClient at the same time,
+each with its own seeded prompts and think times, against a mock server
+whose latencies and injected errors are seeded too, so runs repeat.
+App users are Streamlit sessions driven through the AppTest harness.
+AppTest runs cannot overlap in one process, so app users take turns with
+every session kept alive, which is what the per-session memory measures.
+
+Usage:
+    python loadtest.py client [--users 16] [--requests 20] [--mode create|stream|background]
+                              [--latency lognormal:0.5,2] [--error-rate 429=0.05] [--seed 1] [--json out.json]
+    python loadtest.py app [--users 4] [--turns 3]
+    python loadtest.py client --url http://localhost:8765/   # a mock server that is already running
+"""
+import argparse
+import gc
+import json
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from background import BackgroundJobs
+from client import AzureO3ProClient
+from mock_server import Latency, MockResponsesServer, parse_error_rate
+from rate_limit import controller_from_env, set_controller
+
+APP_PATH = str(Path(__file__).resolve().parent / "app.py")
+APP_TIMEOUT = 120
+BACKGROUND_POLL_INTERVAL = 0.1
+MODES = ("create", "stream", "background")
+TOPICS = ("latency budgets", "SSE streaming", "retry policies", "token accounting", "connection pooling",
+          "prompt caching", "reasoning effort", "context windows")
+
+# Client errors are counted in the report rather than logged one by one
+client_log = logging.getLogger("loadtest.client")
+
+
+class Sample(NamedTuple):
+    """One request or chat turn"""
+    user: int
+    latency: float
+    ttft: Optional[float]
+    ok: bool
+    error: Optional[str] = None
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Nearest-rank percentile, 0.0 for no values"""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q / 100 * len(ordered))) - 1))]
+
+
+def rss_kb() -> int:
+    """Resident set size of this process"""
+    try:
+        with open("/proc/self/status") as status:
+            for line in status:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    import resource
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class LoadReport:
+    """Samples from one run and the figures derived from them"""
+
+    def __init__(self, scenario: str, users: int, samples: List[Sample], duration: float,
+                 server_stats: Optional[Dict] = None, controller_stats: Optional[Dict] = None,
+                 memory_per_session: Optional[Dict] = None):
+        self.scenario = scenario
+        self.users = users
+        self.samples = samples
+        self.duration = duration
+        self.server_stats = server_stats or {}
+        self.controller_stats = controller_stats or {}
+        self.memory_per_session = memory_per_session
+
+    def summary(self) -> Dict:
+        latencies = [sample.latency for sample in self.samples]
+        ttfts = [sample.ttft for sample in self.samples if sample.ttft is not None]
+        errors = [sample for sample in self.samples if not sample.ok]
+        summary = {
+            "scenario": self.scenario,
+            "users": self.users,
+            "requests": len(self.samples),
+            "errors": len(errors),
+            "error_rate": len(errors) / len(self.samples) if self.samples else 0.0,
+            "duration_s": self.duration,
+            "throughput_rps": len(self.samples) / self.duration if self.duration else 0.0,
+            **{f"latency_p{q}_s": percentile(latencies, q) for q in (50, 95, 99)},
+            **{f"ttft_p{q}_s": percentile(ttfts, q) for q in (50, 95)},
+            "retries": self.controller_stats.get("retries", 0),
+            "throttled": self.controller_stats.get("throttled", 0),
+            "server": {key: value for key, value in self.server_stats.items()
+                       if key.startswith(("status_", "stream_failures", "requests", "connections"))},
+        }
+        if self.memory_per_session is not None:
+            summary["memory_per_session_kb"] = self.memory_per_session
+        return summary
+
+    def format(self) -> str:
+        summary = self.summary()
+        lines = [
+            f"{self.scenario}: {summary['requests']} requests from {self.users} users in {self.duration:.1f}s"
+            f" = {summary['throughput_rps']:.1f}/s",
+            f"  latency p50 {summary['latency_p50_s']:.3f}s  p95 {summary['latency_p95_s']:.3f}s"
+            f"  p99 {summary['latency_p99_s']:.3f}s"
+            + (f"  ·  first token p50 {summary['ttft_p50_s']:.3f}s  p95 {summary['ttft_p95_s']:.3f}s"
+               if summary["ttft_p50_s"] else ""),
+            f"  errors {summary['errors']} ({summary['error_rate']:.1%})  retries {summary['retries']}"
+            f"  throttled {summary['throttled']}  server {summary['server']}",
+        ]
+        if self.memory_per_session is not None:
+            lines.append(f"  memory per session: {self.memory_per_session['python_heap']:,.0f} KB Python heap,"
+                         f" {self.memory_per_session['rss']:,.0f} KB RSS")
+        return "\n".join(lines)
+
+
+@contextmanager
+def mock_environment(url: str) -> Iterator[None]:
+    """Point the client at `url` and keep the app's databases and caches in a temporary directory"""
+    scratch = tempfile.mkdtemp(prefix="o3pro-load-")
+    settings = {
+        "AZURE_OPENAI_ENDPOINT": url,
+        "AZURE_OPENAI_API_KEY": "load-test",
+        "AZURE_OPENAI_MODEL": "o3-pro",
+        "AZURE_OPENAI_ENDPOINTS": "",
+        "O3PRO_CONVERSATION_DB": os.path.join(scratch, "conversations.sqlite3"),
+        "O3PRO_TEXT_STORE_DIR": os.path.join(scratch, "texts"),
+        "O3PRO_SUMMARY_CACHE_PATH": os.path.join(scratch, "summaries.sqlite3"),
+        "O3PRO_RESPONSE_CACHE_PATH": "",
+    }
+    previous = {name: os.environ.get(name) for name in settings}
+    os.environ.update(settings)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+        shutil.rmtree(scratch, ignore_errors=True)
+
+
+def user_prompt(rng: random.Random, words: int) -> str:
+    topic = rng.choice(TOPICS)
+    filler = " ".join(rng.choice(TOPICS).split()[0] for _ in range(words))
+    return f"Explain {topic} in one paragraph. Context: {filler}"
+
+
+def reply_text(words: int) -> str:
+    vocabulary = " ".join(TOPICS).split()
+    return " ".join(vocabulary[index % len(vocabulary)] for index in range(words))
+
+
+def send(client: AzureO3ProClient, jobs: Optional[BackgroundJobs], messages: List[Dict], mode: str):
+    """Send one request; returns (ok, seconds to first token or None, error)"""
+    start = time.perf_counter()
+    if mode == "stream":
+        events = client.create_chat_completion(messages, stream=True, use_cache=False)
+        if events is None:
+            return False, None, "request failed"
+        ttft = None
+        error = None
+        text = []
+        for event in events:
+            event_type = event.get("type")
+            if event_type == "response.output_text.delta":
+                if ttft is None:
+                    ttft = time.perf_counter() - start
+                text.append(event.get("delta", ""))
+            elif event_type in ("response.failed", "error"):
+                error = (event.get("error") or (event.get("response") or {}).get("error") or {}).get("message")
+                error = f"stream failed: {error or 'unknown error'}"
+        return bool(text) and error is None, ttft, error
+    if mode == "background":
+        job = jobs.submit(client, messages, poll_interval=BACKGROUND_POLL_INTERVAL)
+        if job is None:
+            return False, None, "request failed"
+        job.wait()
+        jobs.forget(job.response_id)
+        return job.status == "completed", None, job.error
+    response = client.create_chat_completion(messages, stream=False, use_cache=False)
+    if not response or not client.extract_text(response):
+        return False, None, "request failed"
+    return True, None, None
+
+
+def run_client_load(users: int, requests_per_user: int, mode: str = "create", think_time: float = 0.0,
+                    prompt_words: int = 50, seed: int = 0) -> LoadReport:
+    """Drive AzureO3ProClient from `users` threads at once, each sending `requests_per_user` requests"""
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    controller = controller_from_env()
+    # A fresh controller so retry and throttle counts cover this run only
+    set_controller(controller)
+    client = AzureO3ProClient(report=client_log)
+    jobs = BackgroundJobs() if mode == "background" else None
+    samples: List[Sample] = []
+    lock = threading.Lock()
+    ready = threading.Barrier(users + 1)
+
+    def user(index: int):
+        rng = random.Random(f"{seed}:{index}")
+        ready.wait()
+        for _ in range(requests_per_user):
+            messages = [{"role": "user", "content": user_prompt(rng, prompt_words)}]
+            start = time.perf_counter()
+            try:
+                ok, ttft, error = send(client, jobs, messages, mode)
+            except Exception as e:
+                ok, ttft, error = False, None, str(e)
+            sample = Sample(index, time.perf_counter() - start, ttft, ok, error)
+            with lock:
+                samples.append(sample)
+            if think_time:
+                time.sleep(rng.expovariate(1 / think_time))
+
+    threads = [threading.Thread(target=user, args=(index,), name=f"load-user-{index}") for index in range(users)]
+    for thread in threads:
+        thread.start()
+    ready.wait()
+    start = time.perf_counter()
+    for thread in threads:
+        thread.join()
+    return LoadReport(f"client/{mode}", users, samples, time.perf_counter() - start,
+                      controller_stats=controller.snapshot())
+
+
+def keep_selections(session):
+    """Re-send selectboxes at their rendered index
+
+    AppTest reports a selectbox's state by looking its value up among the
+    displayed options, which fails when format_func changes how options
+    display, as the conversation picker does.
+    """
+    for selectbox in session.selectbox:
+        if str(selectbox.value) not in selectbox.options:
+            selectbox.select_index(selectbox.proto.default)
+
+
+def run_app_load(users: int, turns: int, prompt_words: int = 50, seed: int = 0) -> LoadReport:
+    """Hold `users` app sessions open and send `turns` chat messages from each, round robin"""
+    from streamlit.testing.v1 import AppTest
+
+    controller = controller_from_env()
+    set_controller(controller)
+    # The first run pays for imports and shared resources, which no single session owns
+    AppTest.from_file(APP_PATH, default_timeout=APP_TIMEOUT).run()
+    tracemalloc.start()
+    gc.collect()
+    heap_before, rss_before = tracemalloc.get_traced_memory()[0], rss_kb()
+
+    samples: List[Sample] = []
+    rngs = [random.Random(f"{seed}:{index}") for index in range(users)]
+    start = time.perf_counter()
+    sessions = [AppTest.from_file(APP_PATH, default_timeout=APP_TIMEOUT).run() for _ in range(users)]
+    for _ in range(turns):
+        for index, session in enumerate(sessions):
+            keep_selections(session)
+            turn_start = time.perf_counter()
+            session.chat_input[0].set_value(user_prompt(rngs[index], prompt_words)).run()
+            problems = [element.value for element in list(session.exception) + list(session.error)]
+            samples.append(Sample(index, time.perf_counter() - turn_start, None, not problems,
+                                  "; ".join(map(str, problems)) or None))
+    duration = time.perf_counter() - start
+
+    gc.collect()
+    memory = {"python_heap": (tracemalloc.get_traced_memory()[0] - heap_before) / 1024 / users,
+              "rss": (rss_kb() - rss_before) / users}
+    tracemalloc.stop()
+    return LoadReport("app", users, samples, duration, controller_stats=controller.snapshot(),
+                      memory_per_session=memory)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Load-test the O3-Pro client or app against a mock Responses API")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    def add_common(command):
+        command.add_argument("--users", type=int, default=16, help="Simultaneous users")
+        command.add_argument("--prompt-words", type=int, default=50, help="Filler words per prompt")
+        command.add_argument("--seed", type=int, default=1, help="Seed for prompts, latencies and errors")
+        command.add_argument("--url", help="Use a running server instead of starting the mock")
+        command.add_argument("--latency", default="lognormal:0.3,1", help="Mock latency, as mock_server.py --latency")
+        command.add_argument("--token-delay", type=float, default=0.0, help="Mock seconds between streamed words")
+        command.add_argument("--reply-words", type=int, default=60, help="Words in each mock answer")
+        command.add_argument("--error-rate", type=parse_error_rate, action="append", default=[],
+                             metavar="STATUS=RATE", help="Mock share of requests answered with STATUS")
+        command.add_argument("--stream-failure-rate", type=float, default=0.0,
+                             help="Mock share of streams that fail halfway")
+        command.add_argument("--retry-after", type=float, default=0.2, help="Mock Retry-After seconds for 429s")
+        command.add_argument("--json", help="Also write the summary as JSON to this file")
+
+    client = commands.add_parser("client", help="Concurrent requests through AzureO3ProClient")
+    add_common(client)
+    client.add_argument("--requests", type=int, default=20, help="Requests per user")
+    client.add_argument("--mode", choices=MODES, default="create")
+    client.add_argument("--think-time", type=float, default=0.0, help="Mean seconds between a user's requests")
+
+    app = commands.add_parser("app", help="Chat turns through the Streamlit app's testing API")
+    add_common(app)
+    app.set_defaults(users=4)
+    app.add_argument("--turns", type=int, default=3, help="Chat messages per session")
+    return parser
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    logging.basicConfig(level=logging.WARNING, format="%(asctime)s %(levelname)s %(message)s")
+    client_log.setLevel(logging.CRITICAL)
+    args = build_parser().parse_args(argv)
+    server = None
+    if not args.url:
+        server = MockResponsesServer(latency=Latency.parse(args.latency), reply_text=reply_text(args.reply_words),
+                                     token_delay=args.token_delay,
+                                     error_rates=dict(args.error_rate), stream_failure_rate=args.stream_failure_rate,
+                                     retry_after=args.retry_after, seed=args.seed).start()
+    try:
+        with mock_environment(args.url or server.url):
+            if args.command == "client":
+                report = run_client_load(args.users, args.requests, args.mode, args.think_time,
+                                         args.prompt_words, args.seed)
+            else:
+                report = run_app_load(args.users, args.turns, args.prompt_words, args.seed)
+    finally:
+        if server:
+            server.stop()
+    if server:
+        report.server_stats = dict(server.stats)
+    print(report.format())
+    if args.json:
+        Path(args.json).write_text(json.dumps(report.summary(), indent=2), encoding="utf-8")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,393 @@
+"""Local mock of the Azure OpenAI /openai/responses endpoint for tests and load tests
+
+Usage: python mock_server.py [--port 8765] [--latency lognormal:1,4] [--token-delay 0.02]
+                             [--error-rate 429=0.05 --error-rate 503=0.01] [--seed 1]
+"""
+import argparse
+import hashlib
+import json
+import math
+import random
+import socket
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Optional, Union
+from urllib.parse import urlsplit
+
+RESPONSES_PATH = "/openai/responses"
+# Like the service, prompt caching starts at 1024 prompt tokens and grows in 128 token steps
+PROMPT_CACHE_MIN_TOKENS = 1024
+PROMPT_CACHE_INCREMENT = 128
+# Reasoning tokens reported when a request sets a reasoning effort
+REASONING_TOKENS = {"low": 128, "medium": 512, "high": 2048}
+# z-score of the 95th percentile, for lognormal latencies given by median and p95
+Z_95 = 1.645
+
+
+class Latency:
+    """Seconds a request takes: constant, uniform between two bounds, or lognormal by median and p95"""
+
+    def __init__(self, kind: str = "constant", *params: float):
+        if kind not in ("constant", "uniform", "lognormal"):
+            raise ValueError(f"Unknown latency distribution: {kind}")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "Latency"]) -> "Latency":
+        """From a number of seconds or a spec such as "uniform:0.2,1" or "lognormal:0.5,2" """
+        if isinstance(spec, Latency):
+            return spec
+        if isinstance(spec, (int, float)):
+            return cls("constant", float(spec))
+        kind, _, params = spec.partition(":")
+        if not params:
+            return cls("constant", float(kind))
+        return cls(kind, *(float(param) for param in params.split(",")))
+
+    def sample(self, rng: random.Random) -> float:
+        if self.kind == "constant":
+            return self.params[0]
+        if self.kind == "uniform":
+            return rng.uniform(*self.params)
+        median, p95 = self.params
+        return rng.lognormvariate(math.log(median), math.log(p95 / median) / Z_95)
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(f'{param:g}' for param in self.params)}"
+
+
+def build_response(text: str, response_id: str = None) -> Dict:
+    """Build a completed response body in the Responses API format"""
+    return {
+        "id": response_id or f"resp_{uuid.uuid4().hex}",
+        "object": "response",
+        "status": "completed",
+        "output": [
+            {
+                "type": "message",
+                "role": "assistant",
+                "content": [{"type": "output_text", "text": text}],
+            }
+        ],
+        "usage": {"input_tokens": 0, "output_tokens": len(text.split()), "total_tokens": len(text.split())},
+    }
+
+
+class MockResponsesHandler(BaseHTTPRequestHandler):
+    """Answers POST /openai/responses with a canned completion, streamed on request"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def setup(self):
+        super().setup()
+        self._count("connections")
+        with self.server.stats_lock:
+            self.server.open_connections.add(self.connection)
+
+    def finish(self):
+        with self.server.stats_lock:
+            self.server.open_connections.discard(self.connection)
+        super().finish()
+
+    def _count(self, key: str):
+        with self.server.stats_lock:
+            self.server.stats[key] = self.server.stats.get(key, 0) + 1
+
+    def log_message(self, format, *args):
+        pass
+
+    def _read_json(self) -> Dict:
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length) if length else b""
+        try:
+            return json.loads(body or b"{}")
+        except json.JSONDecodeError:
+            return {}
+
+    def _send_json(self, status: int, body: Dict, headers: Dict = None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _usage(self, payload: Dict, body: Dict) -> Dict:
+        """Usage for a request, counting a repeated instructions prefix as cached (4 bytes per token)"""
+        instructions = payload.get("instructions") or ""
+        items = payload.get("input")
+        if isinstance(items, str):
+            items = [{"content": [{"text": items}]}]
+        input_bytes = len(instructions.encode("utf-8")) + sum(
+            len(part.get("text", "").encode("utf-8")) for item in items or [] for part in item.get("content") or []
+        )
+        prefix_tokens = len(instructions.encode("utf-8")) // 4
+        cached = 0
+        if prefix_tokens >= PROMPT_CACHE_MIN_TOKENS:
+            digest = hashlib.sha256(instructions.encode("utf-8")).hexdigest()
+            with self.server.stats_lock:
+                if digest in self.server.prompt_cache:
+                    cached = prefix_tokens - prefix_tokens % PROMPT_CACHE_INCREMENT
+                self.server.prompt_cache.add(digest)
+        reasoning = REASONING_TOKENS.get((payload.get("reasoning") or {}).get("effort"), 0)
+        output_tokens = body["usage"]["output_tokens"] + reasoning
+        return {"input_tokens": input_bytes // 4, "input_tokens_details": {"cached_tokens": cached},
+                "output_tokens": output_tokens, "output_tokens_details": {"reasoning_tokens": reasoning},
+                "total_tokens": input_bytes // 4 + output_tokens}
+
+    def _write_chunk(self, data: bytes):
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+
+    def _send_event(self, event: Dict):
+        self._write_chunk(f"event: {event['type']}\ndata: {json.dumps(event)}\n\n".encode("utf-8"))
+
+    def _send_stream(self, body: Dict, fail: bool = False):
+        """Stream the response as Responses API server-sent events, one word per delta
+
+        With fail, the stream ends with response.failed halfway through the text.
+        """
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        self._send_event({"type": "response.created", "response": {**body, "status": "in_progress", "output": []}})
+        text = body["output"][0]["content"][0]["text"]
+        words = text.split(" ")
+        for index, word in enumerate(words):
+            if fail and index == len(words) // 2:
+                self._count("stream_failures")
+                self._send_event({"type": "response.failed", "response": {
+                    **body, "status": "failed", "error": {"code": "server_error", "message": "Injected stream failure"}
+                }})
+                self._write_chunk(b"")
+                return
+            if self.server.token_delay:
+                time.sleep(self.server.token_delay)
+            delta = word if index == 0 else " " + word
+            self._send_event({"type": "response.output_text.delta", "output_index": 0,
+                              "content_index": 0, "delta": delta})
+        self._send_event({"type": "response.output_text.done", "output_index": 0,
+                          "content_index": 0, "text": text})
+        self._send_event({"type": "response.completed", "response": body})
+        self._write_chunk(b"")
+
+    def do_POST(self):
+        payload = self._read_json()
+        self._count("requests")
+        path = urlsplit(self.path).path.rstrip("/")
+        if path.startswith(RESPONSES_PATH + "/") and path.endswith("/cancel"):
+            self._cancel_background(path[len(RESPONSES_PATH) + 1:-len("/cancel")])
+            return
+        if path != RESPONSES_PATH:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        with self.server.stats_lock:
+            scripted = self.server.scripted.pop(0) if self.server.scripted else None
+            if scripted is None:
+                scripted = self._injected_error()
+            latency = self._sample_latency()
+            stream_fails = self.server.stream_failure_rate and self.server.rng.random() < self.server.stream_failure_rate
+        if scripted is not None:
+            status, headers = scripted
+            self._count(f"status_{status}")
+            self._send_json(status, {"error": {"code": str(status), "message": "Scripted failure"}}, headers)
+            return
+        if payload.get("background"):
+            self._start_background(payload, latency)
+            return
+        with self.server.stats_lock:
+            stats = self.server.stats
+            stats["in_flight"] = stats.get("in_flight", 0) + 1
+            stats["max_in_flight"] = max(stats.get("max_in_flight", 0), stats["in_flight"])
+        try:
+            if latency:
+                time.sleep(latency)
+            body = build_response(self.server.reply_text)
+            body["usage"] = self._usage(payload, body)
+            if payload.get("stream"):
+                self._send_stream(body, fail=stream_fails)
+            else:
+                self._send_json(200, body)
+        finally:
+            with self.server.stats_lock:
+                self.server.stats["in_flight"] -= 1
+
+    def _sample_latency(self) -> float:
+        """Called with stats_lock held, so the seeded sequence is the same from run to run"""
+        latency = self.server.latency
+        return latency.sample(self.server.rng) if isinstance(latency, Latency) else latency
+
+    def _injected_error(self):
+        """(status, headers) for a randomly injected error, or None; called with stats_lock held"""
+        roll = self.server.rng.random()
+        for status, rate in self.server.error_rates.items():
+            if roll < rate:
+                headers = {"Retry-After": f"{self.server.retry_after:g}"} if status == 429 else {}
+                return status, headers
+            roll -= rate
+        return None
+
+    def do_GET(self):
+        self._count("requests")
+        with self.server.stats_lock:
+            scripted = self.server.scripted_retrieves.pop(0) if self.server.scripted_retrieves else None
+        if scripted is not None:
+            status, headers = scripted
+            self._count(f"status_{status}")
+            self._send_json(status, {"error": {"code": str(status), "message": "Scripted failure"}}, headers)
+            return
+        path = urlsplit(self.path).path.rstrip("/")
+        job = self._background_job(path[len(RESPONSES_PATH) + 1:]) if path.startswith(RESPONSES_PATH + "/") else None
+        if job is None:
+            self._send_json(404, {"error": {"message": "Not found"}})
+            return
+        self._send_json(200, job)
+
+    def _start_background(self, payload: Dict, latency: float):
+        """Queue a background response that completes after the sampled latency"""
+        body = build_response(self.server.reply_text)
+        body["usage"] = self._usage(payload, body)
+        with self.server.stats_lock:
+            self.server.background[body["id"]] = {"ready_at": time.time() + latency,
+                                                  "body": body, "status": "queued"}
+        self._send_json(200, {"id": body["id"], "object": "response", "status": "queued", "output": []})
+
+    def _background_job(self, response_id: str):
+        with self.server.stats_lock:
+            job = self.server.background.get(response_id)
+            if job is None:
+                return None
+            if job["status"] in ("queued", "in_progress"):
+                job["status"] = "completed" if time.time() >= job["ready_at"] else "in_progress"
+            if job["status"] == "completed":
+                return job["body"]
+            return {"id": response_id, "object": "response", "status": job["status"], "output": []}
+
+    def _cancel_background(self, response_id: str):
+        with self.server.stats_lock:
+            job = self.server.background.get(response_id)
+            if job is not None and job["status"] in ("queued", "in_progress"):
+                job["status"] = "cancelled"
+        body = self._background_job(response_id)
+        if body is None:
+            self._send_json(404, {"error": {"message": "Not found"}})
+        else:
+            self._send_json(200, body)
+
+
+class _MockHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # The default backlog of 5 resets connections when many load-test users connect at once
+    request_queue_size = 128
+
+
+class MockResponsesServer:
+    """Runs the mock endpoint on a background thread"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: Union[float, str, Latency] = 0.0,
+                 reply_text: str = "Test successful", token_delay: float = 0.0, failure_rate: float = 0.0,
+                 error_rates: Optional[Dict[int, float]] = None, stream_failure_rate: float = 0.0,
+                 retry_after: float = 1, seed: Optional[int] = None):
+        self.httpd = _MockHTTPServer((host, port), MockResponsesHandler)
+        # Seconds, or a Latency distribution sampled per request
+        self.httpd.latency = latency if isinstance(latency, (int, float)) else Latency.parse(latency)
+        self.httpd.reply_text = reply_text
+        self.httpd.token_delay = token_delay
+        # Share of create requests answered with each error status; failure_rate is a 503 share
+        self.httpd.error_rates = dict(error_rates or {})
+        if failure_rate:
+            self.httpd.error_rates[503] = self.httpd.error_rates.get(503, 0.0) + failure_rate
+        self.httpd.stream_failure_rate = stream_failure_rate
+        self.httpd.retry_after = retry_after
+        self.httpd.rng = random.Random(seed)
+        self.httpd.stats = {"connections": 0, "requests": 0, "in_flight": 0, "max_in_flight": 0}
+        self.httpd.stats_lock = threading.Lock()
+        self.httpd.background = {}
+        self.httpd.scripted = []
+        self.httpd.scripted_retrieves = []
+        self.httpd.open_connections = set()
+        self.httpd.prompt_cache = set()
+        self._thread = None
+
+    def script(self, status: int, headers: Dict = None, times: int = 1, retrieve: bool = False):
+        """Answer the next `times` create requests with `status` and `headers`, e.g. a 429 with Retry-After
+
+        With retrieve, the next background-response retrievals are answered instead.
+        """
+        with self.httpd.stats_lock:
+            scripted = self.httpd.scripted_retrieves if retrieve else self.httpd.scripted
+            scripted.extend([(status, headers or {})] * times)
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/"
+
+    @property
+    def stats(self) -> Dict:
+        return self.httpd.stats
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop serving and drop kept-alive connections, as an outage would"""
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        with self.httpd.stats_lock:
+            connections = list(self.httpd.open_connections)
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+def parse_error_rate(value: str):
+    """STATUS=RATE, e.g. 429=0.05"""
+    status, _, rate = value.partition("=")
+    return int(status), float(rate)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Serve a mock Azure OpenAI Responses API")
+    parser.add_argument("port", nargs="?", type=int, default=8765)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--latency", default="0", help='Seconds, "uniform:LOW,HIGH" or "lognormal:MEDIAN,P95"')
+    parser.add_argument("--token-delay", type=float, default=0.0, help="Seconds between streamed words")
+    parser.add_argument("--reply-text", default="Test successful")
+    parser.add_argument("--error-rate", type=parse_error_rate, action="append", default=[], metavar="STATUS=RATE",
+                        help="Share of requests answered with STATUS; repeatable")
+    parser.add_argument("--stream-failure-rate", type=float, default=0.0,
+                        help="Share of streams that fail halfway with response.failed")
+    parser.add_argument("--retry-after", type=float, default=1, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for latencies and injected errors")
+    args = parser.parse_args(argv)
+    server = MockResponsesServer(args.host, args.port, Latency.parse(args.latency), args.reply_text,
+                                 args.token_delay, error_rates=dict(args.error_rate),
+                                 stream_failure_rate=args.stream_failure_rate, retry_after=args.retry_after,
+                                 seed=args.seed)
+    print(f"Mock Responses API listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+"""Parallel, page-streaming PDF text extraction"""
+import io
+import math
+import multiprocessing
+import os
+import time
+from typing import BinaryIO, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+
+DEFAULT_MAX_PAGES = 2000
+DEFAULT_TIME_BUDGET = 120.0
+# Below this many pages, worker start-up costs more than it saves
+DEFAULT_PARALLEL_THRESHOLD = 48
+# Ranges handed out per worker, so a slow range does not stall the whole pool
+RANGES_PER_WORKER = 4
+
+_worker_reader = None
+
+
+def default_workers() -> int:
+    return max(1, min(os.cpu_count() or 1, 4))
+
+
+def _mp_context():
+    """forkserver where available: cheap forks without inheriting the caller's threads"""
+    if "forkserver" in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context("forkserver")
+        # Import the main script and this module once in the server, not in every worker
+        context.set_forkserver_preload(["__main__", __name__])
+        return context
+    return multiprocessing.get_context("spawn")
+
+
+def _init_worker(data: bytes):
+    """Parse the document once per worker process"""
+    global _worker_reader
+    _worker_reader = PyPDF2.PdfReader(io.BytesIO(data))
+
+
+def _extract_range(start: int, stop: int) -> List[Tuple[int, str]]:
+    return [(number + 1, _worker_reader.pages[number].extract_text() or "") for number in range(start, stop)]
+
+
+class PdfPageStream:
+    """Iterates (page_number, text) in page order within a page and time budget
+
+    Large documents are split into page ranges across a process pool; small
+    ones are read in-process. After iteration `truncated` tells whether a
+    budget cut the document short and `pages_read` how many pages the last
+    pass yielded; a stream can be iterated again. `data` may be bytes or a seekable file
+    such as an mmap; files are only copied into memory for worker processes.
+    """
+
+    def __init__(self, data: Union[bytes, BinaryIO], max_pages: int = DEFAULT_MAX_PAGES,
+                 time_budget: Optional[float] = DEFAULT_TIME_BUDGET, workers: Optional[int] = None,
+                 parallel_threshold: int = DEFAULT_PARALLEL_THRESHOLD):
+        self.data = data
+        self.reader = PyPDF2.PdfReader(data if hasattr(data, "seek") else io.BytesIO(data))
+        self.total_pages = len(self.reader.pages)
+        self.max_pages = max_pages
+        self.time_budget = time_budget
+        self.workers = workers or default_workers()
+        self.parallel_threshold = parallel_threshold
+        self.pages_read = 0
+        self.truncated = False
+
+    @property
+    def page_limit(self) -> int:
+        return min(self.total_pages, self.max_pages) if self.max_pages else self.total_pages
+
+    def __iter__(self) -> Iterator[Tuple[int, str]]:
+        self._deadline = time.monotonic() + self.time_budget if self.time_budget else None
+        self.truncated = self.page_limit < self.total_pages
+        self.pages_read = 0
+        if self.workers > 1 and self.page_limit >= self.parallel_threshold:
+            pages = self._iter_parallel()
+        else:
+            pages = self._iter_serial()
+        for page in pages:
+            self.pages_read += 1
+            yield page
+
+    def _bytes(self) -> bytes:
+        if isinstance(self.data, bytes):
+            return self.data
+        self.data.seek(0)
+        return self.data.read()
+
+    def _remaining(self) -> Optional[float]:
+        if self._deadline is None:
+            return None
+        return self._deadline - time.monotonic()
+
+    def _iter_serial(self) -> Iterator[Tuple[int, str]]:
+        for number in range(self.page_limit):
+            remaining = self._remaining()
+            if remaining is not None and remaining <= 0:
+                self.truncated = True
+                return
+            yield number + 1, self.reader.pages[number].extract_text() or ""
+
+    def _iter_parallel(self) -> Iterator[Tuple[int, str]]:
+        limit = self.page_limit
+        size = max(1, math.ceil(limit / (self.workers * RANGES_PER_WORKER)))
+        pool = _mp_context().Pool(self.workers, initializer=_init_worker, initargs=(self._bytes(),))
+        try:
+            results = [pool.apply_async(_extract_range, (start, min(start + size, limit)))
+                       for start in range(0, limit, size)]
+            for result in results:
+                remaining = self._remaining()
+                try:
+                    if remaining is not None and remaining <= 0:
+                        raise multiprocessing.TimeoutError()
+                    pages = result.get(timeout=remaining)
+                except multiprocessing.TimeoutError:
+                    self.truncated = True
+                    return
+                yield from pages
+        finally:
+            # Terminated rather than shut down, so ranges still running after a budget
+            # expires or the caller stops reading do not keep burning worker CPU
+            pool.terminate()
+            pool.join()
+
@@ -0,0 +1,33 @@
+"""Token prices for estimating what a response cost"""
+from typing import Dict, NamedTuple, Optional
+
+from telemetry import usage_tokens
+from transport import env_number
+
+# USD per million tokens, o3-pro list prices; reasoning tokens bill as output
+DEFAULT_INPUT_PRICE = 20.0
+DEFAULT_OUTPUT_PRICE = 80.0
+
+
+class Pricing(NamedTuple):
+    """USD per million input, cached input and output tokens"""
+    input: float = DEFAULT_INPUT_PRICE
+    cached_input: float = DEFAULT_INPUT_PRICE
+    output: float = DEFAULT_OUTPUT_PRICE
+
+    def cost(self, usage: Optional[Dict]) -> float:
+        """Estimated USD cost of a Responses API usage block"""
+        tokens = usage_tokens(usage)
+        uncached = tokens["input"] - tokens["cached"]
+        return (uncached * self.input + tokens["cached"] * self.cached_input
+                + tokens["output"] * self.output) / 1_000_000
+
+
+def pricing_from_env() -> Pricing:
+    """Prices from O3PRO_PRICE_INPUT/CACHED_INPUT/OUTPUT, per million tokens"""
+    input_price = env_number("O3PRO_PRICE_INPUT", DEFAULT_INPUT_PRICE)
+    return Pricing(
+        input=input_price,
+        cached_input=env_number("O3PRO_PRICE_CACHED_INPUT", input_price),
+        output=env_number("O3PRO_PRICE_OUTPUT", DEFAULT_OUTPUT_PRICE),
+    )
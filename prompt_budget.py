@@ -0,0 +1,170 @@
+"""Token counting and budgeted prompt assembly"""
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, List, NamedTuple
+
+from conversation import estimate_tokens
+
+DEFAULT_INPUT_BUDGET = 180_000
+# Share of the budget attachments may use while history still needs room
+ATTACHMENT_SHARE = 0.6
+SUMMARY_SNIPPET_CHARS = 160
+SUMMARY_MAX_MESSAGES = 20
+# Per-message framing overhead ("User: " prefixes and separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Room left for the "[Truncated: ...]" note appended to a cut attachment
+TRUNCATION_NOTE_TOKENS = 16
+DEFAULT_CACHE_SIZE = 4096
+
+
+def _load_encoding():
+    """o200k_base via tiktoken when it is installed and its vocabulary is available"""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("o200k_base")
+    except Exception:
+        return None
+
+
+class TokenCounter:
+    """Counts tokens with tiktoken when available, else estimates; counts are memoized"""
+
+    def __init__(self, max_entries: int = DEFAULT_CACHE_SIZE):
+        self.encoding = _load_encoding()
+        self.max_entries = max_entries
+        self._counts: "OrderedDict[bytes, int]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    @property
+    def exact(self) -> bool:
+        return self.encoding is not None
+
+    def count(self, text: str) -> int:
+        # A digest rather than hash(): two texts of equal length can share a hash, and the
+        # cache must not hand one the other's count; it also avoids keeping large texts alive
+        key = hashlib.sha1(text.encode("utf-8", "surrogatepass")).digest()
+        with self._lock:
+            cached = self._counts.get(key)
+            if cached is not None:
+                self._counts.move_to_end(key)
+                return cached
+        if self.encoding is not None:
+            tokens = len(self.encoding.encode(text, disallowed_special=()))
+        else:
+            tokens = estimate_tokens(len(text.encode("utf-8")))
+        with self._lock:
+            self._counts[key] = tokens
+            while len(self._counts) > self.max_entries:
+                self._counts.popitem(last=False)
+        return tokens
+
+    def count_message(self, message: Dict) -> int:
+        return self.count(message.get("content", "")) + MESSAGE_OVERHEAD_TOKENS
+
+
+class PromptAssembly(NamedTuple):
+    messages: List[Dict]
+    input_tokens: int
+    dropped_messages: int
+    truncated_files: List[str]
+
+    @property
+    def trimmed(self) -> bool:
+        return bool(self.dropped_messages or self.truncated_files)
+
+
+def truncate_to_tokens(text: str, tokens: int, limit: int) -> str:
+    """Cut text proportionally so roughly `limit` of its `tokens` remain"""
+    if tokens <= limit:
+        return text
+    keep = max(0, int(len(text) * limit / tokens))
+    return text[:keep] + f"\n[Truncated: about {tokens - limit:,} tokens omitted]"
+
+
+def summarize_dropped(messages: List[Dict]) -> str:
+    """Compact extractive summary of turns that no longer fit the budget"""
+    lines = [f"[Earlier conversation: {len(messages)} messages omitted to fit the context budget. Opening lines:"]
+    for message in messages[-SUMMARY_MAX_MESSAGES:]:
+        snippet = " ".join(message.get("content", "").split())[:SUMMARY_SNIPPET_CHARS]
+        lines.append(f"- {message.get('role', '').capitalize()}: {snippet}")
+    return "\n".join(lines) + "]"
+
+
+def format_attachments(attachments: Dict[str, str]) -> str:
+    file_context = "\n\nAttached files content:\n"
+    for filename, content in attachments.items():
+        file_context += f"\n--- {filename} ---\n{content}\n"
+    return file_context
+
+
+def assemble_messages(system_prompt: str, attachments: Dict[str, str], history: List[Dict],
+                      budget: int, counter: TokenCounter, count_only: bool = False) -> PromptAssembly:
+    """Build the request messages within `budget` input tokens
+
+    The system prompt and the newest message are always kept. Attachments
+    are truncated to leave room for history, then the oldest turns are
+    dropped and replaced by a short summary in a second system message.
+    With count_only the messages are not built, which keeps per-rerun
+    estimates cheap.
+    """
+    newest = history[-1:]
+    older = history[:-1]
+    fixed = counter.count(system_prompt) + MESSAGE_OVERHEAD_TOKENS + sum(counter.count_message(m) for m in newest)
+    history_tokens = [counter.count_message(m) for m in older]
+
+    truncated_files = []
+    system_content = system_prompt
+    if attachments:
+        # Counts of the unchanged attachment strings come from the cache
+        file_tokens = {name: counter.count(content) for name, content in attachments.items()}
+        total_file_tokens = sum(file_tokens.values())
+        fixed += MESSAGE_OVERHEAD_TOKENS + sum(counter.count(name) + MESSAGE_OVERHEAD_TOKENS for name in attachments)
+        available = budget - fixed - min(sum(history_tokens), int(budget * (1 - ATTACHMENT_SHARE)))
+        if total_file_tokens > available:
+            # Every file keeps the same fraction of itself
+            ratio = max(0, available) / total_file_tokens
+            limits = {name: max(0, int(tokens * ratio) - TRUNCATION_NOTE_TOKENS)
+                      for name, tokens in file_tokens.items()}
+            if not count_only:
+                attachments = {name: truncate_to_tokens(content, file_tokens[name], limits[name])
+                               for name, content in attachments.items()}
+            truncated_files = list(attachments)
+            file_tokens = {name: limit + TRUNCATION_NOTE_TOKENS for name, limit in limits.items()}
+        if not count_only:
+            system_content += format_attachments(attachments)
+        fixed += sum(file_tokens.values())
+
+    # Keep the newest turns that fit
+    remaining = budget - fixed
+    first_kept = len(older)
+    used = 0
+    while first_kept > 0 and used + history_tokens[first_kept - 1] <= remaining:
+        first_kept -= 1
+        used += history_tokens[first_kept]
+    summary = None
+    if first_kept:
+        # Make room for the summary of dropped turns by dropping more if needed
+        summary = summarize_dropped(older[:first_kept])
+        while first_kept < len(older) and used + counter.count(summary) > remaining:
+            used -= history_tokens[first_kept]
+            first_kept += 1
+            summary = summarize_dropped(older[:first_kept])
+        if used + counter.count(summary) <= remaining:
+            used += counter.count(summary)
+        else:
+            summary = None
+    dropped = older[:first_kept]
+    kept_history = older[first_kept:]
+
+    if count_only:
+        return PromptAssembly([], fixed + used, len(dropped), truncated_files)
+
+    messages = [{"role": "system", "content": system_content}]
+    if summary:
+        # Kept out of the system message so the prompt prefix stays byte-stable
+        messages.append({"role": "system", "content": summary})
+    messages.extend(kept_history)
+    messages.extend(newest)
+    return PromptAssembly(messages, fixed + used, len(dropped), truncated_files)
+
@@ -0,0 +1,247 @@
+"""Client-side admission control and retry policy for Azure OpenAI rate limits"""
+import email.utils
+import random
+import re
+import threading
+import time
+from typing import Dict, Mapping, Optional
+
+from transport import env_number
+
+# Statuses worth retrying: throttling and transient gateway/service failures
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+DEFAULT_MAX_RETRIES = 4
+DEFAULT_BASE_DELAY = 1.0
+DEFAULT_MAX_DELAY = 60.0
+# Azure enforces per-minute quotas over short windows, so allow about 10 seconds' worth of burst
+DEFAULT_BURST_SECONDS = 10.0
+# Quota key for callers that don't name an endpoint
+DEFAULT_ENDPOINT = "default"
+
+_DURATION_RE = re.compile(r"(\d+(?:\.\d+)?)(ms|s|m|h)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+_controller: Optional["ThroughputController"] = None
+_controller_lock = threading.Lock()
+
+
+def _parse_duration(value: str) -> Optional[float]:
+    """Seconds in a reset header such as '20ms', '1s' or '6m0s'"""
+    parts = _DURATION_RE.findall(value)
+    if not parts:
+        try:
+            return float(value)
+        except ValueError:
+            return None
+    return sum(float(amount) * _DURATION_UNITS[unit] for amount, unit in parts)
+
+
+def parse_retry_after(headers: Optional[Mapping]) -> Optional[float]:
+    """Seconds the server asked us to wait, from retry-after-ms or Retry-After"""
+    if not headers:
+        return None
+    value = headers.get("retry-after-ms")
+    if value:
+        try:
+            return max(0.0, float(value) / 1000)
+        except ValueError:
+            pass
+    value = headers.get("retry-after")
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        # Retry-After may also be an HTTP date
+        return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class TokenBucket:
+    """Refills at `rate` units per second up to `capacity`
+
+    Callers reserve before waiting, so the level may go negative; the debt
+    makes later callers queue behind earlier ones in arrival order.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.level = capacity
+        self.updated = time.monotonic()
+
+    def reserve(self, amount: float, now: float) -> float:
+        """Take `amount` and return the seconds until it is covered"""
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # An oversized request waits for a full bucket rather than forever
+        self.level -= min(amount, self.capacity)
+        return max(0.0, -self.level / self.rate)
+
+    def limit(self, remaining: float):
+        """Don't hand out more than the server says is left"""
+        self.level = min(self.level, remaining)
+
+
+class _Quota:
+    """Local buckets and pause of one endpoint"""
+
+    def __init__(self, rpm: Optional[float], tpm: Optional[float], burst_seconds: float):
+        self.requests = TokenBucket(rpm / 60, max(1.0, rpm / 60 * burst_seconds)) if rpm else None
+        self.tokens = TokenBucket(tpm / 60, max(1.0, tpm / 60 * burst_seconds)) if tpm else None
+        self.paused_until = 0.0
+
+
+class ThroughputController:
+    """Shared RPM/TPM admission control and retry policy for every client in the process
+
+    Quotas belong to a deployment, so each endpoint has its own buckets:
+    admit() blocks until a request fits the buckets of the endpoint it is
+    about to be sent to; observe() folds that endpoint's
+    x-ratelimit-remaining-* headers back in, and a 429 pauses every caller
+    of that endpoint for the server's Retry-After instead of letting each
+    one thrash on its own. Other endpoints are not held back.
+    """
+
+    def __init__(self, rpm: Optional[float] = None, tpm: Optional[float] = None,
+                 max_retries: int = DEFAULT_MAX_RETRIES, base_delay: float = DEFAULT_BASE_DELAY,
+                 max_delay: float = DEFAULT_MAX_DELAY, burst_seconds: float = DEFAULT_BURST_SECONDS):
+        self.rpm = rpm
+        self.tpm = tpm
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.burst_seconds = burst_seconds
+        # Endpoint name -> its quota, created on first use
+        self._quotas: Dict[str, _Quota] = {}
+        self._lock = threading.Lock()
+        self.stats = {"admitted": 0, "queue_depth": 0, "max_queue_depth": 0, "wait_seconds": 0.0,
+                      "max_wait": 0.0, "retries": 0, "throttled": 0, "gave_up": 0}
+
+    def _quota(self, endpoint: str) -> _Quota:
+        """Caller holds the lock"""
+        quota = self._quotas.get(endpoint)
+        if quota is None:
+            quota = self._quotas[endpoint] = _Quota(self.rpm, self.tpm, self.burst_seconds)
+        return quota
+
+    def admit(self, tokens: int = 0, endpoint: str = DEFAULT_ENDPOINT) -> float:
+        """Block until a request of about `tokens` input tokens may be sent to `endpoint`; returns seconds waited"""
+        start = time.monotonic()
+        with self._lock:
+            self.stats["queue_depth"] += 1
+            self.stats["max_queue_depth"] = max(self.stats["max_queue_depth"], self.stats["queue_depth"])
+            quota = self._quota(endpoint)
+            delay = 0.0
+            if quota.requests:
+                delay = max(delay, quota.requests.reserve(1, start))
+            if quota.tokens and tokens:
+                delay = max(delay, quota.tokens.reserve(tokens, start))
+        try:
+            if delay:
+                time.sleep(delay)
+            # A 429 from this endpoint seen by anyone while we queued holds us back too
+            while True:
+                with self._lock:
+                    pause = quota.paused_until - time.monotonic()
+                if pause <= 0:
+                    break
+                time.sleep(pause)
+        finally:
+            waited = time.monotonic() - start
+            with self._lock:
+                self.stats["queue_depth"] -= 1
+                self.stats["admitted"] += 1
+                self.stats["wait_seconds"] += waited
+                self.stats["max_wait"] = max(self.stats["max_wait"], waited)
+        return waited
+
+    def observe(self, headers: Mapping, endpoint: str = DEFAULT_ENDPOINT) -> float:
+        """Align an endpoint's buckets with the server's remaining quota
+
+        Returns the seconds the endpoint is paused for when the quota is
+        used up, else 0.
+        """
+        remaining_requests = headers.get("x-ratelimit-remaining-requests")
+        remaining_tokens = headers.get("x-ratelimit-remaining-tokens")
+        exhausted = []
+        with self._lock:
+            quota = self._quota(endpoint)
+            for value, bucket, reset_header in (
+                (remaining_requests, quota.requests, "x-ratelimit-reset-requests"),
+                (remaining_tokens, quota.tokens, "x-ratelimit-reset-tokens"),
+            ):
+                try:
+                    remaining = float(value)
+                except (TypeError, ValueError):
+                    continue
+                if bucket:
+                    bucket.limit(remaining)
+                if remaining <= 0:
+                    reset = headers.get(reset_header)
+                    exhausted.append((_parse_duration(reset) if reset else None) or self.base_delay)
+        if not exhausted:
+            return 0.0
+        self.pause(max(exhausted), endpoint)
+        return max(exhausted)
+
+    def pause(self, seconds: float, endpoint: str = DEFAULT_ENDPOINT):
+        """Hold back every caller of `endpoint` for `seconds`"""
+        with self._lock:
+            quota = self._quota(endpoint)
+            quota.paused_until = max(quota.paused_until, time.monotonic() + seconds)
+
+    def retry_delay(self, attempt: int, headers: Optional[Mapping] = None) -> float:
+        """Delay before retry number `attempt` (0-based)
+
+        A server hint is honoured with a little jitter on top so queued
+        callers don't all return at once; otherwise full-jitter
+        exponential backoff is used.
+        """
+        hinted = parse_retry_after(headers)
+        if hinted is not None:
+            return hinted + random.uniform(0, min(hinted, self.base_delay) * 0.25)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def record(self, name: str):
+        with self._lock:
+            self.stats[name] += 1
+
+    def snapshot(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            stats = dict(self.stats)
+            paused = {name: quota.paused_until - now for name, quota in self._quotas.items()
+                      if quota.paused_until > now}
+        admitted = stats["admitted"]
+        return {**stats, "avg_wait": stats["wait_seconds"] / admitted if admitted else 0.0,
+                "paused": paused, "rpm": self.rpm, "tpm": self.tpm}
+
+
+def controller_from_env() -> ThroughputController:
+    """A controller configured by AZURE_OPENAI_RPM/TPM/MAX_RETRIES; quotas are per endpoint, unset ones unlimited"""
+    return ThroughputController(
+        rpm=env_number("AZURE_OPENAI_RPM", None),
+        tpm=env_number("AZURE_OPENAI_TPM", None),
+        max_retries=max(0, env_number("AZURE_OPENAI_MAX_RETRIES", DEFAULT_MAX_RETRIES, int)),
+    )
+
+
+def get_controller() -> ThroughputController:
+    """Return the process-wide controller, creating it on first use"""
+    global _controller
+    if _controller is None:
+        with _controller_lock:
+            if _controller is None:
+                _controller = controller_from_env()
+    return _controller
+
+
+def set_controller(controller: ThroughputController):
+    """Replace the process-wide controller, e.g. with limits from the command line"""
+    global _controller
+    with _controller_lock:
+        _controller = controller
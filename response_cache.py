@@ -0,0 +1,132 @@
+"""Persistent SQLite cache of O3-Pro responses for identical prompts"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from pathlib import Path
+from typing import Dict, Optional
+
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS responses (
+    key TEXT PRIMARY KEY,
+    body TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created REAL NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used);
+"""
+
+
+class ResponseCache:
+    """SQLite-backed response cache with TTL and size-based LRU eviction
+
+    WAL mode lets several Streamlit sessions and processes read while one
+    writes; each thread uses its own connection.
+    """
+
+    def __init__(self, path: str, ttl: float = DEFAULT_TTL, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._stats_lock = threading.Lock()
+        self._local = threading.local()
+        with self._connection() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+
+    @staticmethod
+    def key(model: str, api_version: str, input_data, **options) -> str:
+        """Canonical hash of everything that determines the response"""
+        canonical = json.dumps(
+            {"model": model, "api_version": api_version, "input": input_data, **options},
+            sort_keys=True, separators=(",", ":"), ensure_ascii=False
+        )
+        return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+    def _connection(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA busy_timeout=30000")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _count(self, name: str, amount: int = 1):
+        with self._stats_lock:
+            self.stats[name] += amount
+
+    def get(self, key: str) -> Optional[Dict]:
+        now = time.time()
+        conn = self._connection()
+        row = conn.execute(
+            "SELECT body FROM responses WHERE key = ? AND created > ?", (key, now - self.ttl)
+        ).fetchone()
+        if row is None:
+            self._count("misses")
+            return None
+        conn.execute("UPDATE responses SET last_used = ? WHERE key = ?", (now, key))
+        self._count("hits")
+        return json.loads(row[0])
+
+    def put(self, key: str, body: Dict):
+        data = json.dumps(body, ensure_ascii=False)
+        now = time.time()
+        conn = self._connection()
+        conn.execute(
+            "INSERT OR REPLACE INTO responses (key, body, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now, now)
+        )
+        self._count("stores")
+        self._evict(now)
+
+    def _evict(self, now: float):
+        """Drop expired entries, then least recently used ones until under the size budget"""
+        conn = self._connection()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            evicted = conn.execute("DELETE FROM responses WHERE created <= ?", (now - self.ttl,)).rowcount
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+            if total > self.max_bytes:
+                for key, size in conn.execute("SELECT key, size FROM responses ORDER BY last_used").fetchall():
+                    if total <= self.max_bytes:
+                        break
+                    conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                    total -= size
+                    evicted += 1
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        if evicted:
+            self._count("evictions", evicted)
+
+    def snapshot(self) -> Dict:
+        """Process-local counters plus the shared cache's size"""
+        entries, size = self._connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses"
+        ).fetchone()
+        with self._stats_lock:
+            stats = dict(self.stats)
+        lookups = stats["hits"] + stats["misses"]
+        return {**stats, "entries": entries, "bytes": size, "hit_rate": stats["hits"] / lookups if lookups else 0.0}
+
+
+def response_cache_from_env() -> Optional[ResponseCache]:
+    """The cache configured by O3PRO_RESPONSE_CACHE_* variables, or None when not enabled"""
+    path = os.getenv("O3PRO_RESPONSE_CACHE_PATH")
+    if not path:
+        return None
+    return ResponseCache(
+        path,
+        ttl=float(os.getenv("O3PRO_RESPONSE_CACHE_TTL", DEFAULT_TTL)),
+        max_bytes=int(float(os.getenv("O3PRO_RESPONSE_CACHE_MAX_MB", DEFAULT_MAX_BYTES / 1024 / 1024)) * 1024 * 1024)
+    )
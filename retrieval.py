@@ -0,0 +1,286 @@
+"""Local BM25 retrieval over attached file text"""
+import hashlib
+import math
+import re
+from array import array
+from collections import Counter
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from conversation import estimate_tokens
+
+DEFAULT_CHUNK_WORDS = 200
+DEFAULT_CHUNK_OVERLAP = 40
+DEFAULT_TOP_K = 8
+DEFAULT_TOKEN_BUDGET = 8000
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_TOKEN_RE = re.compile(r"\w+")
+# Words are found in UTF-8 bytes so chunks can be recorded as byte spans of the stored text
+_WORD_RE = re.compile(rb"\S+")
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_RE.findall(text.lower())
+
+
+def _windows(pieces: Iterable[str], chunk_words: int, overlap: int) -> Iterator[Tuple[int, int, bytes]]:
+    """(start, end, bytes) of overlapping word windows, as UTF-8 byte offsets into the joined pieces"""
+    step = max(1, chunk_words - overlap)
+    buffer = b""
+    # Byte offset of the buffer in the whole text
+    base = 0
+    for piece in pieces:
+        buffer += piece.encode("utf-8")
+        spans = [match.span() for match in _WORD_RE.finditer(buffer)]
+        if spans and spans[-1][1] == len(buffer):
+            # The last word may continue in the next piece
+            spans.pop()
+        start = 0
+        # A window is final only once more words than it holds are known to follow its start
+        while start + chunk_words < len(spans):
+            window = spans[start:start + chunk_words]
+            yield base + window[0][0], base + window[-1][1], buffer[window[0][0]:window[-1][1]]
+            start += step
+        if start:
+            cut = spans[start][0]
+            buffer = buffer[cut:]
+            base += cut
+    spans = [match.span() for match in _WORD_RE.finditer(buffer)]
+    for start in range(0, len(spans), step):
+        window = spans[start:start + chunk_words]
+        yield base + window[0][0], base + window[-1][1], buffer[window[0][0]:window[-1][1]]
+        if start + chunk_words >= len(spans):
+            break
+
+
+def chunk_stream(pieces: Iterable[str], chunk_words: int = DEFAULT_CHUNK_WORDS,
+                 overlap: int = DEFAULT_CHUNK_OVERLAP) -> Iterator[str]:
+    """Overlapping windows of roughly `chunk_words` words from text arriving in pieces
+
+    Yields the same windows as chunk_text over the joined text, holding
+    only the current piece and the unfinished window in memory.
+    """
+    for _, _, chunk in _windows(pieces, chunk_words, overlap):
+        yield chunk.decode("utf-8")
+
+
+def chunk_text(text: str, chunk_words: int = DEFAULT_CHUNK_WORDS,
+               overlap: int = DEFAULT_CHUNK_OVERLAP) -> List[str]:
+    """Split text into overlapping windows of roughly `chunk_words` words"""
+    return list(chunk_stream([text], chunk_words, overlap))
+
+
+class Passage(NamedTuple):
+    source: str
+    text: str
+    score: float
+    tokens: int
+
+
+class DocumentIndex:
+    """BM25 postings and chunk spans of one document
+
+    Chunk text is not kept: `read(start, end)` returns the text between
+    two UTF-8 byte offsets, e.g. from the document's file in the text
+    store, and is only called for passages that are selected. An index
+    depends only on the document, so it can be shared by every session
+    that attaches it.
+    """
+
+    def __init__(self, pieces: Iterable[str], read: Callable[[int, int], Optional[str]],
+                 chunk_words: int = DEFAULT_CHUNK_WORDS, overlap: int = DEFAULT_CHUNK_OVERLAP):
+        self.read = read
+        self.starts = array("Q")
+        self.ends = array("Q")
+        self.lengths = array("I")
+        # term -> (chunk ids, term frequencies), stored compactly
+        self.postings: Dict[str, tuple] = {}
+        for start, end, chunk in _windows(pieces, chunk_words, overlap):
+            chunk_id = len(self.starts)
+            counts = Counter(tokenize(chunk.decode("utf-8")))
+            for term, tf in counts.items():
+                ids, tfs = self.postings.setdefault(term, (array("I"), array("I")))
+                ids.append(chunk_id)
+                tfs.append(tf)
+            self.starts.append(start)
+            self.ends.append(end)
+            self.lengths.append(sum(counts.values()))
+        self.total_length = sum(self.lengths)
+
+    @classmethod
+    def from_text(cls, text: str, chunk_words: int = DEFAULT_CHUNK_WORDS,
+                  overlap: int = DEFAULT_CHUNK_OVERLAP) -> "DocumentIndex":
+        """An index over text held in memory"""
+        data = text.encode("utf-8")
+        return cls([text], lambda start, end: data[start:end].decode("utf-8"), chunk_words, overlap)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def document_frequency(self, term: str) -> int:
+        posting = self.postings.get(term)
+        return len(posting[0]) if posting else 0
+
+    def scores(self, idf: Dict[str, float], avg_length: float) -> np.ndarray:
+        """BM25 score of every chunk, given idf and average chunk length over all searched documents"""
+        lengths = np.frombuffer(self.lengths, dtype=np.uintc).astype(np.float64)
+        norm = K1 * (1 - B + B * lengths / avg_length)
+        scores = np.zeros(len(self))
+        for term, weight in idf.items():
+            posting = self.postings.get(term)
+            if posting is None:
+                continue
+            ids = np.frombuffer(posting[0], dtype=np.uintc)
+            tfs = np.frombuffer(posting[1], dtype=np.uintc).astype(np.float64)
+            scores[ids] += weight * tfs * (K1 + 1) / (tfs + norm[ids])
+        return scores
+
+    def tokens(self, chunk_id: int) -> int:
+        return estimate_tokens(self.ends[chunk_id] - self.starts[chunk_id])
+
+    def text(self, chunk_id: int) -> Optional[str]:
+        return self.read(self.starts[chunk_id], self.ends[chunk_id])
+
+
+class BM25Index:
+    """BM25 search over a set of documents that can be added to and removed from incrementally
+
+    Each document has its own DocumentIndex; scores use statistics over
+    all of them, so ranking is the same as for one combined index.
+    """
+
+    def __init__(self, chunk_words: int = DEFAULT_CHUNK_WORDS, overlap: int = DEFAULT_CHUNK_OVERLAP):
+        self.chunk_words = chunk_words
+        self.overlap = overlap
+        # source -> its index, and the hash or content key it was built from
+        self.documents: Dict[str, DocumentIndex] = {}
+        self.hashes: Dict[str, str] = {}
+
+    def __len__(self) -> int:
+        return sum(len(document) for document in self.documents.values())
+
+    @staticmethod
+    def content_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def add_document(self, source: str, text: str):
+        """Index a document, replacing any earlier version with the same source name"""
+        digest = self.content_hash(text)
+        if self.hashes.get(source) != digest:
+            self.documents[source] = DocumentIndex.from_text(text, self.chunk_words, self.overlap)
+            self.hashes[source] = digest
+
+    def remove_document(self, source: str):
+        self.documents.pop(source, None)
+        self.hashes.pop(source, None)
+
+    def sync(self, documents: Dict[str, str]):
+        """Make the index match `documents` (source -> text), touching only what changed"""
+        for source in list(self.documents):
+            if source not in documents:
+                self.remove_document(source)
+        for source, text in documents.items():
+            self.add_document(source, text)
+
+    def sync_keys(self, documents: Dict[str, str], index_for: Callable[[str], DocumentIndex]):
+        """Like sync, with documents given as source -> content key
+
+        `index_for(key)` returns a document's index, e.g. from a cache
+        shared between sessions, and is only called for documents that are
+        new or changed.
+        """
+        for source in list(self.documents):
+            if source not in documents:
+                self.remove_document(source)
+        for source, key in documents.items():
+            if self.hashes.get(source) != key:
+                self.documents[source] = index_for(key)
+                self.hashes[source] = key
+
+    def _ranked(self, query: str, top_k: Optional[int]) -> List[Tuple[str, DocumentIndex, int, float]]:
+        """(source, document, chunk id, score) of matching chunks, best first"""
+        documents = [(source, document) for source, document in self.documents.items() if len(document)]
+        chunks = sum(len(document) for _, document in documents)
+        if not chunks:
+            return []
+        avg_length = sum(document.total_length for _, document in documents) / chunks
+        idf = {}
+        for term in set(tokenize(query)):
+            df = sum(document.document_frequency(term) for _, document in documents)
+            if df:
+                idf[term] = math.log(1 + (chunks - df + 0.5) / (df + 0.5))
+        if not idf:
+            return []
+        scores = np.concatenate([document.scores(idf, avg_length) for _, document in documents])
+        offsets = np.cumsum([0] + [len(document) for _, document in documents])
+
+        candidates = np.flatnonzero(scores > 0)
+        if top_k is not None and len(candidates) > top_k:
+            candidates = candidates[np.argpartition(-scores[candidates], top_k - 1)[:top_k]]
+        ranked = candidates[np.argsort(-scores[candidates], kind="stable")]
+        owners = np.searchsorted(offsets, ranked, side="right") - 1
+        return [(documents[owner][0], documents[owner][1], int(i - offsets[owner]), float(scores[i]))
+                for owner, i in zip(owners, ranked)]
+
+    def search(self, query: str, top_k: Optional[int] = DEFAULT_TOP_K) -> List[Passage]:
+        """Return the top_k highest scoring chunks for the query, or every matching chunk without top_k"""
+        return [_passage(source, document, chunk_id, score)
+                for source, document, chunk_id, score in self._ranked(query, top_k)]
+
+    def leading_passages(self, token_budget: int) -> List[Passage]:
+        """The opening chunks of each document, sharing the budget equally; scored 0"""
+        if not self.documents:
+            return []
+        share = token_budget // len(self.documents)
+        passages = []
+        for source, document in self.documents.items():
+            used = 0
+            for chunk_id in range(len(document)):
+                tokens = document.tokens(chunk_id)
+                if used + tokens > share:
+                    break
+                passages.append(_passage(source, document, chunk_id, 0.0))
+                used += tokens
+        return [passage for passage in passages if passage.text is not None]
+
+
+def _passage(source: str, document: DocumentIndex, chunk_id: int, score: float) -> Passage:
+    return Passage(source, document.text(chunk_id), score, document.tokens(chunk_id))
+
+
+def select_passages(index: BM25Index, query: str, token_budget: int = DEFAULT_TOKEN_BUDGET,
+                    top_k: Optional[int] = None) -> List[Passage]:
+    """Best passages for the query, by score, that together fit in the token budget
+
+    Only the selected passages are read back. When no passage matches, as
+    for "summarize this", the opening of each document is used instead so
+    the files are never silently left out.
+    """
+    selected = []
+    used = 0
+    for source, document, chunk_id, score in index._ranked(query, top_k):
+        tokens = document.tokens(chunk_id)
+        if used + tokens > token_budget:
+            continue
+        passage = _passage(source, document, chunk_id, score)
+        if passage.text is None:
+            # The document's text has been pruned from the store since it was indexed
+            continue
+        selected.append(passage)
+        used += tokens
+    return selected or index.leading_passages(token_budget)
+
+
+def format_passages(passages: List[Passage]) -> Optional[str]:
+    """Render selected passages for inclusion in the prompt, labelled by file"""
+    if not passages:
+        return None
+    parts = ["Relevant passages from attached files:"]
+    for passage in passages:
+        parts.append(f"\n--- {passage.source} ---\n{passage.text}")
+    return "\n".join(parts)
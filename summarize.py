@@ -0,0 +1,297 @@
+"""Map-reduce summaries of documents too large for the context window
+
+A document is split into token-sized chunks, each chunk is summarized in
+parallel (map), and the partial summaries are merged in rounds until one
+remains (reduce). Every step is cached by a hash of its input, so asking
+about the same document again, from any session, costs no requests.
+"""
+import logging
+import math
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional
+
+from extractors import READ_CHUNK_BYTES
+from prompt_budget import TokenCounter
+from response_cache import ResponseCache
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_CHUNK_TOKENS = 20_000
+# Input tokens of partial summaries merged by one reduce request
+DEFAULT_REDUCE_TOKENS = 20_000
+DEFAULT_MAX_CONCURRENCY = 4
+# Output tokens assumed per map or reduce request when estimating cost, reasoning included
+ESTIMATED_OUTPUT_TOKENS = 4_000
+# Estimated USD above which the app asks before summarizing
+DEFAULT_CONFIRM_COST = 5.0
+DEFAULT_CACHE_PATH = "~/.cache/o3-pro/summaries.sqlite3"
+DEFAULT_CACHE_TTL = 30 * 24 * 3600
+# Part of every cache key; bump when the instructions change
+PIPELINE_VERSION = "1"
+
+MAP_INSTRUCTIONS = (
+    "You are condensing one part of a longer document so it can be read in full later. "
+    "Write dense notes that keep every fact, figure, name, date, definition and conclusion in this part, "
+    "in the order they appear. Do not add commentary or refer to 'this part'."
+)
+REDUCE_INSTRUCTIONS = (
+    "The notes below were written from consecutive parts of one document, separated by lines of dashes. "
+    "Merge them into a single set of dense notes in document order, removing repetition but keeping "
+    "every distinct fact, figure, name, date, definition and conclusion."
+)
+PART_SEPARATOR = "\n\n-----\n\n"
+
+
+def _lines(pieces: Iterable[str]) -> Iterator[str]:
+    """Lines of streamed text, keeping their line breaks; very long lines are cut at READ_CHUNK_BYTES"""
+    pending = ""
+    for piece in pieces:
+        pending += piece
+        lines = pending.split("\n")
+        pending = lines.pop()
+        for line in lines:
+            yield line + "\n"
+        while len(pending) > READ_CHUNK_BYTES:
+            yield pending[:READ_CHUNK_BYTES]
+            pending = pending[READ_CHUNK_BYTES:]
+    if pending:
+        yield pending
+
+
+def chunk_by_tokens(pieces: Iterable[str], chunk_tokens: int, counter: TokenCounter) -> Iterator[str]:
+    """Split streamed text into chunks of at most about `chunk_tokens`, at line breaks where possible"""
+    chunk: List[str] = []
+    used = 0
+    for line in _lines(pieces):
+        tokens = counter.count(line)
+        # A line longer than a whole chunk is cut into proportional slices
+        step = len(line) if tokens <= chunk_tokens else max(1, len(line) * chunk_tokens // tokens)
+        for start in range(0, len(line), step):
+            part = line[start:start + step]
+            part_tokens = tokens if step == len(line) else counter.count(part)
+            if chunk and used + part_tokens > chunk_tokens:
+                yield "".join(chunk)
+                chunk, used = [], 0
+            chunk.append(part)
+            used += part_tokens
+    if chunk:
+        yield "".join(chunk)
+
+
+class SummaryEstimate(NamedTuple):
+    """Upper-bound request and token counts for summarizing documents, ignoring cached steps"""
+    chunks: int = 0
+    requests: int = 0
+    input_tokens: int = 0
+    output_tokens: int = 0
+
+    def __add__(self, other: "SummaryEstimate") -> "SummaryEstimate":
+        return SummaryEstimate(*(mine + theirs for mine, theirs in zip(self, other)))
+
+    def cost(self, pricing) -> float:
+        """Estimated USD cost at the given Pricing"""
+        return pricing.cost({"input_tokens": self.input_tokens, "output_tokens": self.output_tokens})
+
+
+class SummaryJob:
+    """Progress and result of one document's map-reduce, updated by worker threads"""
+
+    def __init__(self, name: str, key: Optional[str] = None):
+        self.name = name
+        self.key = key
+        self.status = "mapping"
+        self.chunks = 0
+        self.mapped = 0
+        self.reduce_round = 0
+        self.requests = 0
+        self.cached = 0
+        self.summary: Optional[str] = None
+        self.error: Optional[str] = None
+        self.started = time.time()
+        self.done = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self) -> float:
+        return time.time() - self.started
+
+    def wait(self, timeout: Optional[float] = None) -> bool:
+        """Block until the job finishes or the timeout expires; returns True when finished"""
+        return self.done.wait(timeout)
+
+    def _count(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+
+class Summarizer:
+    """Runs map-reduce jobs on a pool that caps concurrent requests across all jobs"""
+
+    def __init__(self, client, cache: Optional[ResponseCache] = None, counter: Optional[TokenCounter] = None,
+                 chunk_tokens: int = DEFAULT_CHUNK_TOKENS, reduce_tokens: int = DEFAULT_REDUCE_TOKENS,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY, confirm_cost: float = DEFAULT_CONFIRM_COST):
+        self.client = client
+        self.cache = cache
+        self.counter = counter or TokenCounter()
+        self.chunk_tokens = chunk_tokens
+        self.reduce_tokens = reduce_tokens
+        self.max_concurrency = max(1, max_concurrency)
+        self.confirm_cost = confirm_cost
+        self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="o3pro-summarize")
+        # Jobs still running, by document key
+        self._running: Dict[str, SummaryJob] = {}
+        self._lock = threading.Lock()
+
+    def estimate(self, tokens: int) -> SummaryEstimate:
+        """Requests and tokens a document of about `tokens` tokens would take, before any cache hits"""
+        chunks = max(1, math.ceil(tokens / self.chunk_tokens))
+        requests, input_tokens = chunks, tokens
+        parts = chunks
+        # Reduce rounds merge groups of at least two parts until one remains
+        while parts > 1:
+            groups = max(1, min(parts // 2, math.ceil(parts * ESTIMATED_OUTPUT_TOKENS / self.reduce_tokens)))
+            requests += groups
+            input_tokens += parts * ESTIMATED_OUTPUT_TOKENS
+            parts = groups
+        return SummaryEstimate(chunks, requests, input_tokens, requests * ESTIMATED_OUTPUT_TOKENS)
+
+    def start(self, name: str, load: Callable[[], Iterable[str]], pool=None,
+              key: Optional[str] = None) -> SummaryJob:
+        """Summarize the text `load` streams on a background thread; returns at once
+
+        Requests go to `pool` when given, e.g. a shared RequestExecutor queue,
+        instead of the summarizer's own pool. With a key, a job for the same
+        document that is still running, e.g. one started before a page
+        rerun, is returned instead of starting another.
+        """
+        with self._lock:
+            job = self._running.get(key) if key is not None else None
+            if job is not None:
+                return job
+            job = SummaryJob(name, key)
+            if key is not None:
+                self._running[key] = job
+        threading.Thread(target=self._run, args=(job, load, pool or self._executor),
+                         name=f"o3pro-summary-{name}", daemon=True).start()
+        return job
+
+    def summarize(self, name: str, load: Callable[[], Iterable[str]], pool=None) -> SummaryJob:
+        """Summarize and wait for the result"""
+        job = self.start(name, load, pool)
+        job.wait()
+        return job
+
+    def _run(self, job: SummaryJob, load: Callable[[], Iterable[str]], pool):
+        futures = []
+        try:
+            # Chunks are handed to the pool as they are read, so the document is never held whole;
+            # at most max_concurrency steps of a job are queued on a shared pool
+            read_ahead = self.max_concurrency * 2 if pool is self._executor else self.max_concurrency
+            slots = threading.BoundedSemaphore(read_ahead)
+
+            failed = threading.Event()
+
+            def mapped(future):
+                slots.release()
+                if future.cancelled() or future.exception():
+                    failed.set()
+                else:
+                    job._count("mapped")
+
+            for chunk in chunk_by_tokens(load(), self.chunk_tokens, self.counter):
+                slots.acquire()
+                if failed.is_set():
+                    # Stop reading; the failure is raised below
+                    break
+                future = pool.submit(self._complete, job, MAP_INSTRUCTIONS, chunk)
+                future.add_done_callback(mapped)
+                futures.append(future)
+                job.chunks += 1
+            parts = [future.result() for future in futures]
+            if not parts:
+                raise ValueError("Document has no text")
+
+            job.status = "reducing"
+            while len(parts) > 1:
+                job.reduce_round += 1
+                futures = [pool.submit(self._complete, job, REDUCE_INSTRUCTIONS, PART_SEPARATOR.join(group))
+                           for group in self._groups(parts)]
+                parts = [future.result() for future in futures]
+            job.summary = parts[0]
+            job.status = "completed"
+        except Exception as e:
+            logger.exception("Summarizing %s failed", job.name)
+            # Queued steps of a failed job would only spend requests
+            for future in futures:
+                future.cancel()
+            job.error = str(e)
+            job.status = "failed"
+        finally:
+            if job.key is not None:
+                with self._lock:
+                    self._running.pop(job.key, None)
+            job.done.set()
+
+    def _groups(self, parts: List[str]) -> List[List[str]]:
+        """Consecutive parts grouped to fit one reduce request; groups of two or more so each round shrinks"""
+        groups: List[List[str]] = []
+        used = 0
+        for part in parts:
+            tokens = self.counter.count(part)
+            if groups and (len(groups[-1]) < 2 or used + tokens <= self.reduce_tokens):
+                groups[-1].append(part)
+                used += tokens
+            else:
+                groups.append([part])
+                used = tokens
+        if len(groups) > 1 and len(groups[-1]) == 1:
+            # A leftover part joins the previous group rather than waiting a round
+            groups[-2].extend(groups.pop())
+        return groups
+
+    def _complete(self, job: SummaryJob, instructions: str, text: str) -> str:
+        """One map or reduce request, answered from the cache when the same input was seen before"""
+        key = None
+        if self.cache:
+            key = ResponseCache.key(self.client.model, self.client.api_version, text,
+                                    instructions=instructions, pipeline=PIPELINE_VERSION)
+            cached = self.cache.get(key)
+            if cached is not None:
+                job._count("cached")
+                return cached["text"]
+        messages = [{"role": "system", "content": instructions}, {"role": "user", "content": text}]
+        job._count("requests")
+        response = self.client.create_chat_completion(messages, stream=False, use_cache=False, raise_errors=True)
+        summary = self.client.extract_text(response) if response else None
+        if not summary:
+            raise RuntimeError("No response from O3-Pro model")
+        if self.cache:
+            self.cache.put(key, {"text": summary})
+        return summary
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+
+def summary_cache_from_env() -> ResponseCache:
+    """Cache of intermediate summaries at O3PRO_SUMMARY_CACHE_PATH"""
+    return ResponseCache(
+        os.getenv("O3PRO_SUMMARY_CACHE_PATH", DEFAULT_CACHE_PATH),
+        ttl=float(os.getenv("O3PRO_SUMMARY_CACHE_TTL", DEFAULT_CACHE_TTL)),
+    )
+
+
+def summarizer_from_env(client, counter: Optional[TokenCounter] = None) -> Summarizer:
+    """A summarizer configured by O3PRO_SUMMARY_* variables"""
+    return Summarizer(
+        client,
+        summary_cache_from_env(),
+        counter,
+        chunk_tokens=int(os.getenv("O3PRO_SUMMARY_CHUNK_TOKENS", DEFAULT_CHUNK_TOKENS)),
+        reduce_tokens=int(os.getenv("O3PRO_SUMMARY_REDUCE_TOKENS", DEFAULT_REDUCE_TOKENS)),
+        max_concurrency=int(os.getenv("O3PRO_SUMMARY_CONCURRENCY", DEFAULT_MAX_CONCURRENCY)),
+        confirm_cost=float(os.getenv("O3PRO_SUMMARY_CONFIRM_USD", DEFAULT_CONFIRM_COST)),
+    )
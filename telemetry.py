@@ -0,0 +1,288 @@
+"""Latency and token telemetry: histograms, Prometheus export and optional OpenTelemetry spans"""
+import bisect
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+TOKEN_BUCKETS = (100, 1_000, 5_000, 10_000, 25_000, 50_000, 100_000, 200_000, 500_000)
+# Recent samples kept per series for exact percentiles in the diagnostics panel
+RESERVOIR_SIZE = 2048
+# Metrics are only reachable from this machine unless O3PRO_METRICS_HOST says otherwise
+DEFAULT_METRICS_HOST = "127.0.0.1"
+
+_HELP = {
+    "o3pro_request_duration_seconds": ("Time from sending a request to its last byte", LATENCY_BUCKETS),
+    "o3pro_request_ttfb_seconds": ("Time from sending a request to its response headers", LATENCY_BUCKETS),
+    "o3pro_request_ttft_seconds": ("Time from sending a streamed request to its first output text", LATENCY_BUCKETS),
+    "o3pro_connect_seconds": ("DNS resolution and TCP connect time of new connections", LATENCY_BUCKETS),
+    "o3pro_tls_seconds": ("TLS handshake time of new connections", LATENCY_BUCKETS),
+    "o3pro_request_tokens": ("Tokens per completed request", TOKEN_BUCKETS),
+    "o3pro_extraction_seconds": ("Text extraction time per file", LATENCY_BUCKETS),
+    "o3pro_request_attempts_total": ("HTTP attempts by endpoint and status", None),
+    "o3pro_tokens_total": ("Tokens used across all requests", None),
+    "o3pro_extraction_bytes_total": ("Bytes of files passed to text extraction", None),
+}
+
+_local = threading.local()
+_telemetry: Optional["Telemetry"] = None
+_telemetry_lock = threading.Lock()
+
+
+class Histogram:
+    """Cumulative bucket counts for export plus a bounded reservoir for percentiles"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.recent = deque(maxlen=RESERVOIR_SIZE)
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+        self.recent.append(value)
+
+    def quantile(self, q: float) -> Optional[float]:
+        if not self.recent:
+            return None
+        ordered = sorted(self.recent)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+def _label_text(labels: Tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{str(value)}"' for name, value in labels) + "}"
+
+
+def _load_tracer():
+    """An OpenTelemetry tracer when the SDK is installed and an OTLP endpoint is configured"""
+    if not os.getenv("OTEL_EXPORTER_OTLP_ENDPOINT"):
+        return None
+    try:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import OTLPSpanExporter
+        from opentelemetry.sdk.resources import Resource
+        from opentelemetry.sdk.trace import TracerProvider
+        from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    except ImportError:
+        return None
+    provider = TracerProvider(resource=Resource.create({"service.name": os.getenv("OTEL_SERVICE_NAME", "o3-pro")}))
+    provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter()))
+    return provider.get_tracer("o3pro")
+
+
+class RequestTrace:
+    """Timings and token counts of one logical request, across retries"""
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.start = time.perf_counter()
+        self.wall_start = time.time_ns()
+        self.endpoint: Optional[str] = None
+        self.attempts = 0
+        self.status: Optional[int] = None
+        self.ttfb: Optional[float] = None
+        self.ttft: Optional[float] = None
+        self.phases: Dict[str, float] = {}
+        self.finished = False
+
+    def add_phase(self, name: str, seconds: float):
+        self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def first_token(self):
+        if self.ttft is None:
+            self.ttft = time.perf_counter() - self.start
+
+
+class Telemetry:
+    """Process-wide metrics registry"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.histograms: Dict[Tuple[str, Tuple], Histogram] = {}
+        self.counters: Dict[Tuple[str, Tuple], float] = {}
+        self.tracer = _load_tracer()
+
+    def observe(self, name: str, value: float, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(_HELP[name][1])
+            histogram.observe(value)
+
+    def increment(self, name: str, amount: float = 1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self.counters[key] = self.counters.get(key, 0) + amount
+
+    def record_attempt(self, trace: RequestTrace, endpoint: str, status, ttfb: Optional[float]):
+        """One HTTP attempt of a request; status is None for a connection failure"""
+        trace.attempts += 1
+        trace.endpoint = endpoint
+        trace.status = status
+        if ttfb is not None:
+            trace.ttfb = ttfb
+            self.observe("o3pro_request_ttfb_seconds", ttfb, operation=trace.operation)
+        self.increment("o3pro_request_attempts_total", endpoint=endpoint,
+                       status=str(status) if status else "connection_error")
+
+    def finish(self, trace: RequestTrace, outcome: str, usage: Optional[Dict] = None):
+        """Record a finished request once, with the usage block of its response"""
+        if trace.finished:
+            return
+        trace.finished = True
+        duration = time.perf_counter() - trace.start
+        self.observe("o3pro_request_duration_seconds", duration, operation=trace.operation, outcome=outcome)
+        if trace.ttft is not None:
+            self.observe("o3pro_request_ttft_seconds", trace.ttft, operation=trace.operation)
+        tokens = usage_tokens(usage)
+        for kind, count in tokens.items():
+            if count:
+                self.observe("o3pro_request_tokens", count, kind=kind)
+                self.increment("o3pro_tokens_total", count, kind=kind)
+        if self.tracer is not None:
+            self._export_span(trace, outcome, duration, tokens)
+
+    def _export_span(self, trace: RequestTrace, outcome: str, duration: float, tokens: Dict[str, int]):
+        span = self.tracer.start_span(f"o3pro.{trace.operation}", start_time=trace.wall_start)
+        span.set_attribute("o3pro.outcome", outcome)
+        span.set_attribute("o3pro.attempts", trace.attempts)
+        if trace.endpoint:
+            span.set_attribute("server.address", trace.endpoint)
+        if trace.status:
+            span.set_attribute("http.response.status_code", trace.status)
+        for name, value in (("ttfb", trace.ttfb), ("ttft", trace.ttft), *trace.phases.items()):
+            if value is not None:
+                span.set_attribute(f"o3pro.{name}_seconds", value)
+        for kind, count in tokens.items():
+            span.set_attribute(f"gen_ai.usage.{kind}_tokens", count)
+        span.end(end_time=trace.wall_start + int(duration * 1e9))
+
+    def record_phase(self, name: str, seconds: float):
+        """Connection setup time, attributed to the request active on this thread"""
+        self.observe(f"o3pro_{name}_seconds", seconds)
+        trace = getattr(_local, "trace", None)
+        if trace is not None:
+            trace.add_phase(name, seconds)
+
+    def record_extraction(self, kind: str, num_bytes: int, seconds: float):
+        self.observe("o3pro_extraction_seconds", seconds, kind=kind)
+        self.increment("o3pro_extraction_bytes_total", num_bytes, kind=kind)
+
+    def summary(self) -> List[Dict]:
+        """p50/p95/p99 per histogram series, for the diagnostics panel"""
+        with self._lock:
+            rows = []
+            for (name, labels), histogram in sorted(self.histograms.items()):
+                rows.append({
+                    "metric": name.replace("o3pro_", "") + _label_text(labels),
+                    "count": histogram.count,
+                    "p50": histogram.quantile(0.5),
+                    "p95": histogram.quantile(0.95),
+                    "p99": histogram.quantile(0.99),
+                })
+            return rows
+
+    def totals(self, name: str) -> Dict[str, float]:
+        """Counter values of one metric keyed by their label values"""
+        with self._lock:
+            return {",".join(str(v) for _, v in labels): value
+                    for (metric, labels), value in self.counters.items() if metric == name}
+
+    def prometheus_text(self) -> str:
+        """All metrics in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            series = {}
+            for (name, labels), histogram in self.histograms.items():
+                series.setdefault(name, []).append((labels, histogram))
+            for (name, labels), value in self.counters.items():
+                series.setdefault(name, []).append((labels, value))
+            for name in sorted(series):
+                help_text, buckets = _HELP[name]
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} {'histogram' if buckets else 'counter'}")
+                for labels, value in sorted(series[name], key=lambda item: item[0]):
+                    if not buckets:
+                        lines.append(f"{name}{_label_text(labels)} {value}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else repr(bound)
+                        lines.append(f"{name}_bucket{_label_text(labels + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_label_text(labels)} {value.sum}")
+                    lines.append(f"{name}_count{_label_text(labels)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def usage_tokens(usage: Optional[Dict]) -> Dict[str, int]:
+    """Input, output, reasoning and cached token counts from a Responses API usage block"""
+    usage = usage or {}
+    return {
+        "input": usage.get("input_tokens", 0),
+        "output": usage.get("output_tokens", 0),
+        "reasoning": (usage.get("output_tokens_details") or {}).get("reasoning_tokens", 0),
+        "cached": (usage.get("input_tokens_details") or {}).get("cached_tokens", 0),
+    }
+
+
+@contextmanager
+def active(trace: RequestTrace):
+    """Attribute connection setup on this thread to `trace` while the block runs"""
+    previous = getattr(_local, "trace", None)
+    _local.trace = trace
+    try:
+        yield trace
+    finally:
+        _local.trace = previous
+
+
+def get_telemetry() -> Telemetry:
+    """Return the process-wide registry, creating it on first use"""
+    global _telemetry
+    if _telemetry is None:
+        with _telemetry_lock:
+            if _telemetry is None:
+                _telemetry = Telemetry()
+    return _telemetry
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split("?")[0] != "/metrics":
+            self.send_error(404)
+            return
+        data = get_telemetry().prometheus_text().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_metrics_server(port: int, host: str = DEFAULT_METRICS_HOST) -> ThreadingHTTPServer:
+    """Serve /metrics for Prometheus on a daemon thread"""
+    server = ThreadingHTTPServer((host, port), _MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="o3pro-metrics", daemon=True).start()
+    return server
+
+
+def metrics_server_from_env() -> Optional[ThreadingHTTPServer]:
+    """The /metrics server on O3PRO_METRICS_HOST:O3PRO_METRICS_PORT, or None when no port is set"""
+    port = os.getenv("O3PRO_METRICS_PORT")
+    if not port:
+        return None
+    return start_metrics_server(int(port), os.getenv("O3PRO_METRICS_HOST", DEFAULT_METRICS_HOST))
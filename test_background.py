@@ -0,0 +1,87 @@
+import pytest
+
+from client import AzureO3ProClient, ResponseError
+from background import BackgroundJobs
+from executor import RequestExecutor
+
+MESSAGES = [{"role": "user", "content": "Prove the Riemann hypothesis"}]
+
+
+@pytest.fixture
+def slow_server(mock_server):
+    # The read timeout is shorter than the simulated completion, so a blocking request would time out
+    return mock_server(env={"AZURE_OPENAI_READ_TIMEOUT": "0.2"}, latency=0.5, reply_text="Background answer")
+
+
+def test_background_job_outlives_read_timeout(slow_server):
+    client = AzureO3ProClient()
+    job = BackgroundJobs().submit(client, MESSAGES, poll_interval=0.05)
+
+    assert job is not None
+    assert job.wait(5)
+    assert job.status == "completed"
+    assert job.polls >= 2
+    assert client.extract_text(job.result) == "Background answer"
+
+
+def test_cancel_stops_running_job(slow_server):
+    slow_server.httpd.latency = 30
+    client = AzureO3ProClient()
+    job = BackgroundJobs().submit(client, MESSAGES, poll_interval=0.05)
+
+    job.cancel()
+
+    assert job.wait(1)
+    assert job.status == "cancelled"
+    assert job.result is not None
+
+
+def test_attach_resumes_job_from_another_registry(slow_server):
+    client = AzureO3ProClient()
+    submitted = BackgroundJobs().submit(client, MESSAGES, poll_interval=0.05)
+
+    # A fresh registry stands in for a refreshed browser session or restarted worker
+    jobs = BackgroundJobs()
+    resumed = jobs.attach(client, submitted.response_id, poll_interval=0.05)
+
+    assert resumed is not submitted
+    assert resumed.wait(5)
+    assert resumed.status == "completed"
+    assert jobs.attach(client, submitted.response_id) is resumed
+
+
+def test_failed_polls_back_off(slow_server):
+    slow_server.httpd.latency = 0
+    slow_server.script(503, times=3, retrieve=True)
+    client = AzureO3ProClient()
+    job = BackgroundJobs().submit(client, MESSAGES, poll_interval=0.05)
+
+    assert job.wait(5)
+
+    assert job.status == "completed"
+    assert job.polls == 4
+    assert slow_server.stats["status_503"] == 3
+    # Waits of 0.05, 0.1, 0.2 and 0.4 s rather than 0.05 s after every failure
+    assert job.elapsed >= 0.7
+
+
+def test_submission_goes_through_a_shared_executor(slow_server):
+    executor = RequestExecutor(max_concurrency=1)
+    client = AzureO3ProClient()
+
+    job = BackgroundJobs().submit(client, MESSAGES, poll_interval=0.05, pool=executor.queue("alice"))
+
+    assert job.wait(5)
+    assert job.status == "completed"
+    # Only the create takes a slot; polls do not
+    assert executor.snapshot()["completed"] == 1
+    executor.shutdown()
+
+
+def test_refused_submission_raises_the_service_error(slow_server):
+    slow_server.script(400)
+    executor = RequestExecutor(max_concurrency=1)
+
+    with pytest.raises(ResponseError, match="API Error 400"):
+        BackgroundJobs().submit(AzureO3ProClient(), MESSAGES, pool=executor.queue("alice"), raise_errors=True)
+    executor.shutdown()
@@ -0,0 +1,115 @@
+import json
+import time
+
+import pytest
+
+import batch
+
+
+@pytest.fixture
+def server(mock_server, monkeypatch):
+    monkeypatch.delenv("O3PRO_RESPONSE_CACHE_PATH", raising=False)
+    return mock_server(latency=0.05, reply_text="Batch answer")
+
+
+def write_prompts(path, count):
+    with open(path, "w") as prompts:
+        for number in range(count):
+            prompts.write(json.dumps({"id": f"q{number}", "prompt": f"Question {number}"}) + "\n")
+
+
+def read_results(path):
+    with open(path) as results:
+        return [json.loads(line) for line in results]
+
+
+def test_run_writes_every_result(server, tmp_path):
+    prompts, output = tmp_path / "prompts.jsonl", tmp_path / "results.jsonl"
+    write_prompts(prompts, 12)
+
+    assert batch.main(["run", str(prompts), "--output", str(output), "--workers", "4"]) == 0
+
+    results = read_results(output)
+    assert sorted(r["id"] for r in results) == sorted(f"q{n}" for n in range(12))
+    assert all(r["status"] == "completed" and r["output_text"] == "Batch answer" for r in results)
+
+
+def test_run_resumes_after_interruption(server, tmp_path):
+    prompts, output = tmp_path / "prompts.jsonl", tmp_path / "results.jsonl"
+    write_prompts(prompts, 6)
+    # An earlier run finished two prompts and was killed while writing a third
+    with open(output, "w") as partial:
+        partial.write(json.dumps({"id": "q0", "status": "completed", "output_text": "old"}) + "\n")
+        partial.write(json.dumps({"id": "q1", "status": "completed", "output_text": "old"}) + "\n")
+        partial.write('{"id": "q2", "sta')
+
+    batch.main(["run", str(prompts), "--output", str(output)])
+
+    assert batch.load_completed_ids(str(output)) == {f"q{n}" for n in range(6)}
+    assert server.stats["requests"] == 4
+
+
+def test_attached_files_are_extracted_once_into_the_text_store(server, tmp_path, monkeypatch):
+    monkeypatch.setenv("O3PRO_TEXT_STORE_DIR", str(tmp_path / "texts"))
+    spec = tmp_path / "spec.txt"
+    spec.write_text("The widget weighs 3 kg.", encoding="utf-8")
+    prompts, output = tmp_path / "prompts.jsonl", tmp_path / "results.jsonl"
+    with open(prompts, "w") as lines:
+        for number in range(3):
+            lines.write(json.dumps({"id": f"q{number}", "prompt": "Weight?", "files": [str(spec)]}) + "\n")
+        lines.write(json.dumps({"id": "missing", "prompt": "Weight?", "files": [str(tmp_path / "nope.txt")]}) + "\n")
+
+    # A missing file fails only its own prompt
+    assert batch.main(["run", str(prompts), "--output", str(output), "--workers", "2"]) == 1
+
+    results = {r["id"]: r for r in read_results(output)}
+    assert all(results[f"q{n}"]["status"] == "completed" for n in range(3))
+    assert results["missing"]["status"] == "failed"
+    assert len(list((tmp_path / "texts").glob("*.txt"))) == 1
+
+
+def test_export_and_import_batch_files(server, tmp_path):
+    prompts, batch_file = tmp_path / "prompts.jsonl", tmp_path / "batch_input.jsonl"
+    write_prompts(prompts, 2)
+
+    batch.main(["export", str(prompts), str(batch_file)])
+    requests_ = read_results(batch_file)
+    assert [r["custom_id"] for r in requests_] == ["q0", "q1"]
+    assert requests_[0]["body"]["model"] == "o3-pro"
+    assert requests_[0]["body"]["instructions"] == batch.DEFAULT_SYSTEM_PROMPT
+    assert requests_[0]["body"]["input"][-1]["content"][0]["text"] == "Question 0"
+
+    batch_output, output = tmp_path / "batch_output.jsonl", tmp_path / "results.jsonl"
+    with open(batch_output, "w") as out:
+        out.write(json.dumps({"custom_id": "q0", "response": {"status_code": 200, "body": {
+            "id": "resp_1", "output": [{"type": "message", "content": [{"type": "output_text", "text": "Done"}]}]}}}) + "\n")
+        out.write(json.dumps({"custom_id": "q1", "response": {"status_code": 429, "body": {}},
+                              "error": {"code": "rate_limited"}}) + "\n")
+    batch.main(["import-results", str(batch_output), str(output)])
+
+    completed, failed = read_results(output)
+    assert completed["status"] == "completed" and completed["output_text"] == "Done"
+    assert failed["status"] == "failed"
+
+
+def test_interrupt_writes_requests_in_flight_and_drops_queued_ones(server, tmp_path, monkeypatch):
+    server.httpd.latency = 0.3
+    output = tmp_path / "results.jsonl"
+    items = batch.iter_prompts
+
+    def interrupted(path):
+        yield from (item for _, item in zip(range(4), items(path)))
+        while not server.stats["in_flight"]:
+            time.sleep(0.01)
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr(batch, "iter_prompts", interrupted)
+    prompts = tmp_path / "prompts.jsonl"
+    write_prompts(prompts, 10)
+
+    assert batch.main(["run", str(prompts), "--output", str(output), "--workers", "1"]) == 130
+
+    results = read_results(output)
+    # Everything sent was written before the file closed; queued items were not sent or marked failed
+    assert len(results) == server.stats["requests"] < 4
+    assert all(r["status"] == "completed" for r in results)
@@ -0,0 +1,115 @@
+import pytest
+import requests
+
+from client import AzureO3ProClient
+from conversation import ConversationChain
+from executor import RequestExecutor, stream_completion
+
+# Large enough (over 1024 tokens) for the service to cache it
+SYSTEM = {"role": "system", "content": "You are a meticulous reviewer. " * 200}
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(reply_text="Noted")
+
+
+class ChunkedBody:
+    """A response body arriving in the given network chunks"""
+
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def stream(self, chunk_size, decode_content=True):
+        yield from self.chunks
+
+    def close(self):
+        pass
+
+
+def parse_stream(*chunks):
+    response = requests.Response()
+    response.status_code = 200
+    response.raw = ChunkedBody(chunks)
+    return list(AzureO3ProClient()._handle_streaming_response(response))
+
+
+def test_messages_become_instructions_and_typed_items(server):
+    client = AzureO3ProClient()
+
+    request_input = client._build_input([
+        SYSTEM,
+        {"role": "user", "content": "Review this"},
+        {"role": "assistant", "content": "Looks fine"},
+        {"role": "system", "content": "[Earlier conversation: ...]"},
+    ])
+
+    assert request_input["instructions"] is SYSTEM["content"]
+    assert request_input["input"] == [
+        {"type": "message", "role": "user", "content": [{"type": "input_text", "text": "Review this"}]},
+        {"type": "message", "role": "assistant", "content": [{"type": "output_text", "text": "Looks fine"}]},
+        {"type": "message", "role": "system", "content": [{"type": "input_text", "text": "[Earlier conversation: ...]"}]},
+    ]
+
+
+def test_stable_prefix_reports_cached_tokens_across_chained_turns(server):
+    client = AzureO3ProClient()
+    chain = ConversationChain()
+    history = [SYSTEM, {"role": "user", "content": "First question"}]
+
+    first = client.create_chat_completion(history)
+    assert client.usage_summary(first)["cached_tokens"] == 0
+    history.append({"role": "assistant", "content": "Noted"})
+    chain.record(first["id"], history)
+
+    history.append({"role": "user", "content": "Second question"})
+    to_send, previous_id = chain.prepare(history)
+    second = client.create_chat_completion(to_send, previous_response_id=previous_id)
+
+    usage = client.usage_summary(second)
+    assert usage["cached_tokens"] >= 1024
+    assert usage["cached_tokens"] <= usage["input_tokens"]
+
+
+def test_sse_data_lines_are_joined_and_the_event_line_names_the_type(server):
+    events = parse_stream(b'event: response.output_text.delta\ndata: {"delta":\ndata:  "Hi"}\n\n')
+
+    assert events == [{"type": "response.output_text.delta", "delta": "Hi"}]
+
+
+def test_sse_comments_keep_alives_and_done_are_skipped(server):
+    events = parse_stream(
+        b": keep-alive\n\n",
+        b"\n\n",
+        b'data: {"type": "response.output_text.delta", "delta": "a"}\n\n',
+        b"data: [DONE]\n\n",
+    )
+
+    assert [event["delta"] for event in events] == ["a"]
+
+
+def test_sse_events_split_across_chunks_are_reassembled(server):
+    events = parse_stream(
+        b'data: {"type": "response.output_te',
+        b'xt.delta", "delta": "a"}\n',
+        b'\ndata: {"type": "response.output_text.delta", "delta": "b"}\n\ndata: {"type": "response.comp',
+        b'leted", "response": {"id": "resp_1"}}',
+    )
+
+    assert [event["type"] for event in events] == ["response.output_text.delta"] * 2 + ["response.completed"]
+    assert events[-1]["response"] == {"id": "resp_1"}
+
+
+def test_failed_stream_keeps_its_partial_text_and_fails_the_job(mock_server):
+    server = mock_server(reply_text="one two three four", stream_failure_rate=1)
+    executor = RequestExecutor(max_concurrency=1)
+
+    job = executor.submit("alice", stream_completion, AzureO3ProClient(), [{"role": "user", "content": "Hi"}],
+                          use_cache=False)
+
+    assert job.wait(5)
+    assert job.status == "failed"
+    assert "Injected stream failure" in job.error
+    assert job.text == "one two"
+    assert server.stats["stream_failures"] == 1
+    executor.shutdown()
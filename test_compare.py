@@ -0,0 +1,69 @@
+import pytest
+
+from client import AzureO3ProClient
+from compare import CompareRunner, Variant, VariantRun
+from mock_server import REASONING_TOKENS
+from pricing import Pricing
+
+LATENCY = 0.3
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Why is the sky blue?"}]
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(latency=LATENCY, reply_text="Rayleigh scattering")
+
+
+def effort_runs():
+    return [VariantRun(Variant(effort, "Be brief.", effort), MESSAGES) for effort in ("low", "medium", "high")]
+
+
+@pytest.mark.parametrize("stream", [True, False])
+def test_variants_run_concurrently(server, stream):
+    runner = CompareRunner(max_concurrency=3)
+    comparison = runner.start(AzureO3ProClient(), effort_runs(), stream=stream)
+
+    assert comparison.wait(5)
+    assert [run.status for run in comparison.runs] == ["completed"] * 3
+    assert all(run.text == "Rayleigh scattering" for run in comparison.runs)
+    assert all(run.latency >= LATENCY for run in comparison.runs)
+    # Wall time tracks the slowest variant, not the sum
+    assert comparison.wall_time < 2 * LATENCY
+    assert comparison.sequential_time >= 3 * LATENCY
+    runner.shutdown()
+
+
+def test_concurrency_cap_queues_extra_variants(server):
+    runner = CompareRunner(max_concurrency=1)
+    comparison = runner.start(AzureO3ProClient(), effort_runs())
+
+    assert comparison.wait(5)
+    assert comparison.wall_time >= 3 * LATENCY
+    assert comparison.runs[-1].queued_for >= 2 * LATENCY
+    runner.shutdown()
+
+
+def test_metrics_report_reasoning_tokens_and_cost(server):
+    runner = CompareRunner()
+    comparison = runner.start(AzureO3ProClient(), effort_runs())
+    assert comparison.wait(5)
+
+    pricing = Pricing(input=10.0, cached_input=1.0, output=100.0)
+    rows = [run.metrics(pricing) for run in comparison.runs]
+    assert [row["reasoning_tokens"] for row in rows] == [REASONING_TOKENS[e] for e in ("low", "medium", "high")]
+    assert rows[0]["cost_usd"] < rows[1]["cost_usd"] < rows[2]["cost_usd"]
+    expected = (rows[2]["input_tokens"] * 10.0 + rows[2]["output_tokens"] * 100.0) / 1_000_000
+    assert rows[2]["cost_usd"] == pytest.approx(expected)
+    runner.shutdown()
+
+
+def test_failed_variant_does_not_stop_the_others(server, monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_MAX_RETRIES", "0")
+    server.script(400, times=1)
+    runner = CompareRunner(max_concurrency=1)
+    comparison = runner.start(AzureO3ProClient(), effort_runs(), stream=False)
+
+    assert comparison.wait(5)
+    assert [run.status for run in comparison.runs] == ["failed", "completed", "completed"]
+    assert comparison.runs[0].error
+    runner.shutdown()
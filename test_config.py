@@ -1,7 +1,7 @@
 import os
-import requests
 import json
 from dotenv import load_dotenv
+from transport import get_session, get_timeouts
 
 # Load environment variables
 load_dotenv()
@@ -44,7 +44,7 @@ def test_azure_openai_config():
         }
         
         print("Testing connection to Azure OpenAI O3-Pro...")
-        response = requests.post(api_url, headers=headers, json=payload, timeout=30)
+        response = get_session().post(api_url, headers=headers, json=payload, timeout=get_timeouts())
         
         print(f"Status Code: {response.status_code}")
         
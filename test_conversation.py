@@ -0,0 +1,33 @@
+from conversation import ConversationChain
+
+SYSTEM = {"role": "system", "content": "You are helpful."}
+
+
+def test_chain_sends_only_new_messages():
+    chain = ConversationChain()
+    history = [SYSTEM, {"role": "user", "content": "Hi"}]
+
+    to_send, previous = chain.prepare(history)
+    assert to_send == history and previous is None
+
+    history += [{"role": "assistant", "content": "Hello"}]
+    chain.record("resp_1", history)
+    history += [{"role": "user", "content": "And now?"}]
+
+    to_send, previous = chain.prepare(history)
+    assert to_send == [SYSTEM, {"role": "user", "content": "And now?"}]
+    assert previous == "resp_1"
+
+
+def test_edited_system_prompt_or_cleared_chat_resends_everything():
+    chain = ConversationChain()
+    chain.record("resp_1", [SYSTEM, {"role": "user", "content": "Hi"}, {"role": "assistant", "content": "Hello"}])
+
+    edited = [{"role": "system", "content": "You are terse."}, {"role": "user", "content": "Hi"},
+              {"role": "assistant", "content": "Hello"}, {"role": "user", "content": "More"}]
+    assert chain.prepare(edited) == (edited, None)
+    assert chain.response_id is None
+
+    chain.record("resp_2", edited)
+    cleared = [edited[0], {"role": "user", "content": "Fresh start"}]
+    assert chain.prepare(cleared) == (cleared, None)
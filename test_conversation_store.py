@@ -0,0 +1,81 @@
+
+from conversation_store import TOKEN_PATTERN, ConversationStore, new_token
+
+OWNER = new_token()
+
+
+def make_store(tmp_path):
+    return ConversationStore(str(tmp_path / "conversations.sqlite3"))
+
+
+def test_messages_are_paged_in_order_and_first_question_names_the_chat(tmp_path):
+    store = make_store(tmp_path)
+    conversation = store.create_conversation(OWNER)
+    for number in range(50):
+        store.append_message(conversation, "user" if number % 2 == 0 else "assistant", f"message {number}")
+
+    assert store.message_count(conversation) == 50
+    assert store.conversation(conversation, OWNER)["title"] == "message 0"
+    page = store.messages(conversation, offset=40, limit=5)
+    assert [m["content"] for m in page] == [f"message {n}" for n in range(40, 45)]
+    assert store.messages(conversation, offset=48) == [
+        {"role": "user", "content": "message 48"}, {"role": "assistant", "content": "message 49"}]
+
+
+def test_recent_messages_stop_at_the_byte_budget(tmp_path):
+    store = make_store(tmp_path)
+    conversation = store.create_conversation(OWNER)
+    for number in range(10):
+        store.append_message(conversation, "user", "x" * 100)
+
+    window, first = store.recent_messages(conversation, max_bytes=350)
+    assert len(window) == 3 and first == 7
+
+    # The newest message is returned even when it alone is over budget
+    window, first = store.recent_messages(conversation, max_bytes=10)
+    assert len(window) == 1 and first == 9
+
+
+def test_search_finds_messages_across_conversations(tmp_path):
+    store = make_store(tmp_path)
+    first, second = store.create_conversation(OWNER), store.create_conversation(OWNER)
+    store.append_message(first, "user", "How do I tune the PostgreSQL autovacuum?")
+    store.append_message(second, "user", "Explain quicksort")
+    store.append_message(second, "assistant", "Quicksort partitions around a pivot")
+
+    hits = store.search(OWNER, "quicksort pivot")
+    assert [(hit["conversation_id"], hit["position"]) for hit in hits] == [(second, 1)]
+    assert store.search(OWNER, "autovacuum")[0]["title"] == "How do I tune the PostgreSQL autovacuum?"
+    # FTS syntax in user input is taken literally
+    assert store.search(OWNER, '"quicksort" OR (') == []
+
+    store.delete_conversation(second, OWNER)
+    assert store.search(OWNER, "quicksort") == []
+    assert [c["id"] for c in store.list_conversations(OWNER)] == [first]
+
+
+def test_history_and_saved_prompts_are_shared_between_stores(tmp_path):
+    writer, reader = make_store(tmp_path), make_store(tmp_path)
+    conversation = writer.create_conversation(OWNER)
+    writer.append_message(conversation, "user", "persisted")
+    writer.save_prompt("Reviewer", "You review code.")
+
+    assert reader.messages(conversation) == [{"role": "user", "content": "persisted"}]
+    assert reader.saved_prompts() == {"Reviewer": "You review code."}
+
+
+def test_conversations_are_private_to_their_owner(tmp_path):
+    store = make_store(tmp_path)
+    intruder = new_token()
+    conversation = store.create_conversation(OWNER)
+    store.append_message(conversation, "user", "My salary negotiation notes")
+
+    assert TOKEN_PATTERN.fullmatch(conversation)
+    assert store.conversation(conversation, OWNER)["title"] == "My salary negotiation notes"
+    assert store.conversation(conversation, intruder) is None
+    assert store.list_conversations(intruder) == []
+    assert store.search(intruder, "salary") == []
+
+    store.delete_conversation(conversation, intruder)
+    assert store.message_count(conversation) == 1
+    assert [c["id"] for c in store.list_conversations(OWNER)] == [conversation]
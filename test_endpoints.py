@@ -0,0 +1,146 @@
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack
+
+import pytest
+
+from client import AzureO3ProClient
+from endpoints import WEIGHTED, Endpoint, EndpointPool
+from mock_server import MockResponsesServer
+from rate_limit import ThroughputController
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def servers():
+    with ExitStack() as stack:
+        yield lambda **options: stack.enter_context(MockResponsesServer(**options))
+
+
+def make_client(*servers, **pool_options):
+    endpoints = [Endpoint(server.url, "test-key", "o3-pro", name=f"server{i}") for i, server in enumerate(servers)]
+    pool = EndpointPool(endpoints, **pool_options)
+    return AzureO3ProClient(controller=ThroughputController(base_delay=0.01), pool=pool)
+
+
+def test_fails_over_and_stops_routing_to_a_failing_endpoint(servers):
+    failing, healthy = servers(failure_rate=1.0), servers(reply_text="From the healthy one")
+    client = make_client(failing, healthy, failure_threshold=2, cooldown=60)
+
+    for _ in range(10):
+        response = client.create_chat_completion(MESSAGES)
+        assert client.extract_text(response) == "From the healthy one"
+
+    # After failing, the endpoint ranks behind the healthy one and gets no more traffic
+    assert failing.stats["requests"] <= 2
+    assert client.pool.snapshot()[0]["failures"] >= 1
+
+
+def test_fails_over_when_an_endpoint_goes_down_mid_session(servers):
+    first, second = servers(reply_text="first"), servers(reply_text="second")
+    client = make_client(first, second)
+    assert client.create_chat_completion(MESSAGES) is not None
+
+    first.stop()
+
+    for _ in range(3):
+        assert client.extract_text(client.create_chat_completion(MESSAGES)) == "second"
+
+
+def test_least_outstanding_routing_favours_the_faster_endpoint(servers):
+    slow, fast = servers(latency=0.2), servers(latency=0.01)
+    client = make_client(slow, fast)
+
+    def worker():
+        for _ in range(5):
+            client.create_chat_completion(MESSAGES)
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert fast.stats["requests"] > 2 * slow.stats["requests"]
+    assert all(endpoint["outstanding"] == 0 for endpoint in client.pool.snapshot())
+
+
+def test_half_open_circuit_closes_after_a_successful_trial(servers):
+    flaky = servers()
+    client = make_client(flaky, failure_threshold=1, cooldown=0.1)
+    flaky.script(503)
+    client.controller.max_retries = 0
+
+    assert client.create_chat_completion(MESSAGES) is None
+    assert client.pool.snapshot()[0]["state"] == "open"
+    time.sleep(0.15)
+    assert client.pool.snapshot()[0]["state"] == "half-open"
+    assert client.create_chat_completion(MESSAGES) is not None
+    assert client.pool.snapshot()[0]["state"] == "closed"
+
+
+def test_stored_responses_are_followed_up_on_their_own_endpoint(servers):
+    first, second = servers(latency=0.05), servers(latency=0.05)
+    client = make_client(first, second)
+
+    submitted = [client.create_chat_completion(MESSAGES, background=True) for _ in range(4)]
+    assert first.stats["requests"] and second.stats["requests"]
+    for response in submitted:
+        # Each server only knows its own background jobs, so a misrouted poll would 404
+        assert client.retrieve_response(response["id"])["id"] == response["id"]
+
+
+def test_weighted_routing_follows_weights():
+    heavy, light = Endpoint("http://heavy/", "k", "m", weight=3), Endpoint("http://light/", "k", "m", weight=1)
+    pool = EndpointPool([heavy, light], strategy=WEIGHTED)
+
+    picks = Counter()
+    for _ in range(2000):
+        endpoint = pool.acquire()
+        pool.release(endpoint)
+        picks[endpoint.name] += 1
+
+    assert 2.5 < picks["heavy"] / picks["light"] < 3.6
+
+
+def test_throttling_holds_an_endpoint_without_opening_its_circuit(servers):
+    throttled = servers()
+    client = make_client(throttled, failure_threshold=3)
+    client.controller.max_retries = 2
+    throttled.script(429, {"retry-after-ms": "1"}, times=3)
+
+    assert client.create_chat_completion(MESSAGES, use_cache=False) is None
+
+    assert throttled.stats["status_429"] == 3
+    state = client.pool.snapshot()[0]
+    assert state["state"] != "open"
+    assert state["failures"] == 0
+
+
+def test_a_throttled_endpoint_does_not_stall_the_others(servers):
+    throttled, healthy = servers(), servers(reply_text="From the healthy one")
+    client = make_client(throttled, healthy)
+    throttled.script(429, {"retry-after-ms": "5000"})
+
+    start = time.monotonic()
+    for _ in range(3):
+        response = client.create_chat_completion(MESSAGES, use_cache=False)
+        assert client.extract_text(response) == "From the healthy one"
+
+    assert time.monotonic() - start < 2
+    assert throttled.stats["requests"] == 1
+    assert list(client.controller.snapshot()["paused"]) == ["server0"]
+
+
+def test_endpoints_without_a_measured_latency_are_not_preferred():
+    failing, healthy = Endpoint("http://failing/", "k", "m"), Endpoint("http://healthy/", "k", "m")
+    pool = EndpointPool([failing, healthy], failure_threshold=5)
+    pool.record(failing, ok=False)
+    pool.record(healthy, ok=True, latency=2.0)
+
+    for _ in range(5):
+        endpoint = pool.acquire()
+        pool.release(endpoint)
+        assert endpoint is healthy
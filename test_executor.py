@@ -0,0 +1,147 @@
+import threading
+import time
+
+import pytest
+
+from client import AzureO3ProClient
+from compare import Variant, VariantRun, start_comparison
+from executor import (PRIORITY_BULK, PRIORITY_COMPARE, PRIORITY_INTERACTIVE, RequestExecutor, create_completion,
+                      stream_completion)
+from summarize import Summarizer
+
+LATENCY = 0.2
+MESSAGES = [{"role": "system", "content": "Be brief."}, {"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(latency=LATENCY, reply_text="one two three four five six", token_delay=0.05)
+
+
+@pytest.fixture
+def executor():
+    executor = RequestExecutor(max_concurrency=1)
+    yield executor
+    executor.shutdown()
+
+
+def test_queued_jobs_run_by_priority_then_round_robin_across_users(executor):
+    started, gate = threading.Event(), threading.Event()
+    order = []
+    executor.submit("first", lambda: started.set() or gate.wait())
+    started.wait(5)
+    # Queued while the only worker is busy
+    bulk = executor.submit("bulk", order.append, "bulk", priority=PRIORITY_BULK)
+    executor.submit("compare", order.append, "compare", priority=PRIORITY_COMPARE)
+    for name in ("a1", "a2", "a3"):
+        executor.submit("alice", order.append, name)
+    executor.submit("bob", order.append, "b1")
+    executor.submit("carol", order.append, "c1", priority=PRIORITY_INTERACTIVE)
+
+    assert executor.snapshot()["queued"] == 7
+    assert executor.snapshot()["waiting_users"] == 5
+    gate.set()
+    assert bulk.wait(5)
+
+    # One busy user does not hold back the others, and lower priorities wait for higher ones
+    assert order == ["a1", "b1", "c1", "a2", "a3", "compare", "bulk"]
+    assert executor.snapshot()["completed"] == 8
+
+
+def test_concurrency_is_capped_across_users(server):
+    executor = RequestExecutor(max_concurrency=3)
+    client = AzureO3ProClient()
+    jobs = [executor.submit(f"user-{index}", create_completion, client, MESSAGES, use_cache=False)
+            for index in range(9)]
+
+    assert all(job.wait(10) for job in jobs)
+    assert [job.status for job in jobs] == ["completed"] * 9
+    assert server.stats["max_in_flight"] == 3
+    # Later jobs waited for a free slot
+    assert max(job.queued_for for job in jobs) >= 2 * LATENCY * 0.9
+    assert all(job.text == "one two three four five six" for job in jobs)
+    executor.shutdown()
+
+
+def test_stream_publishes_text_and_can_be_cancelled_midway(server):
+    executor = RequestExecutor(max_concurrency=1)
+    client = AzureO3ProClient()
+    job = executor.submit("alice", stream_completion, client, MESSAGES, use_cache=False)
+    queued = executor.submit("bob", stream_completion, client, MESSAGES, use_cache=False)
+
+    while not job.text:
+        time.sleep(0.01)
+    assert job.first_token_at is not None
+    job.cancel()
+    # A queued job is dropped without sending anything
+    assert queued.cancel()
+    assert job.wait(5)
+
+    assert job.status == "cancelled"
+    assert job.text != "one two three four five six"
+    assert queued.status == "cancelled"
+    assert server.stats["requests"] == 1
+
+    complete = executor.submit("alice", stream_completion, client, MESSAGES, use_cache=False)
+    assert complete.result(5)["status"] == "completed"
+    assert complete.text == "one two three four five six"
+    executor.shutdown()
+
+
+@pytest.mark.parametrize("work", [create_completion, stream_completion])
+def test_failed_request_is_reported_on_the_job(server, monkeypatch, work):
+    monkeypatch.setenv("AZURE_OPENAI_MAX_RETRIES", "0")
+    server.script(400)
+    executor = RequestExecutor(max_concurrency=1)
+
+    job = executor.submit("alice", work, AzureO3ProClient(), MESSAGES, use_cache=False)
+
+    assert job.wait(5)
+    assert job.status == "failed"
+    # The service's message reaches the job, not just a generic failure
+    assert job.error.startswith("API Error 400")
+    assert job.exception().status == 400
+    assert executor.get(job.id) is job
+    executor.shutdown()
+
+
+def test_compare_and_summaries_share_the_executor(server):
+    executor = RequestExecutor(max_concurrency=2)
+    client = AzureO3ProClient()
+    runs = [VariantRun(Variant(effort, "Be brief.", effort), MESSAGES) for effort in ("low", "medium", "high")]
+
+    comparison = start_comparison(client, runs, executor.queue("alice", PRIORITY_COMPARE), stream=False)
+    job = Summarizer(client, chunk_tokens=200, max_concurrency=4).summarize(
+        "notes.txt", lambda: iter(["A line of notes.\n" * 200]), pool=executor.queue("bob", PRIORITY_BULK)
+    )
+
+    assert comparison.wait(5)
+    assert [run.status for run in runs] == ["completed"] * 3
+    assert job.status == "completed", job.error
+    assert server.stats["max_in_flight"] <= 2
+    assert executor.snapshot()["completed"] == 3 + job.requests
+    executor.shutdown()
+
+
+def test_wait_times_out_on_an_unfinished_job(executor):
+    gate = threading.Event()
+    job = executor.submit("alice", gate.wait)
+
+    assert job.wait(0.05) is False
+    gate.set()
+    assert job.wait(5)
+
+
+def test_stream_that_ends_without_completing_fails(executor):
+    class DroppedStream:
+        def create_chat_completion(self, messages, stream, **options):
+            return iter_events()
+
+    def iter_events():
+        yield {"type": "response.output_text.delta", "delta": "Half an"}
+
+    job = executor.submit("alice", stream_completion, DroppedStream(), MESSAGES)
+
+    assert job.wait(5)
+    assert job.status == "failed"
+    assert job.text == "Half an"
@@ -0,0 +1,148 @@
+import io
+import zipfile
+
+import pytest
+
+from extractors import ExtractionError, extract_text, mime_type_for
+from ingestion import TextStore
+
+XLSX_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+
+class Recorder:
+    def __init__(self):
+        self.errors = []
+        self.warnings = []
+
+    def error(self, message):
+        self.errors.append(message)
+
+    def warning(self, message):
+        self.warnings.append(message)
+
+
+class OneWayStream(io.RawIOBase):
+    """A readable stream that cannot seek, like a socket"""
+
+    def __init__(self, data):
+        self._data = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        chunk = self._data.read(len(buffer))
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+def make_xlsx(rows):
+    """A minimal workbook with one sheet, strings shared and numbers inline"""
+    strings = sorted({value for row in rows for value in row if isinstance(value, str)})
+    ns = 'xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"'
+    cells = []
+    for r, row in enumerate(rows, start=1):
+        values = "".join(
+            f'<c r="{chr(65 + c)}{r}" t="s"><v>{strings.index(value)}</v></c>' if isinstance(value, str)
+            else f'<c r="{chr(65 + c)}{r}"><v>{value}</v></c>'
+            for c, value in enumerate(row) if value is not None
+        )
+        cells.append(f'<row r="{r}">{values}</row>')
+    data = io.BytesIO()
+    with zipfile.ZipFile(data, "w") as archive:
+        archive.writestr("xl/workbook.xml", f'<workbook {ns} xmlns:r="http://schemas.openxmlformats.org/'
+                         'officeDocument/2006/relationships"><sheets><sheet name="Sales" sheetId="1" r:id="rId1"/>'
+                         '</sheets></workbook>')
+        archive.writestr("xl/_rels/workbook.xml.rels",
+                         '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+                         '<Relationship Id="rId1" Target="worksheets/sheet1.xml"/></Relationships>')
+        archive.writestr("xl/sharedStrings.xml",
+                         f'<sst {ns}>' + "".join(f"<si><t>{s}</t></si>" for s in strings) + "</sst>")
+        archive.writestr("xl/worksheets/sheet1.xml", f'<worksheet {ns}><sheetData>{"".join(cells)}</sheetData></worksheet>')
+    return data.getvalue()
+
+
+def test_ingest_stores_text_once_per_content(tmp_path):
+    store = TextStore(tmp_path)
+
+    first = store.ingest(io.BytesIO(b"hello world"), "a.txt", "text/plain")
+    second = store.ingest(io.BytesIO(b"hello world"), "copy.txt", "text/plain")
+
+    assert first.key == second.key
+    assert (first.chars, first.truncated, second.name) == (11, False, "copy.txt")
+    assert store.read(first.key) == "hello world"
+    assert store.read(first.key, 5) == "hello"
+    assert (store.snapshot()["misses"], store.snapshot()["hits"]) == (1, 1)
+
+
+def test_extraction_stops_at_character_cap(tmp_path):
+    store = TextStore(tmp_path, max_chars=1000)
+    report = Recorder()
+
+    attachment = store.ingest(io.BytesIO(b"x" * 5000), "big.txt", "text/plain", report)
+
+    assert attachment.truncated and attachment.chars == 1000
+    assert store.read(attachment.key).endswith("[Truncated: extraction stopped after 1,000 characters]")
+    assert report.warnings
+
+
+def test_failed_extraction_stores_nothing(tmp_path):
+    # The workbook lists a second sheet whose part is missing, so extraction fails after the first
+    source = zipfile.ZipFile(io.BytesIO(make_xlsx([["name", "qty"], ["bolt", 3]])))
+    broken = io.BytesIO()
+    with zipfile.ZipFile(broken, "w") as archive:
+        for name in source.namelist():
+            archive.writestr(name, source.read(name))
+        archive.writestr("xl/workbook.xml", source.read("xl/workbook.xml").replace(
+            b"</sheets>", b'<sheet name="Lost" sheetId="2" r:id="rId2"/></sheets>'))
+        archive.writestr("xl/_rels/workbook.xml.rels", source.read("xl/_rels/workbook.xml.rels").replace(
+            b"</Relationships>", b'<Relationship Id="rId2" Target="worksheets/sheet2.xml"/></Relationships>'))
+    store = TextStore(str(tmp_path))
+    report = Recorder()
+
+    assert store.ingest(broken, "sales.xlsx", XLSX_TYPE, report) is None
+    assert report.errors
+    assert not list(tmp_path.iterdir())
+    with pytest.raises(ExtractionError):
+        extract_text(broken.getvalue(), XLSX_TYPE, report)
+
+
+def test_oversized_upload_is_rejected_without_extraction(tmp_path):
+    store = TextStore(tmp_path, max_upload_bytes=100)
+    report = Recorder()
+
+    assert store.ingest(io.BytesIO(b"x" * 101), "big.txt", "text/plain", report) is None
+    assert report.errors and store.snapshot()["rejected"] == 1
+    assert not list(tmp_path.glob("*.txt"))
+
+
+def test_unseekable_stream_is_spooled(tmp_path):
+    store = TextStore(tmp_path)
+
+    attachment = store.ingest(OneWayStream("naïve café".encode("utf-8")), "notes.md", "text/markdown")
+
+    assert store.read(attachment.key) == "naïve café"
+    assert attachment.kind == "md"
+
+
+def test_store_prunes_least_recently_used_text(tmp_path):
+    store = TextStore(tmp_path, max_disk_bytes=1500)
+    old = store.ingest(io.BytesIO(b"a" * 1000), "old.txt", "text/plain")
+    new = store.ingest(io.BytesIO(b"b" * 1000), "new.txt", "text/plain")
+
+    assert store.read(old.key) is None and not store.has(old.key)
+    assert store.read(new.key) == "b" * 1000
+
+
+def test_streaming_extractors_for_new_formats():
+    html = b"<html><style>p{}</style><body><h1>Title</h1><p>One &amp; two</p><script>x()</script></body></html>"
+    assert extract_text(html, "text/html").split() == ["Title", "One", "&", "two"]
+    assert extract_text(b"name;qty\nbolt;3\n", "text/csv") == "name,qty\nbolt,3\n"
+    assert extract_text(make_xlsx([["name", "qty"], ["bolt", 3], [None, 4.5]]), XLSX_TYPE) == \
+        "## Sheet: Sales\nname,qty\nbolt,3\n,4.5\n"
+
+
+def test_suffix_decides_mime_type_before_browser_report():
+    assert mime_type_for("main.py", "application/octet-stream") == "text/x-source"
+    assert mime_type_for("README.MD", "") == "text/markdown"
+    assert mime_type_for("data.unknown", "text/plain") == "text/plain"
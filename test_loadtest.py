@@ -0,0 +1,50 @@
+import pytest
+
+from loadtest import mock_environment, percentile, run_app_load, run_client_load
+from mock_server import MockResponsesServer
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50
+    assert percentile(values, 99) == 99
+    assert percentile([], 95) == 0.0
+
+
+@pytest.mark.parametrize("mode", ["create", "stream", "background"])
+def test_client_load_reports_throughput_and_latency(mode):
+    with MockResponsesServer(latency="uniform:0.05,0.1", reply_text="a b c d", seed=1) as server:
+        with mock_environment(server.url):
+            report = run_client_load(users=4, requests_per_user=3, mode=mode, prompt_words=5)
+
+    summary = report.summary()
+    assert summary["requests"] == 12
+    assert summary["errors"] == 0
+    # Four users at once finish well inside the time the same requests take one by one
+    assert report.duration < sum(sample.latency for sample in report.samples) / 2
+    assert summary["throughput_rps"] > 0
+    assert 0.05 <= summary["latency_p50_s"] <= summary["latency_p95_s"] <= summary["latency_p99_s"]
+    if mode == "stream":
+        assert 0 < summary["ttft_p50_s"] <= summary["latency_p99_s"]
+
+
+def test_client_load_counts_errors(monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_MAX_RETRIES", "0")
+    with MockResponsesServer(error_rates={503: 1.0}) as server:
+        with mock_environment(server.url):
+            report = run_client_load(users=2, requests_per_user=2)
+
+    assert report.summary()["error_rate"] == 1.0
+    assert all(sample.error for sample in report.samples)
+
+
+def test_app_load_measures_turns_and_session_memory():
+    with MockResponsesServer(reply_text="Hello from the mock") as server:
+        with mock_environment(server.url):
+            report = run_app_load(users=2, turns=3, prompt_words=5)
+
+    summary = report.summary()
+    assert summary["requests"] == 6
+    assert summary["errors"] == 0, [sample.error for sample in report.samples]
+    assert server.stats["requests"] == 6
+    assert summary["memory_per_session_kb"]["python_heap"] > 0
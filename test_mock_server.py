@@ -0,0 +1,61 @@
+import random
+
+import pytest
+import requests
+
+from mock_server import Latency, MockResponsesServer
+
+PAYLOAD = {"model": "o3-pro", "input": "User: Hello!"}
+
+
+def post(server, **payload):
+    return requests.post(f"{server.url}openai/responses", json={**PAYLOAD, **payload}, timeout=5)
+
+
+def test_latency_specs():
+    assert Latency.parse(0.5).sample(random.Random()) == 0.5
+    assert Latency.parse("0.25").sample(random.Random()) == 0.25
+    uniform = [Latency.parse("uniform:0.1,0.2").sample(random.Random(seed)) for seed in range(50)]
+    assert all(0.1 <= value <= 0.2 for value in uniform)
+
+    samples = sorted(Latency.parse("lognormal:1,4").sample(random.Random(seed)) for seed in range(2000))
+    assert samples[1000] == pytest.approx(1, rel=0.15)
+    assert samples[1900] == pytest.approx(4, rel=0.25)
+    with pytest.raises(ValueError):
+        Latency.parse("pareto:1,2")
+
+
+def test_seeded_latencies_repeat():
+    spec = Latency.parse("lognormal:0.5,2")
+    first, second = random.Random(7), random.Random(7)
+    assert [spec.sample(first) for _ in range(5)] == [spec.sample(second) for _ in range(5)]
+
+
+def test_injected_errors_follow_rates_and_seed():
+    def statuses(seed):
+        with MockResponsesServer(error_rates={429: 0.2, 500: 0.1}, retry_after=2, seed=seed) as server:
+            responses = [post(server) for _ in range(100)]
+        throttled = next(response for response in responses if response.status_code == 429)
+        assert throttled.headers["Retry-After"] == "2"
+        return [response.status_code for response in responses]
+
+    codes = statuses(3)
+    assert codes == statuses(3)
+    assert 10 <= codes.count(429) <= 30
+    assert 3 <= codes.count(500) <= 20
+    assert codes.count(200) == 100 - codes.count(429) - codes.count(500)
+
+
+def test_failure_rate_still_means_503():
+    with MockResponsesServer(failure_rate=1.0) as server:
+        assert post(server).status_code == 503
+        assert server.stats["status_503"] == 1
+
+
+def test_stream_failure_ends_with_response_failed():
+    with MockResponsesServer(reply_text="one two three four", stream_failure_rate=1.0) as server:
+        body = post(server, stream=True).text
+
+    assert "event: response.failed" in body
+    assert "response.completed" not in body
+    assert server.stats["stream_failures"] == 1
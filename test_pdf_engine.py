@@ -0,0 +1,90 @@
+import io
+import time
+
+import pytest
+
+from pdf_engine import PdfPageStream
+
+
+def make_pdf(pages: int) -> bytes:
+    """A PDF whose page N reads 'Page N'"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None,
+               b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    page_refs = []
+    for page in range(1, pages + 1):
+        stream = f"BT /F1 12 Tf 50 780 Td (Page {page}) Tj ET".encode("ascii")
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] "
+                       b"/Resources << /Font << /F1 3 0 R >> >> /Contents %d 0 R >>" % len(objects))
+        page_refs.append(len(objects))
+    kids = " ".join(f"{ref} 0 R" for ref in page_refs).encode("ascii")
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, pages)
+
+    out = io.BytesIO()
+    out.write(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, start=1):
+        offsets.append(out.tell())
+        out.write(b"%d 0 obj\n%s\nendobj\n" % (number, body))
+    xref = out.tell()
+    out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1))
+    for offset in offsets:
+        out.write(b"%010d 00000 n \n" % offset)
+    out.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref))
+    return out.getvalue()
+
+
+PDF = make_pdf(24)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_pages_come_back_in_order(workers):
+    stream = PdfPageStream(PDF, workers=workers, parallel_threshold=4, time_budget=None)
+
+    pages = list(stream)
+
+    assert [number for number, _ in pages] == list(range(1, 25))
+    assert all(text.strip() == f"Page {number}" for number, text in pages)
+    assert (stream.pages_read, stream.total_pages, stream.truncated) == (24, 24, False)
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_max_pages_truncates(workers):
+    stream = PdfPageStream(PDF, max_pages=10, workers=workers, parallel_threshold=4, time_budget=None)
+
+    assert [number for number, _ in stream] == list(range(1, 11))
+    assert (stream.pages_read, stream.total_pages, stream.truncated) == (10, 24, True)
+
+
+def test_time_budget_truncates_serial_reads(monkeypatch):
+    stream = PdfPageStream(PDF, workers=1, time_budget=0.05)
+    original = PdfPageStream._iter_serial
+
+    def slow_pages(self):
+        for page in original(self):
+            time.sleep(0.02)
+            yield page
+
+    monkeypatch.setattr(PdfPageStream, "_iter_serial", slow_pages)
+    pages = list(stream)
+
+    assert stream.truncated
+    assert 0 < stream.pages_read == len(pages) < stream.total_pages
+
+
+def test_time_budget_truncates_parallel_reads():
+    stream = PdfPageStream(PDF, workers=2, parallel_threshold=4, time_budget=1e-6)
+
+    pages = list(stream)
+
+    assert stream.truncated
+    assert stream.pages_read == len(pages) < stream.total_pages
+
+
+def test_a_stream_can_be_read_again():
+    stream = PdfPageStream(PDF, max_pages=5, workers=1)
+
+    first, second = list(stream), list(stream)
+
+    assert first == second
+    assert stream.pages_read == 5
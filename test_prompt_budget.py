@@ -0,0 +1,67 @@
+from prompt_budget import TokenCounter, assemble_messages
+
+
+def history(turns, words=100):
+    messages = []
+    for turn in range(turns):
+        messages.append({"role": "user", "content": f"question {turn} " + "word " * words})
+        messages.append({"role": "assistant", "content": f"answer {turn} " + "word " * words})
+    return messages
+
+
+def test_everything_fits_within_a_large_budget():
+    counter = TokenCounter()
+    turns = history(3) + [{"role": "user", "content": "latest"}]
+
+    assembly = assemble_messages("Be helpful.", {"a.txt": "file text"}, turns, 100_000, counter)
+
+    assert not assembly.trimmed
+    assert assembly.messages[1:] == turns
+    assert "--- a.txt ---\nfile text" in assembly.messages[0]["content"]
+
+
+def test_oldest_turns_are_dropped_and_summarized():
+    counter = TokenCounter()
+    turns = history(20) + [{"role": "user", "content": "latest question"}]
+
+    assembly = assemble_messages("Be helpful.", {}, turns, 1500, counter)
+
+    assert assembly.dropped_messages > 0
+    assert assembly.messages[-1] == {"role": "user", "content": "latest question"}
+    assert assembly.messages[0]["content"] == "Be helpful."
+    assert "messages omitted" in assembly.messages[1]["content"]
+    assert assembly.messages[2:-1] == turns[assembly.dropped_messages:-1]
+    assert assembly.input_tokens <= 1500
+
+
+def test_attachments_are_truncated_to_fit():
+    counter = TokenCounter()
+    attachments = {"big.txt": "lorem ipsum " * 20_000}
+
+    assembly = assemble_messages("Be helpful.", attachments, [{"role": "user", "content": "hi"}], 2000, counter)
+
+    assert assembly.truncated_files == ["big.txt"]
+    assert "[Truncated:" in assembly.messages[0]["content"]
+    assert counter.count(assembly.messages[0]["content"]) <= 2000
+
+
+def test_count_only_matches_full_assembly():
+    counter = TokenCounter()
+    turns = history(10) + [{"role": "user", "content": "latest"}]
+
+    full = assemble_messages("Be helpful.", {"f.txt": "x " * 5000}, turns, 3000, counter)
+    estimate = assemble_messages("Be helpful.", {"f.txt": "x " * 5000}, turns, 3000, counter, count_only=True)
+
+    assert estimate.messages == []
+    assert estimate.input_tokens == full.input_tokens
+
+
+def test_memo_is_keyed_by_content_and_bounded():
+    counter = TokenCounter(max_entries=2)
+    # Same length, different tokens: each must keep its own count
+    texts = ["a " * 10, "b" * 20]
+
+    for text in texts * 2:
+        assert counter.count(text) == TokenCounter().count(text)
+    counter.count("a third text")
+    assert len(counter._counts) == 2
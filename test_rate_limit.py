@@ -0,0 +1,105 @@
+import threading
+import time
+
+import pytest
+
+from client import AzureO3ProClient
+from rate_limit import ThroughputController, parse_retry_after
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(reply_text="Through at last")
+
+
+def test_retries_scripted_429s_honouring_retry_after(server):
+    server.script(429, {"Retry-After": "0.2"}, times=2)
+    controller = ThroughputController(base_delay=0.01)
+    client = AzureO3ProClient(controller=controller)
+
+    start = time.monotonic()
+    response = client.create_chat_completion(MESSAGES)
+
+    assert client.extract_text(response) == "Through at last"
+    assert time.monotonic() - start >= 0.4
+    assert server.stats["requests"] == 3
+    stats = controller.snapshot()
+    assert stats["retries"] == 2 and stats["throttled"] == 2 and stats["gave_up"] == 0
+
+
+def test_gives_up_after_max_retries(server):
+    server.script(503, times=5)
+    controller = ThroughputController(max_retries=2, base_delay=0.01)
+    client = AzureO3ProClient(controller=controller)
+
+    assert client.create_chat_completion(MESSAGES) is None
+    assert server.stats["requests"] == 3
+    assert controller.snapshot()["gave_up"] == 1
+
+
+def test_429_backs_off_every_client_sharing_the_controller(server):
+    server.script(429, {"retry-after-ms": "300"})
+    controller = ThroughputController(base_delay=0.01)
+    throttled, other = AzureO3ProClient(controller=controller), AzureO3ProClient(controller=controller)
+
+    first = threading.Thread(target=throttled.create_chat_completion, args=(MESSAGES,))
+    first.start()
+    time.sleep(0.1)
+    start = time.monotonic()
+    assert other.create_chat_completion(MESSAGES) is not None
+    first.join()
+
+    assert time.monotonic() - start >= 0.15
+
+
+def test_token_bucket_spaces_requests_and_reports_queueing():
+    # 20 requests per second with a burst of 2
+    controller = ThroughputController(rpm=1200, burst_seconds=0.1)
+    start = time.monotonic()
+    threads = [threading.Thread(target=controller.admit) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert time.monotonic() - start >= 0.15
+    stats = controller.snapshot()
+    assert stats["admitted"] == 6 and stats["queue_depth"] == 0
+    assert stats["max_queue_depth"] >= 2 and stats["max_wait"] >= 0.15
+
+
+def test_admission_charges_the_whole_prompt_of_a_chained_turn(server):
+    # 1,000 tokens per second with a burst of 100
+    controller = ThroughputController(tpm=60_000, burst_seconds=0.1)
+    client = AzureO3ProClient(controller=controller)
+
+    for _ in range(2):
+        assert client.create_chat_completion(MESSAGES, use_cache=False, input_tokens=100) is not None
+
+    assert controller.snapshot()["max_wait"] >= 0.08
+
+
+def test_remaining_quota_headers_pause_admission():
+    controller = ThroughputController(rpm=600)
+    controller.observe({"x-ratelimit-remaining-requests": "0", "x-ratelimit-reset-requests": "200ms"})
+
+    assert controller.admit() >= 0.15
+
+
+def test_quotas_and_pauses_are_per_endpoint():
+    controller = ThroughputController(rpm=60, burst_seconds=1)
+    controller.admit(endpoint="east")
+    controller.pause(5, "east")
+
+    assert controller.admit(endpoint="west") < 0.05
+    assert list(controller.snapshot()["paused"]) == ["east"]
+
+
+def test_parse_retry_after_formats():
+    assert parse_retry_after({"retry-after-ms": "1500"}) == 1.5
+    assert parse_retry_after({"retry-after": "3"}) == 3.0
+    assert 50 < parse_retry_after({"retry-after": time.strftime(
+        "%a, %d %b %Y %H:%M:%S GMT", time.gmtime(time.time() + 60))}) <= 60
+    assert parse_retry_after({}) is None
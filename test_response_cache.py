@@ -0,0 +1,85 @@
+import threading
+import time
+
+from client import AzureO3ProClient
+from mock_server import MockResponsesServer
+from response_cache import ResponseCache
+
+BODY = {"id": "resp_1", "status": "completed",
+        "output": [{"type": "message", "content": [{"type": "output_text", "text": "cached answer"}]}]}
+
+
+def test_key_is_canonical_and_specific():
+    key = ResponseCache.key("o3-pro", "2025-04-01-preview", "User: hi")
+    assert key == ResponseCache.key("o3-pro", "2025-04-01-preview", "User: hi")
+    assert key != ResponseCache.key("o3-pro", "2025-05-01-preview", "User: hi")
+    assert key != ResponseCache.key("o3-pro", "2025-04-01-preview", "User: hi!")
+
+
+def test_entries_expire_after_ttl(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), ttl=0.05)
+    cache.put("k", BODY)
+    assert cache.get("k") == BODY
+    time.sleep(0.1)
+    assert cache.get("k") is None
+
+
+def test_size_budget_evicts_least_recently_used(tmp_path):
+    cache = ResponseCache(str(tmp_path / "cache.sqlite3"), max_bytes=600)
+    cache.put("a", {"text": "a" * 200})
+    time.sleep(0.01)
+    cache.put("b", {"text": "b" * 200})
+    time.sleep(0.01)
+    cache.get("a")
+    cache.put("c", {"text": "c" * 200})
+
+    assert cache.get("b") is None
+    assert cache.get("a") is not None
+    assert cache.snapshot()["evictions"] == 1
+
+
+def test_cache_is_shared_across_threads_and_instances(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    writers = [threading.Thread(target=lambda i=i: ResponseCache(path).put(f"k{i}", BODY)) for i in range(8)]
+    for writer in writers:
+        writer.start()
+    for writer in writers:
+        writer.join()
+
+    assert ResponseCache(path).snapshot()["entries"] == 8
+
+
+def test_client_answers_repeated_prompt_from_cache(tmp_path, monkeypatch):
+    with MockResponsesServer(reply_text="fresh answer") as server:
+        monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", server.url)
+        monkeypatch.setenv("AZURE_OPENAI_MODEL", "o3-pro")
+        client = AzureO3ProClient(ResponseCache(str(tmp_path / "cache.sqlite3")))
+        messages = [{"role": "user", "content": "same question"}]
+
+        first = client.create_chat_completion(messages)
+        events = list(client.create_chat_completion(messages, stream=True))
+        bypassed = client.create_chat_completion(messages, use_cache=False)
+
+        assert server.stats["requests"] == 2
+        assert client.extract_text(first) == "fresh answer"
+        assert events[0] == {"type": "response.output_text.delta", "delta": "fresh answer"}
+        assert events[-1]["response"]["id"] == first["id"]
+        assert bypassed["id"] != first["id"]
+
+
+def test_cache_hits_are_marked_so_they_are_not_chained(tmp_path, monkeypatch):
+    with MockResponsesServer(reply_text="fresh answer") as server:
+        monkeypatch.setenv("AZURE_OPENAI_ENDPOINT", server.url)
+        monkeypatch.setenv("AZURE_OPENAI_MODEL", "o3-pro")
+        client = AzureO3ProClient(ResponseCache(str(tmp_path / "cache.sqlite3")))
+        messages = [{"role": "user", "content": "same question"}]
+
+        live = client.create_chat_completion(messages)
+        cached = client.create_chat_completion(messages)
+        replayed = list(client.create_chat_completion(messages, stream=True))[-1]["response"]
+
+        assert "cache_hit" not in live
+        assert cached["cache_hit"] and replayed["cache_hit"]
+        # The marker is not written back into the cache
+        assert "cache_hit" not in client.response_cache.get(client.response_cache.key(
+            client.model, client.api_version, client._build_input(messages)))
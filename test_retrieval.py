@@ -0,0 +1,107 @@
+import io
+
+from ingestion import TextStore
+from retrieval import BM25Index, DocumentIndex, chunk_stream, chunk_text, format_passages, select_passages
+
+
+def test_chunk_text_overlaps_windows():
+    text = " ".join(f"w{i}" for i in range(10))
+    chunks = chunk_text(text, chunk_words=4, overlap=1)
+
+    assert chunks == ["w0 w1 w2 w3", "w3 w4 w5 w6", "w6 w7 w8 w9"]
+
+
+def test_search_ranks_matching_document_first():
+    index = BM25Index(chunk_words=20, overlap=0)
+    index.add_document("cats.txt", "Cats purr and chase mice around the barn. " * 3)
+    index.add_document("rockets.txt", "Rocket engines burn liquid oxygen and kerosene. " * 3)
+
+    passages = index.search("how does a rocket engine burn oxygen", top_k=1)
+
+    assert [p.source for p in passages] == ["rockets.txt"]
+
+
+def test_sync_replaces_changed_and_removes_missing_documents():
+    index = BM25Index(chunk_words=20, overlap=0)
+    index.sync({"a.txt": "alpha beta", "b.txt": "gamma delta"})
+    index.sync({"a.txt": "epsilon zeta"})
+
+    assert set(index.documents) == {"a.txt"}
+    assert index.search("alpha") == []
+    assert index.search("gamma") == []
+    assert index.search("epsilon")[0].source == "a.txt"
+
+
+def test_chunk_stream_matches_chunk_text_across_piece_boundaries():
+    text = " ".join(f"word{i}" for i in range(537))
+    pieces = [text[i:i + 97] for i in range(0, len(text), 97)]
+
+    assert list(chunk_stream(pieces, 50, 10)) == chunk_text(text, 50, 10)
+
+
+def test_sync_keys_loads_only_new_or_changed_documents():
+    texts = {"k1": "alpha beta", "k2": "gamma delta", "k3": "epsilon zeta"}
+    loaded = []
+
+    def index_for(key):
+        loaded.append(key)
+        return DocumentIndex.from_text(texts[key], chunk_words=20, overlap=0)
+
+    index = BM25Index(chunk_words=20, overlap=0)
+    index.sync_keys({"a.txt": "k1", "b.txt": "k2"}, index_for)
+    index.sync_keys({"a.txt": "k1", "b.txt": "k3"}, index_for)
+
+    assert loaded == ["k1", "k2", "k3"]
+    assert index.search("gamma") == []
+    assert index.search("epsilon")[0].source == "b.txt"
+
+
+def test_passages_are_read_back_from_the_text_store(tmp_path):
+    store = TextStore(str(tmp_path))
+    text = "Café naïve\r\nrésumé " * 300 + "needle in the haystack " + "filler words " * 300
+    key = store.ingest(io.BytesIO(text.encode("utf-8")), "doc.txt", "text/plain").key
+    document = DocumentIndex(store.iter_chunks(key, 1000), lambda start, end: store.read_span(key, start, end),
+                             chunk_words=50, overlap=10)
+    index = BM25Index()
+    index.sync_keys({"doc.txt": key}, lambda _: document)
+
+    passages = select_passages(index, "needle haystack", token_budget=100_000)
+
+    assert passages[0].text in text and "needle in the haystack" in passages[0].text
+    assert sorted(p.text for p in index.search("résumé", top_k=None)) == \
+        sorted(chunk for chunk in chunk_text(text, 50, 10) if "résumé" in chunk)
+
+
+def test_select_passages_respects_token_budget():
+    index = BM25Index(chunk_words=50, overlap=0)
+    index.add_document("doc.txt", " ".join(["budget"] * 500))
+
+    passages = select_passages(index, "budget", token_budget=100, top_k=10)
+
+    assert passages
+    assert sum(p.tokens for p in passages) <= 100
+    assert format_passages(passages).startswith("Relevant passages from attached files:")
+
+
+def test_select_passages_fills_the_budget_by_score_beyond_top_k():
+    index = BM25Index(chunk_words=20, overlap=0)
+    index.add_document("doc.txt", " ".join(f"budget filler{i}" for i in range(500)))
+
+    passages = select_passages(index, "budget", token_budget=100_000)
+
+    # Every matching chunk fits, not just the default top 8
+    assert len(passages) == len(index)
+    assert all(p.score > 0 for p in passages)
+
+
+def test_unmatched_question_falls_back_to_the_opening_of_each_file():
+    index = BM25Index(chunk_words=20, overlap=0)
+    index.add_document("a.txt", " ".join(f"alpha{i}" for i in range(200)))
+    index.add_document("b.txt", " ".join(f"beta{i}" for i in range(200)))
+
+    passages = select_passages(index, "summarize this", token_budget=200)
+
+    assert {p.source for p in passages} == {"a.txt", "b.txt"}
+    assert all(p.score == 0 for p in passages)
+    assert passages[0].text.startswith("alpha0 ")
+    assert sum(p.tokens for p in passages) <= 200
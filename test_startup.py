@@ -0,0 +1,28 @@
+import io
+import subprocess
+import sys
+from pathlib import Path
+
+import docx
+
+from extractors import extract_text
+
+ROOT = Path(__file__).resolve().parent
+DOCX_TYPE = "application/vnd.openxmlformats-officedocument.wordprocessingml.document"
+
+
+def test_importing_the_app_leaves_parsers_unloaded():
+    check = ("import sys, app; "
+             "print(sorted(m for m in ('openai', 'PyPDF2', 'docx', 'pdf_engine') if m in sys.modules))")
+    result = subprocess.run([sys.executable, "-c", check], cwd=ROOT, capture_output=True, text=True, check=True)
+
+    assert result.stdout.strip().splitlines()[-1] == "[]"
+
+
+def test_docx_parser_is_loaded_on_first_docx():
+    document = docx.Document()
+    document.add_paragraph("Quarterly report")
+    data = io.BytesIO()
+    document.save(data)
+
+    assert extract_text(data.getvalue(), DOCX_TYPE) == "Quarterly report\n"
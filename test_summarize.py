@@ -0,0 +1,116 @@
+import time
+
+import pytest
+
+from client import AzureO3ProClient
+from pricing import Pricing
+from prompt_budget import TokenCounter
+from response_cache import ResponseCache
+from summarize import ESTIMATED_OUTPUT_TOKENS, SummaryEstimate, Summarizer, chunk_by_tokens
+
+LATENCY = 0.2
+DOCUMENT = "".join(f"Paragraph {number}: the quarterly figure was {number * 7} units.\n" for number in range(400))
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(latency=LATENCY, reply_text="Condensed notes")
+
+
+def pieces(text, size=1000):
+    return (text[start:start + size] for start in range(0, len(text), size))
+
+
+def test_chunks_respect_token_limit_and_keep_all_text():
+    counter = TokenCounter()
+    chunks = list(chunk_by_tokens(pieces(DOCUMENT), 500, counter))
+
+    assert len(chunks) > 1
+    assert "".join(chunks) == DOCUMENT
+    # Lines are counted one by one, so estimated counts of a whole chunk drift slightly
+    assert all(counter.count(chunk) <= 500 * 1.05 for chunk in chunks)
+    # Breaks fall between lines
+    assert all(chunk.endswith("\n") for chunk in chunks)
+
+
+def test_long_lines_are_split():
+    counter = TokenCounter()
+    line = "word " * 5000
+    chunks = list(chunk_by_tokens([line], 300, counter))
+
+    assert "".join(chunks) == line
+    assert len(chunks) > 1
+
+
+def test_map_reduce_runs_in_parallel_and_reuses_cached_steps(server, tmp_path):
+    cache = ResponseCache(str(tmp_path / "summaries.sqlite3"))
+    summarizer = Summarizer(AzureO3ProClient(), cache, chunk_tokens=800, reduce_tokens=10, max_concurrency=8)
+
+    start = time.perf_counter()
+    job = summarizer.summarize("report.txt", lambda: pieces(DOCUMENT))
+    elapsed = time.perf_counter() - start
+
+    assert job.status == "completed", job.error
+    assert job.summary == "Condensed notes"
+    assert job.chunks >= 5
+    assert job.mapped == job.chunks
+    # A tiny reduce budget forces pairwise merging over several rounds
+    assert job.reduce_round >= 2
+    assert job.requests == server.stats["requests"]
+    # The map requests overlap instead of running one after another
+    assert elapsed < (job.chunks + job.reduce_round) * LATENCY
+
+    # Asking about the same document again is answered entirely from the cache
+    again = summarizer.summarize("copy of report.txt", lambda: pieces(DOCUMENT))
+    assert again.summary == "Condensed notes"
+    assert again.requests == 0
+    assert again.cached == job.requests + job.cached
+    summarizer.shutdown()
+
+
+def test_a_running_job_is_reused_for_the_same_key(server):
+    summarizer = Summarizer(AzureO3ProClient(), chunk_tokens=800, max_concurrency=8)
+
+    first = summarizer.start("report.txt", lambda: pieces(DOCUMENT), key="k1")
+    # A rerun of the page asks again while the first job is still running
+    second = summarizer.start("report.txt", lambda: pieces(DOCUMENT), key="k1")
+    first.wait()
+
+    assert second is first
+    assert first.status == "completed", first.error
+    assert server.stats["requests"] == first.requests
+    summarizer.shutdown()
+
+
+def test_failed_chunk_fails_the_job(server, monkeypatch):
+    monkeypatch.setenv("AZURE_OPENAI_MAX_RETRIES", "0")
+    server.script(400, times=1)
+    summarizer = Summarizer(AzureO3ProClient(), chunk_tokens=800, max_concurrency=1)
+
+    job = summarizer.summarize("report.txt", lambda: pieces(DOCUMENT))
+
+    assert job.status == "failed"
+    assert job.summary is None
+    summarizer.shutdown()
+
+
+def test_empty_document_fails(server):
+    job = Summarizer(AzureO3ProClient()).summarize("empty.txt", lambda: iter(()))
+
+    assert job.status == "failed"
+    assert server.stats["requests"] == 0
+
+
+def test_estimate_counts_map_and_reduce_requests():
+    summarizer = Summarizer(None, chunk_tokens=1000, reduce_tokens=8000)
+
+    estimate = summarizer.estimate(10_000)
+
+    # 10 map requests, then reduce rounds of 5, 2 and 1 groups
+    assert (estimate.chunks, estimate.requests) == (10, 18)
+    assert estimate.input_tokens == 10_000 + (10 + 5 + 2) * ESTIMATED_OUTPUT_TOKENS
+    assert estimate.output_tokens == 18 * ESTIMATED_OUTPUT_TOKENS
+    assert estimate.cost(Pricing(input=1.0, output=2.0)) == pytest.approx(
+        (estimate.input_tokens + 2 * estimate.output_tokens) / 1_000_000)
+    assert summarizer.estimate(500) == SummaryEstimate(1, 1, 500, ESTIMATED_OUTPUT_TOKENS)
+    summarizer.shutdown()
@@ -0,0 +1,73 @@
+import urllib.request
+
+import pytest
+
+import telemetry
+from client import AzureO3ProClient
+from extractors import extract_text
+from telemetry import Telemetry, metrics_server_from_env
+
+MESSAGES = [{"role": "user", "content": "Hello"}]
+
+
+@pytest.fixture
+def metrics(monkeypatch):
+    registry = Telemetry()
+    monkeypatch.setattr(telemetry, "_telemetry", registry)
+    return registry
+
+
+@pytest.fixture
+def server(mock_server):
+    return mock_server(latency=0.05, reply_text="three word answer", token_delay=0.01)
+
+
+def series(registry, metric):
+    return {row["metric"]: row for row in registry.summary() if row["metric"].startswith(metric)}
+
+
+def test_requests_record_latency_phases_and_tokens(metrics, server):
+    client = AzureO3ProClient()
+
+    client.create_chat_completion(MESSAGES)
+    list(client.create_chat_completion(MESSAGES, stream=True))
+
+    durations = series(metrics, "request_duration_seconds")
+    assert durations['request_duration_seconds{operation="create",outcome="ok"}']["p50"] >= 0.05
+    assert durations['request_duration_seconds{operation="stream",outcome="ok"}']["count"] == 1
+    assert series(metrics, "request_ttfb_seconds")['request_ttfb_seconds{operation="create"}']["p50"] >= 0.05
+    assert series(metrics, "request_ttft_seconds")['request_ttft_seconds{operation="stream"}']["count"] == 1
+    # A fresh mock server means a fresh connection
+    assert series(metrics, "connect_seconds")["connect_seconds"]["count"] >= 1
+    assert metrics.totals("o3pro_tokens_total")["output"] == 6
+    assert sum(metrics.totals("o3pro_request_attempts_total").values()) == 2
+
+
+def test_extraction_time_is_recorded_per_file_kind(metrics):
+    extract_text(b"plain text", "text/plain")
+
+    assert series(metrics, "extraction_seconds")['extraction_seconds{kind="txt"}']["count"] == 1
+    assert metrics.totals("o3pro_extraction_bytes_total") == {"txt": 10}
+
+
+def test_prometheus_endpoint_serves_cumulative_histograms(metrics, monkeypatch):
+    for value in (0.02, 0.2, 2.0):
+        metrics.observe("o3pro_request_duration_seconds", value, operation="create", outcome="ok")
+    metrics.increment("o3pro_tokens_total", 42, kind="input")
+
+    monkeypatch.setenv("O3PRO_METRICS_PORT", "0")
+    monkeypatch.delenv("O3PRO_METRICS_HOST", raising=False)
+    server = metrics_server_from_env()
+    # Only local scrapers unless a host is configured
+    assert server.server_address[0] == "127.0.0.1"
+    try:
+        with urllib.request.urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+            text = response.read().decode()
+    finally:
+        server.shutdown()
+
+    assert "# TYPE o3pro_request_duration_seconds histogram" in text
+    assert 'o3pro_request_duration_seconds_bucket{operation="create",outcome="ok",le="0.25"} 2' in text
+    assert 'o3pro_request_duration_seconds_bucket{operation="create",outcome="ok",le="+Inf"} 3' in text
+    assert 'o3pro_request_duration_seconds_count{operation="create",outcome="ok"} 3' in text
+    assert 'o3pro_tokens_total{kind="input"} 42' in text
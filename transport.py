@@ -0,0 +1,113 @@
+"""Shared HTTP transport for Azure OpenAI requests"""
+import os
+import threading
+import time
+from typing import Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection, HTTPSConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+from telemetry import get_telemetry
+
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONNECT_TIMEOUT = 10.0
+DEFAULT_READ_TIMEOUT = 60.0
+
+_session: Optional[requests.Session] = None
+_session_lock = threading.Lock()
+
+
+def env_number(name: str, default, cast=float):
+    """Read a numeric setting from the environment, falling back to the default"""
+    value = os.getenv(name)
+    if not value:
+        return default
+    try:
+        return cast(value)
+    except ValueError:
+        return default
+
+
+def get_pool_size() -> int:
+    """Maximum number of keep-alive connections kept per host"""
+    return max(1, env_number("AZURE_OPENAI_POOL_SIZE", DEFAULT_POOL_SIZE, int))
+
+
+def get_timeouts() -> Tuple[float, float]:
+    """(connect, read) timeouts used for every request"""
+    return (
+        env_number("AZURE_OPENAI_CONNECT_TIMEOUT", DEFAULT_CONNECT_TIMEOUT),
+        env_number("AZURE_OPENAI_READ_TIMEOUT", DEFAULT_READ_TIMEOUT),
+    )
+
+
+class _ConnectTiming:
+    """Records DNS resolution plus TCP connect time of each new connection"""
+
+    def _new_conn(self):
+        start = time.perf_counter()
+        sock = super()._new_conn()
+        self._connect_seconds = time.perf_counter() - start
+        get_telemetry().record_phase("connect", self._connect_seconds)
+        return sock
+
+
+class _TimedHTTPConnection(_ConnectTiming, HTTPConnection):
+    pass
+
+
+class _TimedHTTPSConnection(_ConnectTiming, HTTPSConnection):
+    """Also records the TLS handshake, separately from connect time"""
+
+    def connect(self):
+        start = time.perf_counter()
+        self._connect_seconds = 0.0
+        super().connect()
+        get_telemetry().record_phase("tls", time.perf_counter() - start - self._connect_seconds)
+
+
+class _TimedHTTPConnectionPool(HTTPConnectionPool):
+    ConnectionCls = _TimedHTTPConnection
+
+
+class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+    ConnectionCls = _TimedHTTPSConnection
+
+
+class TimedHTTPAdapter(HTTPAdapter):
+    """HTTPAdapter whose new connections report their setup time to telemetry"""
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = {"http": _TimedHTTPConnectionPool, "https": _TimedHTTPSConnectionPool}
+
+
+def _build_session() -> requests.Session:
+    """Create a session with a bounded keep-alive connection pool"""
+    session = requests.Session()
+    pool_size = get_pool_size()
+    adapter = TimedHTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+def get_session() -> requests.Session:
+    """Return the process-wide session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = _build_session()
+    return _session
+
+
+def close_session():
+    """Close the process-wide session and drop its pooled connections"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+            _session = None